@@ -1,6 +1,8 @@
 #!/usr/bin python
 
 from datetime import datetime
+from functools import wraps
+import json
 import logging
 import time
 
@@ -11,19 +13,31 @@ from dash.dependencies import (
     Output,
 )   
 import dash_html_components as html
+import flask
 import pandas as pd
 import plotly.express as px
 import numpy as np
 
-from parameters.simulation_parameters import DASHBOARD_REFRESH_INTERVAL
+from db.events import EventListener
+from db.metrics import (
+    read_metrics,
+    registry,
+    render,
+)
+from parameters.simulation_parameters import (
+    DASHBOARD_REFRESH_INTERVAL,
+    STATUS_MAX_POINTS,
+)
+from resident import lod_times
 from sql import (
-    all_timestamps,
-    recent_order_times,
-    max_timestamp,
-    orders_by_status,
-    spend_by_day_and_service,
-    spend_by_time_of_day,
-    total_spend,
+    ALL_KITCHENS,
+    cache_info,
+    combine_snapshots,
+    fetch_snapshot,
+    fleet_version,
+    kitchen_databases,
+    kitchens,
+    query_cache,
 )
 
 app = dash.Dash(__name__)
@@ -33,12 +47,50 @@ server = app.server
 log = logging.getLogger('werkzeug')
 log.setLevel(logging.ERROR)
 
+# order events pushed by the simulator; started when the server runs
+event_listener = EventListener()
+# seconds between keepalive comments on an idle event stream
+EVENTS_KEEPALIVE = 15
+
+# spans of history the order status graph can show, in seconds
+# 0 shows the whole run
+TIME_WINDOWS = [
+    ('Whole run', 0),
+    ('Last hour', 60*60),
+    ('Last 6 hours', 6*60*60),
+    ('Last day', 24*60*60),
+    ('Last week', 7*24*60*60),
+]
+
+registry.labels['process'] = 'dash'
+callback_seconds = registry.histogram(
+    'dash_callback_seconds', 'Seconds to run each dashboard callback', ['callback'])
+for counter in ['hits', 'misses']:
+    registry.gauge(
+        f'dash_query_cache_{counter}', f'Query cache {counter} since the server started'
+    ).track(lambda counter=counter: cache_info()[counter])
+
 ##########################
 ##      APP LAYOUT      ##
 ##########################
 app_layout = [
     html.H4('Simulation Live Dashboard'),
     html.H6(id='sim-time', style={'color': '#00FFFF'}),
+    # only shown while a fleet of kitchens is running
+    html.Div(
+        dcc.Dropdown(id='kitchen', value=ALL_KITCHENS, clearable=False),
+        id='kitchen-picker',
+        style={'display': 'none'},
+    ),
+    html.Div(
+        dcc.Dropdown(
+            id='time-window',
+            options=[{'label': label, 'value': seconds} for label, seconds in TIME_WINDOWS],
+            value=0,
+            clearable=False,
+        ),
+        style={'width': '20vw', 'color': 'black'},
+    ),
     html.Div(
         [
             dcc.Graph(
@@ -69,6 +121,11 @@ app_layout = [
         ],
         style={'width': '100%', 'margin-left': '1vw', 'margin-right': '1vw','margin-top': '1vw', 'margin-bottom': '1vw'}
     ),
+    # data every chart renders from, fetched once per tick
+    dcc.Store(id='snapshot'),
+    # clicked by assets/push.js when the simulator reports new orders
+    html.Button(id='push-refresh', n_clicks=0, style={'display': 'none'}),
+    # fallback for when the event stream is unavailable
     dcc.Interval(
         id='interval-component',
         interval=DASHBOARD_REFRESH_INTERVAL * 1000, # in milliseconds
@@ -89,12 +146,18 @@ def format_ts(epoch):
     return formatted_ts
 
 
-def get_status_over_time(df):
+def get_status_over_time(df, step=600):
     """Transform a dataframe of timestamps into statuses over time
 
+    Counts are computed from sorted event times rather than by testing
+    every order at every timestamp, which takes O((N+T) log N) for N
+    orders and T timestamps. This relies on the simulator's invariant that
+    an order is only started once received and only completed once started.
+
     Args:
       df (pd.DataFrame): dataframe with received_at, started_at, and
         completed_at columns as epoch values
+      step (int): seconds between timestamps
     """
     start = int(min(df['received_at']))
     end = int(max(np.concatenate([
@@ -104,19 +167,21 @@ def get_status_over_time(df):
     ])))
 
     # calculate status counts at different time frames
-    timestamps = [ts for ts in range(start, end, 600)]
+    timestamps = np.arange(start, end, step)
+
+    # orders that reached each status at or before each timestamp
+    def reached(col):
+        times = np.sort(df[col].dropna().values)
+        return np.searchsorted(times, timestamps, side='right')
+    received, started, completed = [
+        reached(col) for col in ['received_at', 'started_at', 'completed_at']
+    ]
 
     # queued: received but not yet started; awaiting kitchen resource
-    queued = [(
-        (df['received_at'].values <= ts) &
-        (ts < df['started_at'].fillna(np.inf).values)
-    ).sum() for ts in timestamps]
+    queued = received - started
 
     # in progress: started but not yet completed
-    in_progress = [(
-        (df['started_at'].fillna(np.inf).values <= ts) &
-        (ts < df['completed_at'].fillna(np.inf).values)
-    ).sum() for ts in timestamps]
+    in_progress = started - completed
 
     new_df = pd.DataFrame(
         data={'Queued': queued, 'In Progress': in_progress},
@@ -125,26 +190,151 @@ def get_status_over_time(df):
     return new_df
 
 
+def get_status_lod(residents, window=0, max_points=STATUS_MAX_POINTS):
+    """Statuses over time, in more detail the more recent
+
+    Reads the status rollups kept with the resident timestamps, so the
+    cost follows the points drawn and the range shown rather than the
+    number of orders. Recent history comes from the finest resolution and
+    older history from coarser ones, and the series never has more than
+    `max_points` points, however long the run.
+
+    Args:
+      residents (list): ResidentTimestamps of every database shown
+      window (int): seconds of history to show, up to the latest event;
+        0 for the whole run
+      max_points (int): most points in the series
+    """
+    bounds = []
+    for resident in residents:
+        with resident.lock:
+            bounds.append(resident.bounds())
+    bounds = [b for b in bounds if b is not None]
+    if not bounds:
+        return pd.DataFrame({'Queued': [], 'In Progress': []})
+    start = int(min(first for first, _ in bounds))
+    end = int(np.ceil(max(last for _, last in bounds)))
+    if window:
+        start = max(start, end - window)
+    segments = lod_times(start, end, residents[0].rollup.resolutions, max_points)
+
+    # kitchens' counts add up, sampled at the same times
+    reached = {}
+    for resident in residents:
+        with resident.lock:
+            counts = resident.status_counts(segments)
+        for col, values in counts.items():
+            reached[col] = reached.get(col, 0) + values
+    timestamps = np.concatenate([times for _, times in segments])
+    return pd.DataFrame(
+        data={
+            'Queued': reached['received_at'] - reached['started_at'],
+            'In Progress': reached['started_at'] - reached['completed_at'],
+        },
+        index=pd.to_datetime(timestamps, unit='s'),
+    )
+
+
+def build_snapshot(databases=(None,), window=0):
+    """Everything the charts need, from one consistent read of each database
+
+    Args:
+      databases (list): databases to combine, one per kitchen shown; None
+        stands for CSS_DATABASE
+      window (int): seconds of history the status graph shows; 0 for the
+        whole run
+
+    Returns:
+      dict: JSON-serializable chart data
+    """
+    results = combine_snapshots([fetch_snapshot(database) for database in databases])
+    status_df = get_status_lod(results['timestamps'], window)
+    return {
+        'sim_time': results['max_timestamp'][0],
+        # lag and speed of a real-time run, if it has checked them
+        'pace': results['run_pace'],
+        'status_over_time': {
+            'x': [str(ts) for ts in status_df.index],
+            'Queued': status_df['Queued'].tolist(),
+            'In Progress': status_df['In Progress'].tolist(),
+        },
+        'spend_by_time_of_day': results['spend_by_time_of_day'].to_dict('split'),
+        'spend_by_day_and_service': results['spend_by_day_and_service'].to_dict('split'),
+        'total_spend': results['total_spend'][0],
+        'avg_order_time': results['recent_order_times'][0],
+    }
+
+
+def snapshot_df(snapshot, name):
+    """Rebuild a query result dataframe stored in the snapshot"""
+    return pd.DataFrame(**snapshot[name])
+
+
 ##########################
 ##    CHART UPDATES     ##
 ##########################
-@app.callback(Output('sim-time', 'children'),
+def timed_callback(callback):
+    """Record how long each run of a callback takes"""
+    @wraps(callback)
+    def timed(*args):
+        with callback_seconds.time(callback=callback.__name__):
+            return callback(*args)
+    return timed
+
+
+@app.callback([Output('kitchen', 'options'),
+               Output('kitchen-picker', 'style')],
               [Input('interval-component', 'n_intervals')])
-def update_time(n):
-    ts = max_timestamp()[0]
-    return f"Simulation Time: {format_ts(ts)}"
+@timed_callback
+def update_kitchen_options(n):
+    names = kitchens()
+    options = [{'label': 'All kitchens', 'value': ALL_KITCHENS}] + [
+        {'label': f'Kitchen {name}', 'value': name} for name in names
+    ]
+    style = {'width': '20vw', 'color': 'black'} if names else {'display': 'none'}
+    return options, style
+
+
+@app.callback(Output('snapshot', 'data'),
+              [Input('interval-component', 'n_intervals'),
+               Input('push-refresh', 'n_clicks'),
+               Input('kitchen', 'value'),
+               Input('time-window', 'value')])
+@timed_callback
+def update_snapshot(n, pushes, kitchen, window):
+    # viewers refreshing without new data share the same snapshot; any
+    # kitchen's writes invalidate every view, which keeps versions comparable
+    kitchen = kitchen or ALL_KITCHENS
+    window = window or 0
+    return query_cache.get(
+        ('snapshot', kitchen, window),
+        fleet_version(),
+        lambda: build_snapshot(kitchen_databases(kitchen), window),
+    )
+
+
+@app.callback(Output('sim-time', 'children'),
+              [Input('snapshot', 'data')])
+@timed_callback
+def update_time(snapshot):
+    ts = snapshot['sim_time']
+    text = f"Simulation Time: {format_ts(ts)}"
+    if snapshot.get('pace'):
+        lag, speed = snapshot['pace']
+        text += f" ({speed:g}X, {lag:.0f}s behind)" if lag >= 1 else f" ({speed:g}X)"
+    return text
 
 
 @app.callback(Output('time-graph', 'figure'),
-              [Input('interval-component', 'n_intervals')])
-def update_time_graph(n):
-    df = all_timestamps()
-    df = get_status_over_time(df)
+              [Input('snapshot', 'data')])
+@timed_callback
+def update_time_graph(snapshot):
+    series = snapshot['status_over_time']
 
     fig={
         'data': [
-            {'x': df.index, 'y': df['Queued'], 'type': 'line', 'name': 'Queued', 'line': {'color': '#f4d44d', 'width': '3'}},
-            {'x': df.index, 'y': df['In Progress'], 'type': 'line', 'name': 'In Progress', 'line': {'color': '#00FFFF', 'width': '3'}},
+            {'x': series['x'], 'y': series['Queued'], 'type': 'line', 'name': 'Queued', 'line': {'color': '#f4d44d', 'width': '3'}},
+            {'x': series['x'], 'y': series['In Progress'], 'type': 'line', 'name': 'In Progress', 'line': {'color': '#00FFFF', 'width': '3'}},
         ],
         'layout': {
             'title': {'text': 'Order Statuses Over Time (PST)', 'xanchor': 'center', 'x': 0.5},
@@ -159,9 +349,10 @@ def update_time_graph(n):
 
 
 @app.callback(Output('pie-chart', 'figure'),
-              [Input('interval-component', 'n_intervals')])
-def update_pie_chart(n):
-    df = spend_by_time_of_day()
+              [Input('snapshot', 'data')])
+@timed_callback
+def update_pie_chart(snapshot):
+    df = snapshot_df(snapshot, 'spend_by_time_of_day')
     fig = px.pie(df, values="total_spent", names="time_of_day")
     fig.update_traces(
         textfont_size=16,
@@ -178,9 +369,10 @@ def update_pie_chart(n):
 
 
 @app.callback(Output('stacked-bar-chart', 'figure'),
-              [Input('interval-component', 'n_intervals')])
-def update_stacked_bar_chart(n):
-    df = spend_by_day_and_service()
+              [Input('snapshot', 'data')])
+@timed_callback
+def update_stacked_bar_chart(snapshot):
+    df = snapshot_df(snapshot, 'spend_by_day_and_service')
     df['dow'] = df['dow'].map({
         0: 'Sun',
         1: 'Mon',
@@ -208,9 +400,10 @@ def update_stacked_bar_chart(n):
 
 
 @app.callback(Output('total-spend', 'figure'),
-              [Input('interval-component', 'n_intervals')])
-def update_total_spend(n):
-    val = total_spend()[0]
+              [Input('snapshot', 'data')])
+@timed_callback
+def update_total_spend(snapshot):
+    val = snapshot['total_spend']
     data= [{
         'type': 'indicator',
         'mode': 'number',
@@ -229,9 +422,10 @@ def update_total_spend(n):
 
 
 @app.callback(Output('avg-order-time', 'figure'),
-              [Input('interval-component', 'n_intervals')])
-def update_avg_order_time(n):
-    avg_order_time = recent_order_times()[0]
+              [Input('snapshot', 'data')])
+@timed_callback
+def update_avg_order_time(snapshot):
+    avg_order_time = snapshot['avg_order_time']
     if avg_order_time <= 40:
         font_color = '#5ceda5'
     elif avg_order_time <= 80:
@@ -265,7 +459,45 @@ def update_avg_order_time(n):
     return fig
 
 
+##########################
+##    SERVER ROUTES     ##
+##########################
+@server.route('/cache-info')
+def cache_info_route():
+    """Query cache hit/miss counters"""
+    return flask.jsonify(cache_info())
+
+
+@server.route('/metrics')
+def metrics_route():
+    """Metrics of the dashboard and the simulator in Prometheus text format"""
+    return flask.Response(
+        render([registry.snapshot()] + read_metrics()),
+        mimetype='text/plain; version=0.0.4',
+    )
+
+
+@server.route('/events')
+def events_route():
+    """Server-sent stream of order event summaries from the simulator"""
+    def stream(seq):
+        while True:
+            seq, summary = event_listener.wait(seq, timeout=EVENTS_KEEPALIVE)
+            if summary is None:
+                yield ": keepalive\n\n"
+            else:
+                yield f"data: {json.dumps(summary)}\n\n"
+
+    return flask.Response(
+        # anything after the client connected counts as new
+        stream(event_listener.seq),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache'},
+    )
+
+
 if __name__ == '__main__':
     # give simulator time to kick off
     time.sleep(3)
+    event_listener.start()
     app.run_server(host='0.0.0.0', port=8050)
@@ -0,0 +1,28 @@
+// Refresh the dashboard as soon as the simulator reports new orders.
+// Dash serves every script in assets/ automatically. Without this (or if
+// the stream drops) the dashboard still refreshes on its interval.
+(function () {
+    if (!window.EventSource) {
+        return;
+    }
+    // at most one refresh per this many milliseconds
+    var MIN_GAP = 250;
+    var scheduled = false;
+
+    function refresh() {
+        scheduled = false;
+        var button = document.getElementById('push-refresh');
+        if (button) {
+            button.click();
+        }
+    }
+
+    // reconnects on its own if the server restarts
+    var source = new EventSource('/events');
+    source.onmessage = function () {
+        if (!scheduled) {
+            scheduled = true;
+            setTimeout(refresh, MIN_GAP);
+        }
+    };
+})();
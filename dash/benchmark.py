@@ -0,0 +1,124 @@
+"""Benchmark the dashboard's queries on the simulator benchmark's databases
+
+Run simulator/benchmark.py first: it leaves a database of simulated orders
+for each size in db/benchmarks/. Measures, per size (median seconds):
+  dash.<size>.sql.<query>.seconds: each query in sql.py
+  dash.<size>.snapshot_cold.seconds: a full snapshot, loading every
+    order's timestamps from scratch
+  dash.<size>.snapshot_warm.seconds: a snapshot with nothing new to load
+  dash.<size>.status_over_time.seconds: `get_status_over_time` on every
+    order
+  dash.<size>.status_lod.seconds: `get_status_lod` from the resident
+    status rollup, as the dashboard draws the graph
+  dash.synthetic_1m.status_over_time.seconds: `get_status_over_time` on
+    a million orders spread over 30 days, with no database involved
+
+Results go to db/benchmarks/dash.json and are compared against
+db/benchmark_baseline.json.
+
+Usage:
+  python benchmark.py
+  python benchmark.py --update-baseline
+"""
+
+import argparse
+import glob
+import os
+import re
+import sys
+
+import numpy as np
+import pandas as pd
+
+from app import (
+    get_status_lod,
+    get_status_over_time,
+)
+from db.benchmark import (
+    RESULTS_DIR,
+    add_arguments,
+    finish,
+    median_time,
+    result,
+)
+from db.connection import connect
+import sql
+
+
+def bench_databases():
+    """(size, path) of each database the simulator benchmark left"""
+    databases = []
+    for path in glob.glob(os.path.join(RESULTS_DIR, 'orders_*.db')):
+        size = re.match(r'orders_(\w+)\.db$', os.path.basename(path)).group(1)
+        databases.append((size, path))
+    return sorted(databases, key=lambda db: os.path.getsize(db[1]))
+
+
+def run_suite(repeat):
+    """Time every query on every benchmark database
+
+    Returns:
+      dict: results keyed by benchmark name
+    """
+    results = {}
+    for size, database in bench_databases():
+        conn = connect(database, readonly=True)
+        for query in sql.SNAPSHOT_QUERIES + [sql.orders_by_status, sql.all_timestamps]:
+            results[f'dash.{size}.sql.{query.__name__}.seconds'] = result(
+                median_time(lambda: query(conn), repeat), 'seconds', 'lower')
+
+        def cold_snapshot():
+            sql._residents.pop(database, None)
+            return sql.fetch_snapshot(database)
+        results[f'dash.{size}.snapshot_cold.seconds'] = result(
+            median_time(cold_snapshot, repeat), 'seconds', 'lower')
+        results[f'dash.{size}.snapshot_warm.seconds'] = result(
+            median_time(lambda: sql.fetch_snapshot(database), repeat), 'seconds', 'lower')
+
+        timestamps = sql.all_timestamps(conn)
+        results[f'dash.{size}.status_over_time.seconds'] = result(
+            median_time(lambda: get_status_over_time(timestamps), repeat), 'seconds', 'lower')
+        residents = [sql._residents[database]]
+        results[f'dash.{size}.status_lod.seconds'] = result(
+            median_time(lambda: get_status_lod(residents), repeat), 'seconds', 'lower')
+        conn.close()
+        print(f"Timed queries on {size} orders")
+    return results
+
+
+def run_status_over_time(repeat):
+    """Time `get_status_over_time` on a million random orders over 30 days
+
+    Args:
+      repeat (int): runs to take the median of
+
+    Returns:
+      dict: results keyed by benchmark name
+    """
+    rng = np.random.RandomState(0)
+    n = 1000000
+    received = 1500000000 + np.sort(rng.randint(0, 30 * 86400, n))
+    started = received + rng.randint(0, 3600, n)
+    timestamps = pd.DataFrame({
+        'received_at': received,
+        'started_at': started,
+        'completed_at': started + rng.randint(1, 3600, n),
+    })
+    return {
+        'dash.synthetic_1m.status_over_time.seconds': result(
+            median_time(lambda: get_status_over_time(timestamps), repeat), 'seconds', 'lower'),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='runs of each query; the median is reported')
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    results = run_suite(args.repeat)
+    if not results:
+        sys.exit(f"No databases in {RESULTS_DIR}; run the simulator benchmark first")
+    results.update(run_status_over_time(args.repeat))
+    sys.exit(finish('dash', results, args))
@@ -0,0 +1,81 @@
+"""Bounded cache for query results that change only with the database"""
+
+from collections import OrderedDict
+import threading
+
+
+class QueryCache(object):
+    """LRU cache of query results keyed on the database's data version
+
+    Results are stored under (query name, data version). Once the version
+    moves on, entries for older versions can never be hit again, so they
+    are dropped. Concurrent misses for the same key wait on each other,
+    so N dashboards refreshing at once still run each query only once
+    per database change.
+
+    Args:
+      maxsize (int): max entries kept
+    """
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def get(self, name, version, compute):
+        """Return the cached result for `name` at `version`, computing it on a miss
+
+        Args:
+          name (str): query name
+          version (int): current data version of the database
+          compute (callable): runs the query; called with no arguments
+        """
+        key = (name, version)
+        with self._lock:
+            if version != self.version:
+                self._evict_stale(version)
+            if key in self.entries:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return self.entries[key]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                # another thread may have computed it while we waited
+                if key in self.entries:
+                    self.hits += 1
+                    return self.entries[key]
+                self.misses += 1
+            result = compute()
+            with self._lock:
+                self.entries[key] = result
+                while len(self.entries) > self.maxsize:
+                    self.entries.popitem(last=False)
+                self._key_locks.pop(key, None)
+        return result
+
+    def _evict_stale(self, version):
+        self.version = version
+        for key in [k for k in self.entries if k[1] != version]:
+            del self.entries[key]
+
+    def clear(self):
+        """Drop every entry and reset the counters"""
+        with self._lock:
+            self.entries.clear()
+            self.version = None
+            self.hits = self.misses = 0
+
+    def info(self):
+        """Hit/miss counters and current size"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self.entries),
+                'maxsize': self.maxsize,
+            }
@@ -0,0 +1,276 @@
+"""In-memory copy of order timestamps, kept current with deltas"""
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+from parameters.simulation_parameters import STATUS_RESOLUTIONS
+
+COLUMNS = ['received_at', 'started_at', 'completed_at']
+
+
+def lod_times(start, end, resolutions, max_points):
+    """Times to sample a series at, finest near `end` and coarser further back
+
+    Going back from `end`, each resolution but the coarsest gets an equal
+    share of the points; the coarsest covers the rest of the way back to
+    `start`, thinned out to the points left over.
+
+    Args:
+      start (int): earliest time to show
+      end (int): latest time to show
+      resolutions (list): seconds between points, each dividing the next
+      max_points (int): most times to return
+
+    Returns:
+      list: (resolution, times) pairs, oldest first; the times are
+        ascending multiples of the resolution
+    """
+    resolutions = sorted(resolutions)
+    share = max(max_points // len(resolutions), 1)
+    segments = []
+    used = 0
+    hi = -(-end // resolutions[0]) * resolutions[0]
+    for i, resolution in enumerate(resolutions):
+        hi = hi // resolution * resolution
+        first = start // resolution * resolution
+        if i == len(resolutions) - 1:
+            times = np.arange(first, hi + resolution, resolution)
+            keep = max(max_points - used, 1)
+            if len(times) > keep:
+                # keep the newest point, which joins the finer segment
+                times = times[::-1][::-(-len(times) // keep)][::-1]
+            segments.append((resolution, times))
+            break
+        lo = max(hi - share * resolution, first - resolution)
+        times = np.arange(lo + resolution, hi + resolution, resolution)
+        segments.append((resolution, times))
+        used += len(times)
+        if lo < first:
+            break
+        hi = lo
+    return segments[::-1]
+
+
+class StatusRollup(object):
+    """Counts of orders reaching each status per time bucket
+
+    Counts are kept at several resolutions. Bucket j of resolution r
+    holds the events in (origin + (j-1)r, origin + jr], so the number of
+    orders that reached a status by the end of a bucket is a prefix sum.
+    The origin is a multiple of the coarsest resolution, so the prefix up
+    to any time is mostly coarse buckets and only the rest fine ones.
+
+    Args:
+      resolutions (list): bucket sizes in seconds, each dividing the next
+
+    Raises:
+      ValueError: if a resolution doesn't divide the next
+    """
+    def __init__(self, resolutions=STATUS_RESOLUTIONS):
+        self.resolutions = sorted(resolutions)
+        for fine, coarse in zip(self.resolutions, self.resolutions[1:]):
+            if coarse % fine:
+                raise ValueError(f"Resolution {coarse}s is not a multiple of {fine}s")
+        self.reset()
+
+    def reset(self):
+        """Drop every count"""
+        self.origin = None
+        # earliest order received and latest event counted
+        self.first = None
+        self.last = None
+        self.counts = {
+            resolution: {col: np.zeros(0, dtype=np.int64) for col in COLUMNS}
+            for resolution in self.resolutions
+        }
+
+    def add(self, col, times, sign=1):
+        """Count events, or uncount them with sign=-1
+
+        Args:
+          col (str): status timestamp the events are for
+          times (np.array): event times; NaNs are skipped
+          sign (int): 1 to add, -1 to remove
+        """
+        times = times[~np.isnan(times)]
+        if not len(times):
+            return
+        self._cover(times.min(), times.max())
+        for resolution, counts in self.counts.items():
+            buckets = np.ceil((times - self.origin) / resolution).astype(np.int64)
+            added = np.bincount(buckets)
+            counts[col][:len(added)] += sign * added
+        if sign > 0:
+            if col == 'received_at':
+                self.first = times.min() if self.first is None else min(self.first, times.min())
+            self.last = times.max() if self.last is None else max(self.last, times.max())
+
+    def _cover(self, low, high):
+        """Make room for buckets from `low` to `high`"""
+        coarsest = self.resolutions[-1]
+        origin = int(low // coarsest * coarsest)
+        if self.origin is None:
+            self.origin = origin
+        shift = max(self.origin - origin, 0)
+        self.origin -= shift
+        for resolution, counts in self.counts.items():
+            size = int(np.ceil((high - self.origin) / resolution)) + 1
+            for col, values in counts.items():
+                pad = shift // resolution
+                if pad or size > len(values):
+                    grown = np.zeros(max(size, 2 * len(values) + pad), dtype=np.int64)
+                    grown[pad:pad + len(values)] = values
+                    counts[col] = grown
+
+    def reached(self, col, resolution, times):
+        """Number of orders that reached a status by each of `times`
+
+        Args:
+          col (str): status timestamp column
+          resolution (int): one of the rollup's resolutions
+          times (np.array): ascending multiples of `resolution`
+
+        Returns:
+          np.array: counts of events at or before each time
+        """
+        if self.origin is None or not len(times):
+            return np.zeros(len(times), dtype=np.int64)
+        counts = self.counts[resolution][col]
+        buckets = np.clip((np.asarray(times) - self.origin) // resolution, -1, len(counts) - 1)
+        lo, hi = int(buckets[0]), int(buckets[-1])
+        # only the buckets in range are summed one by one
+        prefix = np.concatenate([[0], np.cumsum(counts[lo + 1:hi + 1])])
+        return self._reached_by(col, resolution, lo) + prefix[buckets - lo]
+
+    def _reached_by(self, col, resolution, bucket):
+        """Events in buckets up to and including `bucket`"""
+        if bucket < 0:
+            return 0
+        coarsest = self.resolutions[-1]
+        coarse = bucket * resolution // coarsest
+        return int(
+            self.counts[coarsest][col][:coarse + 1].sum()
+            + self.counts[resolution][col][coarse * coarsest // resolution + 1:bucket + 1].sum()
+        )
+
+
+
+class ResidentTimestamps(object):
+    """Columnar copy of every order's timestamps
+
+    Each order id gets one slot in a set of numpy arrays. A refresh only
+    applies the orders that changed since the last one (by change
+    sequence), so its cost follows new activity rather than the size of
+    the history. When the orders table is rebuilt, e.g. by a new
+    simulation run, the copy starts over.
+
+    Status counts over time are kept alongside in a `StatusRollup`, so
+    the status graph doesn't have to go through every order.
+
+    Args:
+      capacity (int): initial number of slots
+      resolutions (list): resolutions of the status rollup, in seconds
+    """
+    COLUMNS = COLUMNS
+
+    def __init__(self, capacity=1024, resolutions=STATUS_RESOLUTIONS):
+        self.lock = threading.Lock()
+        self.initial_capacity = capacity
+        self.rollup = StatusRollup(resolutions)
+        self.reset(generation=None)
+
+    def reset(self, generation):
+        """Drop every row
+
+        Args:
+          generation: identifies the version of the table the rows come from
+        """
+        self.generation = generation
+        self.change_seq = 0
+        self.slots = {}
+        self.size = 0
+        self.rollup.reset()
+        self.columns = {
+            col: np.full(self.initial_capacity, np.nan) for col in self.COLUMNS
+        }
+
+    def since(self, generation):
+        """Change sequence to load changes after
+
+        Args:
+          generation: current version of the table's structure
+
+        Returns:
+          int: the last change sequence seen, or None if every order must
+            be (re)loaded
+        """
+        if generation != self.generation:
+            self.reset(generation)
+            return None
+        return self.change_seq
+
+    def apply(self, delta):
+        """Insert or overwrite rows
+
+        Args:
+          delta (pd.DataFrame): id, change_seq and timestamp columns
+        """
+        if not len(delta):
+            return
+        rows = np.fromiter(
+            (self._slot(order_id) for order_id in delta['id']),
+            dtype=np.int64,
+            count=len(delta),
+        )
+        for col in self.COLUMNS:
+            values = delta[col].astype('float64').values
+            # an order's earlier timestamps move out of the rollup first
+            self.rollup.add(col, self.columns[col][rows], sign=-1)
+            self.rollup.add(col, values)
+            self.columns[col][rows] = values
+        last_seq = delta['change_seq'].max()
+        if pd.notnull(last_seq):
+            self.change_seq = max(self.change_seq, int(last_seq))
+
+    def _slot(self, order_id):
+        slot = self.slots.get(order_id)
+        if slot is None:
+            slot = self.slots[order_id] = self.size
+            self.size += 1
+            capacity = len(self.columns[self.COLUMNS[0]])
+            if self.size > capacity:
+                for col in self.COLUMNS:
+                    grown = np.full(2 * capacity, np.nan)
+                    grown[:capacity] = self.columns[col]
+                    self.columns[col] = grown
+        return slot
+
+    def bounds(self):
+        """Earliest order received and latest event, or None if empty"""
+        if self.rollup.first is None:
+            return None
+        return self.rollup.first, self.rollup.last
+
+    def status_counts(self, segments):
+        """Orders received, started and completed by each sample time
+
+        Args:
+          segments (list): (resolution, times) pairs from `lod_times`
+
+        Returns:
+          dict: counts per timestamp column, over every segment's times
+        """
+        return {
+            col: np.concatenate([np.zeros(0, dtype=np.int64)] + [
+                self.rollup.reached(col, resolution, times) for resolution, times in segments
+            ])
+            for col in self.COLUMNS
+        }
+
+    def frame(self):
+        """Copy of the current rows as a dataframe"""
+        return pd.DataFrame({
+            col: self.columns[col][:self.size].copy() for col in self.COLUMNS
+        })
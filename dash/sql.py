@@ -1,39 +1,213 @@
-"""SQL Queries, returned in dataframes"""
+"""SQL Queries, returned in dataframes
+
+Aggregates read from rollup tables that triggers keep up to date as orders
+are written (see db/migrations/create_orders_table.py), so their cost
+doesn't grow with the number of orders.
+"""
+
+from functools import wraps
+import threading
 
 import pandas as pd
 
+from cache import QueryCache
+from resident import ResidentTimestamps
 from db.connection import (
+    connect,
     css_connection,
     css_cursor,
 )
+from db.metrics import db_call_seconds
+from db.shards import read_manifest
+from parameters.simulation_parameters import DASHBOARD_CACHE_SIZE
+
+# results are reused until the database changes
+query_cache = QueryCache(maxsize=DASHBOARD_CACHE_SIZE)
+
+# timestamps of every order per database, refreshed from the rows that changed
+_residents = {}
+
+# PRAGMA data_version only changes between calls on the same connection
+_version_conns = {}
+_version_lock = threading.Lock()
+
+# dropdown value for the whole fleet
+ALL_KITCHENS = 'all'
+
+
+def data_version(database=None):
+    """Counter that changes whenever another connection commits to the db
+
+    Args:
+      database (str): path to the database; defaults to CSS_DATABASE
+    """
+    with _version_lock:
+        if database not in _version_conns:
+            _version_conns[database] = connect(database, readonly=True)
+        with db_call_seconds.time(call='data_version'):
+            return _version_conns[database].execute("PRAGMA data_version;").fetchone()[0]
+
+
+def kitchens():
+    """Names of the kitchens of the running fleet; empty for a single kitchen"""
+    return [shard['kitchen'] for shard in read_manifest()]
+
+
+def kitchen_databases(kitchen=ALL_KITCHENS):
+    """Databases holding the orders of one kitchen, or of every kitchen
+
+    Args:
+      kitchen (str): kitchen name, or ALL_KITCHENS
+
+    Returns:
+      list: database paths, where None stands for CSS_DATABASE
+    """
+    shards = read_manifest()
+    if not shards:
+        return [None]
+    return [
+        shard['database'] for shard in shards
+        if kitchen in (ALL_KITCHENS, shard['kitchen'])
+    ]
+
+
+def fleet_version():
+    """Data versions of every database the dashboard may show"""
+    return tuple(data_version(database) for database in kitchen_databases())
+
+
+def cache_info():
+    """Hit/miss counters of the query cache"""
+    return query_cache.info()
 
 
 def query_to_df(sql_func):
-    """Helper to run sql and return dataframe"""
-    def get_df():
-        sql = sql_func()
-        with css_connection() as conn:
-            return pd.read_sql_query(sql, conn)
+    """Helper to run sql and return dataframe
+
+    Called with a connection, the query runs on it directly (e.g. as part
+    of a snapshot); otherwise results are cached until the data changes.
+    """
+    def run_query(conn):
+        with db_call_seconds.time(call=sql_func.__name__):
+            return pd.read_sql_query(sql_func(), conn)
+
+    def run_query_on_new_connection():
+        with css_connection(readonly=True) as conn:
+            return run_query(conn)
+
+    @wraps(sql_func)
+    def get_df(conn=None):
+        if conn is not None:
+            return run_query(conn)
+        df = query_cache.get(sql_func.__name__, data_version(), run_query_on_new_connection)
+        # callers are free to modify the frame they get back
+        return df.copy()
     return get_df
 
 
 def fetch_one(sql_func):
-    """Helper to run sql and return single row"""
-    def get_value():
-        sql = sql_func()
-        with css_cursor() as cur:
-            cur.execute(sql)
+    """Helper to run sql and return single row
+
+    Called with a connection, the query runs on it directly (e.g. as part
+    of a snapshot); otherwise results are cached until the data changes.
+    """
+    def run_query_on_new_connection():
+        with css_cursor(readonly=True) as cur, db_call_seconds.time(call=sql_func.__name__):
+            cur.execute(sql_func())
             return cur.fetchone()
+
+    @wraps(sql_func)
+    def get_value(conn=None):
+        if conn is not None:
+            with db_call_seconds.time(call=sql_func.__name__):
+                return conn.execute(sql_func()).fetchone()
+        return query_cache.get(sql_func.__name__, data_version(), run_query_on_new_connection)
     return get_value
 
 
+def fetch_snapshot(database=None):
+    """Run every dashboard query in a single read transaction
+
+    All results reflect the same state of the database, even while the
+    simulator is writing, and share one connection.
+
+    Args:
+      database (str): path to the database; defaults to CSS_DATABASE
+
+    Returns:
+      dict: query results keyed by query name
+    """
+    with db_call_seconds.time(call='snapshot'), \
+            css_connection(readonly=True, database=database) as conn:
+        conn.execute("BEGIN;")
+        try:
+            results = {query.__name__: query(conn) for query in SNAPSHOT_QUERIES}
+            results['timestamps'] = [refresh_timestamps(conn, database)]
+            return results
+        finally:
+            conn.execute("ROLLBACK;")
+
+
+def refresh_timestamps(conn, database=None):
+    """Bring the resident copy of a database's order timestamps up to date
+
+    Only loads orders written since the last refresh. The schema version
+    changes whenever the orders table is rebuilt, which forces a reload.
+
+    Returns:
+      ResidentTimestamps: the database's resident copy; read it while
+        holding its lock
+    """
+    generation = conn.execute("PRAGMA schema_version;").fetchone()[0]
+    resident = _residents.setdefault(database, ResidentTimestamps())
+    with resident.lock:
+        since = resident.since(generation)
+        resident.apply(order_timestamps(conn, since))
+    return resident
+
+
+def combine_snapshots(snapshots):
+    """Merge the snapshots of several kitchens into one for the fleet
+
+    Sums and maxima combine exactly, and the status graph is drawn from
+    every kitchen's timestamps. The recent order time is the mean of
+    each kitchen's recent average, and the fleet's pace is that of its
+    furthest behind kitchen.
+
+    Args:
+      snapshots (list): results of `fetch_snapshot`, one per database
+    """
+    if len(snapshots) == 1:
+        return snapshots[0]
+
+    def values(name):
+        return [s[name][0] for s in snapshots if s[name][0] is not None]
+
+    def summed(name, keys):
+        df = pd.concat([s[name] for s in snapshots], ignore_index=True)
+        return df.groupby(keys, as_index=False).sum().sort_values(keys, ignore_index=True)
+
+    recent = values('recent_order_times')
+    paces = [s['run_pace'] for s in snapshots if s['run_pace'] is not None]
+    spend = values('total_spend')
+    return {
+        'timestamps': [resident for s in snapshots for resident in s['timestamps']],
+        'max_timestamp': (max(values('max_timestamp'), default=None),),
+        'recent_order_times': (sum(recent) / len(recent) if recent else None,),
+        'run_pace': max(paces, default=None),
+        'spend_by_day_and_service': summed('spend_by_day_and_service', ['service', 'dow']),
+        'spend_by_time_of_day': summed('spend_by_time_of_day', ['time_of_day']),
+        'total_spend': (sum(spend) if spend else None,),
+    }
+
+
 @query_to_df
 def orders_by_status():
     return """
     SELECT status
-    , COUNT(*) as cnt
-    FROM orders
-    GROUP BY status
+    , cnt
+    FROM rollup_orders_by_status
+    WHERE cnt > 0
     ORDER BY status;
     """
 
@@ -49,15 +223,42 @@ def all_timestamps():
     """
 
 
+ORDER_TIMESTAMPS_SQL = """
+SELECT
+  id
+, received_at - 8*60*60 as received_at
+, started_at - 8*60*60 as started_at
+, completed_at - 8*60*60 as completed_at
+, change_seq
+FROM orders
+"""
+
+CHANGED_SINCE_SQL = ORDER_TIMESTAMPS_SQL + "WHERE change_seq > ?;"
+
+
+def order_timestamps(conn, since=None):
+    """Timestamps and change sequence of orders, optionally only recent changes
+
+    Args:
+      conn (connection): open connection
+      since (int): only orders changed after this change sequence; every
+        order if None
+    """
+    with db_call_seconds.time(call='order_timestamps'):
+        if since is None:
+            return pd.read_sql_query(ORDER_TIMESTAMPS_SQL, conn)
+        return pd.read_sql_query(CHANGED_SINCE_SQL, conn, params=(since,))
+
+
 @query_to_df
 def spend_by_day_and_service():
     return """
     SELECT
     service
-    , cast(strftime('%w', received_at - 8*60*60, 'unixepoch') as int) as dow
-    , SUM(total_price) AS total_spent
-    FROM orders
-    GROUP BY service, dow
+    , dow
+    , total_spent
+    FROM rollup_spend_by_day_and_service
+    WHERE cnt > 0
     ORDER BY service, dow;
     """
 
@@ -67,19 +268,32 @@ def max_timestamp():
     """Max timestamp to approximate simulator current time"""
     return """
     SELECT max(
-        max(coalesce(received_at - 8*60*60,0))
-        , max(coalesce(started_at - 8*60*60,0))
-        , max(coalesce(completed_at - 8*60*60,0))
-    )
-    FROM orders;
+        coalesce((SELECT max(received_at) FROM orders) - 8*60*60, 0)
+        , coalesce((SELECT max(started_at) FROM orders) - 8*60*60, 0)
+        , coalesce((SELECT max(completed_at) FROM orders) - 8*60*60, 0)
+    );
     """
 
 
 @fetch_one
 def total_spend():
     return """
-    SELECT SUM(total_price)
-    FROM orders;
+    SELECT (
+        SELECT total_spent
+        FROM rollup_total_spend
+        WHERE id = 1
+        AND cnt > 0
+    );
+    """
+
+
+@fetch_one
+def run_pace():
+    """Latest check of how far a real-time run is behind, and its speed"""
+    return """
+    SELECT lag, speed
+    FROM run_lag
+    WHERE seq = (SELECT max(seq) FROM run_lag);
     """
 
 
@@ -107,17 +321,21 @@ def recent_order_times():
 def spend_by_time_of_day():
     return """
     SELECT
-    CASE
-        WHEN cast(strftime('%H', received_at - 8*60*60, 'unixepoch') as int)
-          BETWEEN 5 AND 10 THEN 'Breakfast'
-        WHEN cast(strftime('%H', received_at - 8*60*60, 'unixepoch') as int)
-          BETWEEN 11 AND 15 THEN 'Lunch'
-        WHEN cast(strftime('%H', received_at - 8*60*60, 'unixepoch') as int)
-          BETWEEN 16 AND 22 THEN 'Dinner'
-        ELSE 'Late Night'
-        END as time_of_day
-    , SUM(total_price) AS total_spent
-    FROM orders
-    GROUP BY time_of_day
+    time_of_day
+    , total_spent
+    FROM rollup_spend_by_time_of_day
+    WHERE cnt > 0
     ORDER BY time_of_day ASC;
     """
+
+
+# everything the dashboard renders on each tick
+# order timestamps come from the resident copies instead
+SNAPSHOT_QUERIES = [
+    max_timestamp,
+    recent_order_times,
+    run_pace,
+    spend_by_day_and_service,
+    spend_by_time_of_day,
+    total_spend,
+]
@@ -0,0 +1,65 @@
+import threading
+import time
+from unittest import (
+    mock,
+    TestCase,
+)
+
+from cache import QueryCache
+import sql
+
+
+class TestQueryCache(TestCase):
+
+    def test_hits_until_version_changes(self):
+        """Results are reused until the data version moves on"""
+        cache = QueryCache()
+        compute = mock.Mock(side_effect=[1, 2])
+        assert cache.get('q', 1, compute) == 1
+        assert cache.get('q', 1, compute) == 1
+        assert cache.get('q', 2, compute) == 2
+        assert compute.call_count == 2
+        assert cache.info() == {'hits': 1, 'misses': 2, 'size': 1, 'maxsize': 64}
+
+
+    def test_bounded_size(self):
+        """Least recently used entries are evicted past maxsize"""
+        cache = QueryCache(maxsize=2)
+        for name in ['a', 'b', 'a', 'c']:
+            cache.get(name, 1, lambda: name)
+        assert list(cache.entries) == [('a', 1), ('c', 1)]
+
+
+    def test_concurrent_misses_query_once(self):
+        """Many viewers refreshing at once should run a query only once"""
+        cache = QueryCache()
+        calls = []
+        def compute():
+            calls.append(1)
+            time.sleep(0.05)
+            return 'result'
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(cache.get('q', 1, compute)))
+            for _ in range(10)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert results == ['result'] * 10
+        assert len(calls) == 1
+
+
+    def test_sql_helpers_use_cache(self):
+        """Decorated queries only hit the database when its version changes"""
+        sql.query_cache.clear()
+        with mock.patch('sql.data_version', side_effect=[7, 7, 8]), \
+                mock.patch('sql.css_cursor') as css_cursor:
+            cur = css_cursor.return_value.__enter__.return_value
+            cur.fetchone.side_effect = [(1,), (2,)]
+            assert sql.total_spend() == (1,)
+            assert sql.total_spend() == (1,)
+            assert sql.total_spend() == (2,)
+            assert cur.execute.call_count == 2
+        assert sql.cache_info()['hits'] == 1
@@ -1,9 +1,13 @@
+from contextlib import contextmanager
+import json
+import sqlite3
 from unittest import (
     mock,
     TestCase,
 )
 
 from app import *
+from db.migrations.migrate import migrate
 
 class TestDashApp(TestCase):
 
@@ -37,3 +41,146 @@ class TestDashApp(TestCase):
 
         actual_df = get_status_over_time(df)
         assert actual_df.equals(expected_df)
+
+
+    def test_get_status_over_time_matches_naive(self):
+        """Sorted-event counts should match checking every order at every timestamp"""
+        rng = np.random.RandomState(0)
+        n = 2000
+        received = 1500000000 + rng.randint(0, 86400, n)
+        started = received + rng.randint(0, 3600, n)
+        completed = started + rng.randint(1, 3600, n)
+        df = pd.DataFrame({
+            'received_at': received,
+            # some orders haven't started or completed yet
+            'started_at': np.where(rng.rand(n) < 0.1, np.nan, started),
+            'completed_at': np.where(rng.rand(n) < 0.2, np.nan, completed),
+        })
+        df.loc[df['started_at'].isnull(), 'completed_at'] = np.nan
+
+        for step in [60, 600, 3600]:
+            actual_df = get_status_over_time(df, step=step)
+            timestamps = range(int(df['received_at'].min()), int(df['completed_at'].max()), step)
+            assert len(actual_df) == len(timestamps)
+            queued = [(
+                (df['received_at'].values <= ts) &
+                (ts < df['started_at'].fillna(np.inf).values)
+            ).sum() for ts in timestamps]
+            in_progress = [(
+                (df['started_at'].fillna(np.inf).values <= ts) &
+                (ts < df['completed_at'].fillna(np.inf).values)
+            ).sum() for ts in timestamps]
+            assert list(actual_df['Queued']) == queued
+            assert list(actual_df['In Progress']) == in_progress
+
+
+    def test_charts_render_from_snapshot(self):
+        """One snapshot should feed every chart"""
+        BASE = 1550534400
+        conn = sqlite3.connect(':memory:')
+        migrate(conn.cursor())
+        conn.executemany(
+            "INSERT INTO orders (id, status, received_at, started_at, completed_at, service, total_price) VALUES (?, ?, ?, ?, ?, ?, ?);",
+            [
+                (1, 'Completed', BASE, BASE + 60, BASE + 1200, 'SoTesty', 10),
+                (2, 'In Progress', BASE + 600, BASE + 700, None, 'VeryTesty', 5),
+                (3, 'Queued', BASE + 900, None, None, 'SoTesty', 1),
+            ]
+        )
+        conn.commit()
+
+        @contextmanager
+        def connection(readonly=False, database=None):
+            yield conn
+        with mock.patch('sql.css_connection', connection):
+            snapshot = build_snapshot()
+        # the store has to be serializable
+        snapshot = json.loads(json.dumps(snapshot))
+
+        assert snapshot['total_spend'] == 16
+        assert snapshot['avg_order_time'] == 20
+        assert update_time(snapshot) == f"Simulation Time: {format_ts(BASE + 1200 - 8*60*60)}"
+        # real-time runs also show their pace
+        snapshot['pace'] = [12.4, 150]
+        assert update_time(snapshot).endswith("(150X, 12s behind)")
+        # the whole 20 minutes at the finest resolution
+        queued = update_time_graph(snapshot)['data'][0]['y']
+        assert len(queued) == 21
+        assert (queued[0], queued[1], queued[-1]) == (1, 0, 1)
+        assert update_total_spend(snapshot)['data'][0]['value'] == 16
+        update_pie_chart(snapshot)
+        update_stacked_bar_chart(snapshot)
+        update_avg_order_time(snapshot)
+
+
+    def test_fleet_snapshot_combines_kitchens(self):
+        """The fleet view should add up every kitchen's orders"""
+        BASE = 1550534400
+        shards = {}
+        for kitchen, price in [('0', 10), ('1', 5)]:
+            conn = sqlite3.connect(':memory:', check_same_thread=False)
+            migrate(conn.cursor())
+            conn.executemany(
+                "INSERT INTO orders (id, status, received_at, started_at, completed_at, service, total_price, change_seq) VALUES (?, ?, ?, ?, ?, ?, ?, ?);",
+                [
+                    (1, 'Completed', BASE, BASE + 60, BASE + 1200, 'SoTesty', price, 1),
+                    (2, 'Queued', BASE + 600, None, None, 'VeryTesty', price, 2),
+                ]
+            )
+            conn.commit()
+            shards[f'kitchen_{kitchen}.db'] = conn
+
+        @contextmanager
+        def connection(readonly=False, database=None):
+            yield shards[database]
+        with mock.patch('sql.css_connection', connection):
+            fleet = build_snapshot(['kitchen_0.db', 'kitchen_1.db'])
+            kitchen = build_snapshot(['kitchen_1.db'])
+
+        assert fleet['total_spend'] == 30
+        assert kitchen['total_spend'] == 10
+        queued, in_progress = fleet['status_over_time']['Queued'], fleet['status_over_time']['In Progress']
+        assert (queued[0], queued[1], queued[-1]) == (2, 0, 2)
+        assert (in_progress[0], in_progress[1], in_progress[-1]) == (0, 2, 0)
+        assert kitchen['status_over_time']['Queued'][0] == 1
+        # a window only covers the latest events
+        with mock.patch('sql.css_connection', connection):
+            recent = build_snapshot(['kitchen_0.db', 'kitchen_1.db'], window=600)
+        assert recent['status_over_time']['x'][0] == str(pd.to_datetime(BASE - 8*60*60 + 600, unit='s'))
+        assert len(recent['status_over_time']['x']) == 11
+        by_service = snapshot_df(fleet, 'spend_by_day_and_service')
+        assert by_service['total_spent'].tolist() == [15, 15]
+
+
+    def test_events_route_streams_summaries(self):
+        """Each simulator event batch should reach the browser as an SSE message"""
+        with server.test_request_context('/events'):
+            response = events_route()
+        assert response.mimetype == 'text/event-stream'
+        event_listener.handle([['received', 1, 100], ['started', 1, 130]])
+        message = next(response.response)
+        message = message.decode() if isinstance(message, bytes) else message
+        assert message.startswith('data: ')
+        summary = json.loads(message[len('data: '):])
+        assert summary['received'] >= 1
+        assert summary['sim_time'] >= 130
+        response.close()
+
+
+    def test_metrics_route(self):
+        """Dashboard and simulator metrics come out of one scrape"""
+        update_time({'sim_time': 1550534400})
+        simulator = {
+            'labels': {'process': 'simulator'},
+            'metrics': [{
+                'name': 'kitchen_queue_length', 'kind': 'gauge', 'help': 'Items waiting for a cook',
+                'buckets': [], 'samples': [[{}, 12]],
+            }],
+        }
+        with mock.patch('app.read_metrics', return_value=[simulator]), \
+                server.test_request_context('/metrics'):
+            response = metrics_route()
+        text = response.get_data(as_text=True)
+        assert response.mimetype == 'text/plain'
+        assert 'dash_callback_seconds_count{process="dash",callback="update_time"}' in text
+        assert 'kitchen_queue_length{process="simulator"} 12' in text
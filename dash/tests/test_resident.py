@@ -0,0 +1,96 @@
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+
+from resident import (
+    lod_times,
+    ResidentTimestamps,
+    StatusRollup,
+)
+
+
+def delta(rows):
+    return pd.DataFrame(
+        rows, columns=['id', 'received_at', 'started_at', 'completed_at', 'change_seq'],
+    )
+
+
+class TestResidentTimestamps(TestCase):
+
+    def test_apply_upserts_orders(self):
+        """Changed orders should overwrite their earlier row"""
+        resident = ResidentTimestamps()
+        assert resident.since('gen') is None
+        resident.apply(delta([(1, 10, None, None, 1), (2, 20, None, None, 2)]))
+        assert resident.since('gen') == 2
+        resident.apply(delta([(1, 10, 15, 30, 3)]))
+        df = resident.frame()
+        assert list(df['received_at']) == [10, 20]
+        assert list(df['completed_at'].fillna(-1)) == [30, -1]
+        assert resident.since('gen') == 3
+
+    def test_grows_past_capacity(self):
+        """Rows beyond the initial capacity should be kept"""
+        resident = ResidentTimestamps(capacity=2)
+        resident.since('gen')
+        resident.apply(delta([(i, i, i, i, i) for i in range(1, 6)]))
+        assert np.array_equal(resident.frame()['started_at'], [1, 2, 3, 4, 5])
+
+    def test_new_generation_reloads(self):
+        """A rebuilt table should drop every resident row"""
+        resident = ResidentTimestamps()
+        resident.since('old')
+        resident.apply(delta([(1, 10, 11, 12, 1)]))
+        assert resident.since('new') is None
+        assert resident.frame().empty
+
+
+class TestStatusRollup(TestCase):
+
+    def test_lod_times(self):
+        """Two weeks of history should fit the point budget, finest at the end"""
+        resolutions = [60, 600, 3600, 21600]
+        end = 14 * 86400 + 30
+        segments = lod_times(0, end, resolutions, max_points=600)
+        assert [r for r, _ in segments] == resolutions[::-1]
+        times = np.concatenate([t for _, t in segments])
+        assert len(times) <= 600
+        assert np.all(np.diff(times) > 0)
+        assert times[0] == 0 and times[-1] == end - 30 + 60
+        for resolution, t in segments:
+            assert np.all(t % resolution == 0)
+        # the last hour is drawn minute by minute
+        assert np.all(np.diff(times[times > end - 3600]) == 60)
+
+    def test_status_counts_match_orders(self):
+        """Counts should match the timestamps, including overwritten ones"""
+        rng = np.random.RandomState(3)
+        received = np.sort(rng.randint(86400, 5 * 86400, 500)).astype(float)
+        started = received + rng.randint(0, 3000, 500)
+        completed = started + rng.randint(1, 3000, 500)
+        resident = ResidentTimestamps(capacity=16)
+        resident.since('gen')
+        ids = np.arange(1, 501)
+        # first only received, then every status, then a late, early order
+        resident.apply(delta(list(zip(ids, received, [None] * 500, [None] * 500, ids))))
+        resident.apply(delta(list(zip(ids, received, started, completed, ids + 500))))
+        resident.apply(delta([(501, 100, 200, 300, 1001)]))
+        assert resident.bounds() == (100, completed.max())
+
+        columns = {
+            'received_at': np.append(received, 100),
+            'started_at': np.append(started, 200),
+            'completed_at': np.append(completed, 300),
+        }
+        segments = lod_times(0, int(completed.max()), resident.rollup.resolutions, 300)
+        counts = resident.status_counts(segments)
+        times = np.concatenate([t for _, t in segments])
+        for col, values in columns.items():
+            expected = np.searchsorted(np.sort(values), times, side='right')
+            assert np.array_equal(counts[col], expected), col
+
+    def test_resolutions_divide(self):
+        """Each resolution has to be a whole number of the finer one"""
+        with self.assertRaises(ValueError):
+            StatusRollup([60, 90])
@@ -0,0 +1,113 @@
+import os
+import re
+import sqlite3
+import tempfile
+from unittest import (
+    mock,
+    TestCase,
+)
+
+from db.connection import (
+    close_connections,
+    connect,
+    get_connection,
+)
+from db.migrations.migrate import migrate
+import sql
+
+# a plan step that reads a whole table rather than an index
+FULL_SCAN = re.compile(r'^SCAN (TABLE )?(?!CONSTANT ROW)\S+$')
+
+
+class TestSql(TestCase):
+
+    def test_queries_use_indexes(self):
+        """No dashboard query should need a full table scan"""
+        conn = sqlite3.connect(':memory:')
+        migrate(conn.cursor())
+        queries = [
+            f for f in vars(sql).values()
+            if hasattr(f, '__wrapped__') and getattr(f, '__module__', None) == 'sql'
+        ]
+        assert {query.__name__ for query in queries} == (
+            {query.__name__ for query in sql.SNAPSHOT_QUERIES} | {'orders_by_status', 'all_timestamps'})
+        for query in queries:
+            plan = [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + query.__wrapped__())]
+            assert any('INDEX' in step or 'PRIMARY KEY' in step for step in plan), query.__name__
+            for step in plan:
+                assert not FULL_SCAN.match(step), f"{query.__name__}: {step}"
+
+
+    def test_changed_orders_use_index(self):
+        """Loading recent changes should not scan every order"""
+        conn = sqlite3.connect(':memory:')
+        migrate(conn.cursor())
+        plan = [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql.CHANGED_SINCE_SQL, (0,))]
+        assert any('orders_change_seq' in step for step in plan), plan
+
+
+    def test_queries_run_on_each_path(self):
+        """Snapshots always query, while cached helpers only query when the data changes"""
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        database = os.path.join(tmpdir.name, 'css.db')
+        writer = connect(database)
+        self.addCleanup(writer.close)
+        migrate(writer.cursor())
+        for patch in [
+            mock.patch('db.connection.CSS_DATABASE', database),
+            mock.patch.dict('sql._version_conns', clear=True),
+            mock.patch.dict('sql._residents', clear=True),
+        ]:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.addCleanup(close_connections)
+        self.addCleanup(lambda: [conn.close() for conn in sql._version_conns.values()])
+        sql.query_cache.clear()
+
+        statements = []
+        get_connection(readonly=True).set_trace_callback(lambda statement: statements.append(statement.strip()))
+        def ran(*queries):
+            return [query.__wrapped__().strip() in statements for query in queries]
+
+        # snapshots skip the cache, and only load every order the first time
+        sql.fetch_snapshot()
+        assert all(ran(*sql.SNAPSHOT_QUERIES))
+        assert sql.ORDER_TIMESTAMPS_SQL.strip() in statements
+        statements.clear()
+        sql.fetch_snapshot()
+        assert all(ran(*sql.SNAPSHOT_QUERIES))
+        assert sql.ORDER_TIMESTAMPS_SQL.strip() not in statements
+        assert any(s.startswith(sql.CHANGED_SINCE_SQL.split('?')[0].strip()) for s in statements)
+        assert ran(sql.orders_by_status, sql.all_timestamps) == [False, False]
+
+        # cached helpers query once per data version
+        statements.clear()
+        sql.total_spend()
+        sql.orders_by_status()
+        assert ran(sql.total_spend, sql.orders_by_status) == [True, True]
+        statements.clear()
+        sql.total_spend()
+        sql.orders_by_status()
+        assert statements == []
+        writer.execute("INSERT INTO run_lag (at, checked_at, lag, speed, coalesced) VALUES (0, 0, 0, 1, 0);")
+        writer.commit()
+        sql.total_spend()
+        assert ran(sql.total_spend, sql.orders_by_status) == [True, False]
+
+
+    def test_snapshot_uses_one_transaction(self):
+        """Every snapshot query should run inside the same read transaction"""
+        seen = []
+        def query(name):
+            def run(conn, *args):
+                seen.append((id(conn), conn.in_transaction))
+                return name
+            run.__name__ = name
+            return run
+        with mock.patch('sql.SNAPSHOT_QUERIES', [query('a'), query('b')]), \
+                mock.patch('sql.refresh_timestamps', query('timestamps')):
+            snapshot = sql.fetch_snapshot()
+        assert snapshot == {'a': 'a', 'b': 'b', 'timestamps': ['timestamps']}
+        assert len(set(seen)) == 1
+        assert seen[0][1]
@@ -0,0 +1,146 @@
+"""Benchmark results files and comparison against a stored baseline
+
+Each suite (simulator/benchmark.py, dash/benchmark.py) writes its results
+to RESULTS_DIR as json, keyed by benchmark name, with the unit and which
+direction is better. Results are compared against BASELINE, and anything
+more than `tolerance` worse is flagged as a regression.
+"""
+
+import json
+import os
+import platform
+import time
+
+RESULTS_DIR = 'db/benchmarks'
+BASELINE = 'db/benchmark_baseline.json'
+# relative change that counts as a regression
+TOLERANCE = 0.25
+# latency changes smaller than this are noise, whatever their relative size
+MIN_SECONDS = 0.005
+
+
+def result(value, unit, better):
+    """One benchmark measurement
+
+    Args:
+      value (float): measured value
+      unit (str): e.g. 'seconds' or 'events/sec'
+      better (str): 'higher' or 'lower'
+    """
+    return {'value': value, 'unit': unit, 'better': better}
+
+
+def median_time(func, repeat=5):
+    """Median seconds `func()` takes over `repeat` calls"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return sorted(timings)[len(timings) // 2]
+
+
+def write_results(suite, results):
+    """Save a suite's results with a description of the machine
+
+    Returns:
+      str: path written
+    """
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f'{suite}.json')
+    with open(path, 'w') as f:
+        json.dump({
+            'suite': suite,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'machine': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpus': os.cpu_count(),
+            },
+            'results': results,
+        }, f, indent=2, sort_keys=True)
+    return path
+
+
+def load_baseline(path=BASELINE):
+    """Baseline results of every suite, or {} if there is none"""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def update_baseline(results, path=BASELINE):
+    """Replace the baseline of the benchmarks in `results`, keeping the rest"""
+    baseline = load_baseline(path)
+    baseline.update(results)
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """Compare results against a baseline
+
+    Returns:
+      list: (name, baseline value, value, relative change, regressed)
+        rows, one per benchmark in `results`; the baseline value and
+        change are None for benchmarks missing from the baseline
+    """
+    rows = []
+    for name, current in sorted(results.items()):
+        base = baseline.get(name)
+        if base is None or not base['value']:
+            rows.append((name, None, current['value'], None, False))
+            continue
+        change = current['value'] / base['value'] - 1
+        worse = change if current['better'] == 'lower' else -change
+        regressed = worse > tolerance
+        if current['unit'] == 'seconds' and abs(current['value'] - base['value']) < MIN_SECONDS:
+            regressed = False
+        rows.append((name, base['value'], current['value'], change, regressed))
+    return rows
+
+
+def report(rows):
+    """Print a comparison table
+
+    Returns:
+      int: number of regressions
+    """
+    width = max([len(row[0]) for row in rows] + [9])
+    print(f"{'benchmark':<{width}}  {'baseline':>12}  {'current':>12}  {'change':>8}")
+    for name, base, value, change, regressed in rows:
+        base = '-' if base is None else f'{base:.4g}'
+        change = '' if change is None else f'{change:+.0%}'
+        flag = '  REGRESSION' if regressed else ''
+        print(f"{name:<{width}}  {base:>12}  {value:>12.4g}  {change:>8}{flag}")
+    return sum(row[4] for row in rows)
+
+
+def add_arguments(parser):
+    """Options every suite takes"""
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help='relative slowdown that counts as a regression')
+    parser.add_argument('--update-baseline', action='store_true',
+                        help='store these results as the new baseline')
+
+
+def finish(suite, results, args):
+    """Write, compare and optionally store a suite's results
+
+    Returns:
+      int: exit code, 1 if anything regressed
+    """
+    path = write_results(suite, results)
+    regressions = report(compare(results, load_baseline(args.baseline), args.tolerance))
+    print(f"Wrote {len(results)} results to {path}")
+    if args.update_baseline:
+        update_baseline(results, args.baseline)
+        print(f"Updated baseline {args.baseline}")
+        return 0
+    if regressions:
+        print(f"{regressions} regressions against {args.baseline}")
+        return 1
+    return 0
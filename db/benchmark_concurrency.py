@@ -0,0 +1,147 @@
+"""Benchmark one writer and many readers sharing the CSS database
+
+The writer inserts and updates orders in batches the way the simulator
+does, while each reader process runs dashboard-style queries in a loop.
+Runs against a scratch copy of the schema, never the real database.
+
+Usage:
+  python -m db.benchmark_concurrency --readers 8 --seconds 10
+  python -m db.benchmark_concurrency --journal-mode delete  # without WAL
+"""
+
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import time
+
+from db.connection import (
+    connect,
+    execute_sql,
+)
+from db.migrations.migrate import migrate
+
+WRITE_SQL = [
+    "INSERT INTO orders (id, status, received_at, service, total_price) VALUES (?, 'Queued', ?, 'Bench', 10);",
+    "UPDATE orders SET started_at = ?, status = 'In Progress' WHERE id = ?;",
+    "UPDATE orders SET completed_at = ?, status = 'Completed' WHERE id = ?;",
+]
+
+READ_SQL = [
+    "SELECT max(completed_at) FROM orders;",
+    "SELECT status, cnt FROM rollup_orders_by_status ORDER BY status;",
+    """
+    SELECT AVG(completed_at - received_at) / 60
+    FROM orders
+    WHERE id in (
+        SELECT id FROM orders WHERE status = 'Completed' ORDER BY completed_at DESC LIMIT 50
+    );
+    """,
+]
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not values:
+        return None
+    return values[max(int(-(-pct * len(values) // 100)), 1) - 1]
+
+
+def run_writer(database, journal_mode, batch_size, stop, results):
+    conn = connect(database)
+    conn.execute(f"PRAGMA journal_mode = {journal_mode};")
+    cur = conn.cursor()
+    order_id, commits, errors = 0, 0, 0
+    while not stop.is_set():
+        ids = range(order_id + 1, order_id + batch_size + 1)
+        try:
+            with conn:
+                execute_sql(WRITE_SQL[0], cur, [(i, i) for i in ids], many=True)
+                execute_sql(WRITE_SQL[1], cur, [(i + 1, i) for i in ids], many=True)
+                execute_sql(WRITE_SQL[2], cur, [(i + 2, i) for i in ids], many=True)
+        except sqlite3.OperationalError:
+            errors += 1
+            continue
+        order_id += batch_size
+        commits += 1
+    results.put(('writer', commits, order_id * len(WRITE_SQL), errors))
+
+
+def run_reader(database, stop, results):
+    conn = connect(database, readonly=True)
+    latencies, errors = [], 0
+    while not stop.is_set():
+        for sql in READ_SQL:
+            start = time.perf_counter()
+            try:
+                conn.execute(sql).fetchall()
+            except sqlite3.OperationalError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+    results.put(('reader', latencies, errors))
+
+
+def run_benchmark(readers=4, seconds=5, journal_mode='wal', batch_size=100, database=None):
+    """Run one writer and `readers` reader processes for `seconds`
+
+    Returns:
+      dict: throughput and read latency summary
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        database = database or os.path.join(tmpdir, 'bench.db')
+        setup = connect(database)
+        setup.execute(f"PRAGMA journal_mode = {journal_mode};")
+        migrate(setup.cursor())
+        setup.close()
+
+        stop = multiprocessing.Event()
+        results = multiprocessing.Queue()
+        procs = [multiprocessing.Process(
+            target=run_writer, args=(database, journal_mode, batch_size, stop, results)
+        )] + [
+            multiprocessing.Process(target=run_reader, args=(database, stop, results))
+            for _ in range(readers)
+        ]
+        for proc in procs:
+            proc.start()
+        time.sleep(seconds)
+        stop.set()
+        collected = [results.get() for _ in procs]
+        for proc in procs:
+            proc.join()
+
+    _, commits, statements, write_errors = next(r for r in collected if r[0] == 'writer')
+    latencies = sorted(l for r in collected if r[0] == 'reader' for l in r[1])
+    read_errors = sum(r[2] for r in collected if r[0] == 'reader')
+    return {
+        'journal_mode': journal_mode,
+        'readers': readers,
+        'write_commits_per_sec': commits / seconds,
+        'write_statements_per_sec': statements / seconds,
+        'write_errors': write_errors,
+        'reads_per_sec': len(latencies) / seconds,
+        'read_p50_ms': 1000 * (percentile(latencies, 50) or 0),
+        'read_p99_ms': 1000 * (percentile(latencies, 99) or 0),
+        'read_max_ms': 1000 * (latencies[-1] if latencies else 0),
+        'read_errors': read_errors,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--journal-mode', default='wal', choices=['wal', 'delete'])
+    parser.add_argument('--batch-size', type=int, default=100,
+                        help='orders per write transaction')
+    args = parser.parse_args()
+    summary = run_benchmark(
+        readers=args.readers,
+        seconds=args.seconds,
+        journal_mode=args.journal_mode,
+        batch_size=args.batch_size,
+    )
+    for key, value in summary.items():
+        print(f"{key:>26}: {value:.3f}" if isinstance(value, float) else f"{key:>26}: {value}")
@@ -1,51 +1,132 @@
 from contextlib import contextmanager
 import logging
+import os
 import sqlite3
+import threading
 
 CSS_DATABASE = 'db/css.db'
 log = logging.getLogger(__name__)
 
+# WAL lets the dashboard read while the simulator writes; with WAL,
+# synchronous=NORMAL only syncs at checkpoints and is still crash-safe
+WRITER_PRAGMAS = [
+    "PRAGMA journal_mode = WAL;",
+    "PRAGMA synchronous = NORMAL;",
+]
+CONNECTION_PRAGMAS = [
+    "PRAGMA cache_size = -16000;", # KiB
+    "PRAGMA temp_store = MEMORY;",
+]
+# prepared statements kept per connection
+CACHED_STATEMENTS = 256
+# seconds to wait on a lock before giving up
+BUSY_TIMEOUT = 10
+
+# persistent connections, one set per thread
+_local = threading.local()
+
+
+def connect(database=None, readonly=False):
+    """Open a new tuned connection to the CSS database
+
+    Connections may be handed between threads, but callers must not use
+    one from two threads at the same time.
+
+    Args:
+      database (str): path to the database; defaults to CSS_DATABASE
+      readonly (bool): open the database read-only
+    """
+    database = database or CSS_DATABASE
+    if readonly:
+        conn = sqlite3.connect(
+            f'file:{database}?mode=ro',
+            uri=True,
+            timeout=BUSY_TIMEOUT,
+            check_same_thread=False,
+            cached_statements=CACHED_STATEMENTS,
+        )
+    else:
+        conn = sqlite3.connect(
+            database,
+            timeout=BUSY_TIMEOUT,
+            check_same_thread=False,
+            cached_statements=CACHED_STATEMENTS,
+        )
+        for pragma in WRITER_PRAGMAS:
+            conn.execute(pragma)
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def get_connection(readonly=False, database=None):
+    """Persistent connection for the current thread and process
+
+    The connection is opened on first use and reused by every later call
+    from the same thread, so callers should not close it.
+
+    Args:
+      readonly (bool): use a read-only connection
+      database (str): path to the database; defaults to CSS_DATABASE
+    """
+    # a forked child must not reuse its parent's connections
+    key = (os.getpid(), database or CSS_DATABASE, readonly)
+    connections = _local.__dict__.setdefault('connections', {})
+    if key not in connections:
+        connections[key] = connect(database=database, readonly=readonly)
+    return connections[key]
+
+
+def close_connections():
+    """Close the current thread's persistent connections"""
+    connections = _local.__dict__.get('connections', {})
+    while connections:
+        _, conn = connections.popitem()
+        conn.close()
+
+
 @contextmanager
-def css_cursor():
-    """Callable cursor that connects to the CSS database
+def css_cursor(readonly=False, database=None):
+    """Callable cursor on the thread's persistent CSS database connection
 
     Commits (only) after all statements with the open cursor have been
-    successfully executed, then closes the connection
+    successfully executed, then closes the cursor
     """
-    conn = sqlite3.connect(CSS_DATABASE)
+    conn = get_connection(readonly=readonly, database=database)
     cur = conn.cursor()
     try:
         yield cur
     finally:
         conn.commit()
         cur.close()
-        conn.close()
 
 @contextmanager
-def css_connection():
-    """Callable connection to the CSS database"""
-    conn = sqlite3.connect(CSS_DATABASE)
-    try:
-        yield conn
-    finally:
-        conn.close()
+def css_connection(readonly=False, database=None):
+    """Callable persistent connection to the CSS database"""
+    yield get_connection(readonly=readonly, database=database)
 
 
-def execute_sql(sql, cur, runtime_values=None, verbose=False):
+def execute_sql(sql, cur, runtime_values=None, verbose=False, many=False):
     """Execute SQL statement in sqlite and log
 
+    Statements are prepared once per connection and reused, so pass values
+    as bindings rather than formatting them into the SQL.
+
     Args:
       sql (str): sql statment to be executed
       cur (cursor): open cursor
-      runtime_values (tuple): values to bind
+      runtime_values (tuple): values to bind, or a list of tuples if `many`
       verbose (bool): whether to log the SQL or not
+      many (bool): execute once per tuple in `runtime_values`
     """
     log_msg = f"Executing SQL: {sql}"
     if runtime_values:
         log_msg += f" with bindings {runtime_values}"
     if verbose:
         log.info(log_msg)
-    if runtime_values:
+    if many:
+        cur.executemany(sql, runtime_values)
+    elif runtime_values:
         cur.execute(sql, runtime_values)
     else:
         cur.execute(sql)
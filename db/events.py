@@ -0,0 +1,144 @@
+"""Order lifecycle events pushed from the simulator to the dashboard
+
+The simulator publishes events as datagrams on a Unix socket next to the
+database, which both containers already share. Datagrams are fire and
+forget: if the dashboard isn't listening they are dropped and the
+dashboard falls back to polling.
+"""
+
+import json
+import logging
+import os
+import socket
+import threading
+
+EVENTS_SOCKET = 'db/events.sock'
+# keeps each datagram well under the socket's send buffer
+MAX_EVENTS_PER_MESSAGE = 200
+log = logging.getLogger(__name__)
+
+
+class EventPublisher(object):
+    """Send order events to whoever is listening on `path`
+
+    Args:
+      path (str): path to the listener's socket
+    """
+    def __init__(self, path=EVENTS_SOCKET):
+        self.path = path
+        self.sent = 0
+        self.dropped = 0
+        self._sock = None
+
+    def publish(self, events):
+        """Send events without blocking
+
+        Args:
+          events (list): (event, order id, simulation time) tuples
+        """
+        if self._sock is None:
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._sock.setblocking(False)
+        for start in range(0, len(events), MAX_EVENTS_PER_MESSAGE):
+            chunk = events[start:start + MAX_EVENTS_PER_MESSAGE]
+            try:
+                self._sock.sendto(json.dumps(chunk).encode(), self.path)
+                self.sent += len(chunk)
+            except OSError:
+                # nobody listening, or the listener is falling behind
+                self.dropped += len(chunk)
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+
+class EventListener(object):
+    """Receive published events on a background thread
+
+    Events are folded into a running summary rather than queued, so any
+    number of waiters can follow along and a slow waiter just sees several
+    messages' worth of changes at once.
+
+    Args:
+      path (str): path to bind the socket to
+    """
+    def __init__(self, path=EVENTS_SOCKET):
+        self.path = path
+        self.seq = 0
+        # count of each kind of event, and the latest simulation time
+        self.summary = {'sim_time': None}
+        self._cond = threading.Condition()
+        self._sock = None
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Bind the socket and start receiving in the background"""
+        if self._thread is not None:
+            return
+        # a previous run may have left its socket file behind
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.bind(self.path)
+        # wake up now and then to notice stop()
+        self._sock.settimeout(0.5)
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._receive, daemon=True)
+        self._thread.start()
+
+    def _receive(self):
+        while not self._stopped.is_set():
+            try:
+                message = self._sock.recv(65536)
+            except socket.timeout:
+                continue
+            try:
+                events = json.loads(message)
+            except ValueError:
+                log.warning("Ignoring malformed event message")
+                continue
+            self.handle(events)
+
+    def handle(self, events):
+        """Fold a batch of events into the summary and wake waiters
+
+        Args:
+          events (list): (event, order id, simulation time) lists
+        """
+        with self._cond:
+            for event, _, sim_time in events:
+                self.summary[event] = self.summary.get(event, 0) + 1
+                self.summary['sim_time'] = max(self.summary['sim_time'] or sim_time, sim_time)
+            self.seq += 1
+            self._cond.notify_all()
+
+    def wait(self, seq, timeout=None):
+        """Block until something newer than `seq` arrives
+
+        Args:
+          seq (int): the last sequence number the caller has seen
+          timeout (float): max seconds to wait
+
+        Returns:
+          tuple: the new sequence number and a copy of the summary, or
+            (`seq`, None) on timeout
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.seq != seq, timeout):
+                return seq, None
+            return self.seq, dict(self.summary, seq=self.seq)
+
+    def stop(self):
+        """Stop receiving and remove the socket file"""
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._thread.join()
+        self._thread = None
+        self._sock.close()
+        self._sock = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
@@ -0,0 +1,160 @@
+"""Export the order event log to a compact columnar file
+
+Large runs produce millions of events, which are slow to analyze straight
+out of SQLite. The export stores each column as its own compressed block
+of fixed-width values, with text columns dictionary-encoded, so a column
+can be loaded without touching the others (e.g. with `numpy.frombuffer`).
+Rows are written in groups so exporting never holds the whole log in
+memory.
+
+File layout:
+  MAGIC
+  for each row group, for each column: zlib-compressed values
+  footer: json with the columns, dictionaries and block sizes
+  footer length (8 bytes, little-endian), MAGIC
+
+Usage:
+  python -m db.export_events --output events.cols
+"""
+
+import argparse
+from array import array
+import json
+import struct
+import sys
+import zlib
+
+from db.connection import (
+    CSS_DATABASE,
+    connect,
+)
+
+MAGIC = b'ORDEVTS1'
+ROWS_PER_GROUP = 100000
+
+# (name, array typecode); text columns are stored as 'I' dictionary codes
+# and missing integers as -1. SQLite doesn't enforce column types, so
+# fractional values in integer columns are truncated, as times are
+# everywhere else
+COLUMNS = [
+    ('seq', 'q'),
+    ('order_id', 'q'),
+    ('event', str),
+    ('at', 'q'),
+    ('item', str),
+    ('unit', 'q'),
+    ('customer_name', str),
+    ('service', str),
+    ('total_price', 'd'),
+    ('items', str),
+]
+MISSING = {'q': -1, 'd': float('nan')}
+
+
+def _encode(values, typecode, dictionary):
+    if typecode is str:
+        codes = array('I')
+        for value in values:
+            code = dictionary.get(value)
+            if code is None:
+                code = dictionary[value] = len(dictionary)
+            codes.append(code)
+        return codes
+    missing = MISSING[typecode]
+    convert = int if typecode == 'q' else float
+    return array(typecode, (missing if v is None else convert(v) for v in values))
+
+
+def export_events(database=CSS_DATABASE, output=None, rows_per_group=ROWS_PER_GROUP):
+    """Write every event in `database` to the columnar file `output`
+
+    Args:
+      database (str): path to the database to export
+      output (str): path of the file to write
+      rows_per_group (int): rows compressed together per column
+
+    Returns:
+      int: number of events written
+    """
+    conn = connect(database, readonly=True)
+    names = [name for name, _ in COLUMNS]
+    dictionaries = {name: {} for name, typecode in COLUMNS if typecode is str}
+    groups = []
+    total = 0
+    with open(output, 'wb') as f:
+        f.write(MAGIC)
+        cur = conn.execute(f"SELECT {', '.join(names)} FROM order_events ORDER BY seq;")
+        while True:
+            rows = cur.fetchmany(rows_per_group)
+            if not rows:
+                break
+            sizes = []
+            for idx, (name, typecode) in enumerate(COLUMNS):
+                values = _encode((row[idx] for row in rows), typecode, dictionaries.get(name))
+                block = zlib.compress(values.tobytes(), 6)
+                f.write(block)
+                sizes.append(len(block))
+            groups.append({'rows': len(rows), 'sizes': sizes})
+            total += len(rows)
+
+        footer = json.dumps({
+            'columns': [
+                [name, 'I' if typecode is str else typecode] for name, typecode in COLUMNS
+            ],
+            # codes are positions in these lists
+            'dictionaries': {name: list(d) for name, d in dictionaries.items()},
+            'byteorder': sys.byteorder,
+            'groups': groups,
+        }).encode()
+        f.write(footer)
+        f.write(struct.pack('<Q', len(footer)))
+        f.write(MAGIC)
+    conn.close()
+    return total
+
+
+def read_events(path, columns=None):
+    """Load columns of an exported event log
+
+    Args:
+      path (str): file written by `export_events`
+      columns (list): names of the columns to load; all of them if None
+
+    Returns:
+      dict: column name to values; text columns as lists of strings,
+        the rest as `array.array`s
+    """
+    with open(path, 'rb') as f:
+        f.seek(-8 - len(MAGIC), 2)
+        footer_size, = struct.unpack('<Q', f.read(8))
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not an exported event log")
+        f.seek(-8 - len(MAGIC) - footer_size, 2)
+        footer = json.loads(f.read(footer_size))
+        wanted = columns or [name for name, _ in footer['columns']]
+
+        result = {name: array(typecode) for name, typecode in footer['columns'] if name in wanted}
+        offset = len(MAGIC)
+        for group in footer['groups']:
+            for (name, _), size in zip(footer['columns'], group['sizes']):
+                if name in result:
+                    f.seek(offset)
+                    values = result[name]
+                    values.frombytes(zlib.decompress(f.read(size)))
+                offset += size
+
+    for name, values in result.items():
+        if footer['byteorder'] != sys.byteorder:
+            values.byteswap()
+        if name in footer['dictionaries']:
+            dictionary = footer['dictionaries'][name]
+            result[name] = [dictionary[code] for code in values]
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--database', default=CSS_DATABASE)
+    parser.add_argument('--output', required=True)
+    args = parser.parse_args()
+    print(f"Exported {export_events(args.database, args.output)} events to {args.output}")
@@ -0,0 +1,329 @@
+"""Counters, gauges and latency histograms in the Prometheus text format
+
+Each process records into its own `registry`. The simulator writes a
+snapshot of its registry to METRICS_DIR every METRICS_INTERVAL seconds,
+and the dashboard's /metrics route renders its own registry together with
+those snapshots, so one scrape covers both services.
+
+Usage:
+  flushes = registry.histogram('db_call_seconds', 'Time spent in db calls', ['call'])
+  with flushes.time(call='flush'):
+      ...
+"""
+
+from bisect import bisect_left
+from contextlib import contextmanager
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+METRICS_DIR = 'db/metrics'
+# upper bounds in seconds of the latency histogram buckets
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Metric(object):
+    """One metric family, with a value per combination of label values
+
+    Args:
+      name (str): metric name
+      help (str): one line description
+      labels (list): names of the labels values are recorded under
+    """
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        # functions sampled for their value whenever the registry is read
+        self.functions = {}
+        self._lock = threading.Lock()
+
+    def key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} takes labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def track(self, function, **labels):
+        """Take the value from `function` each time the metric is read"""
+        with self._lock:
+            self.functions[self.key(labels)] = function
+
+    def clear(self):
+        """Forget every value and tracked function, e.g. of a previous run"""
+        with self._lock:
+            self.values.clear()
+            self.functions.clear()
+
+    def samples(self):
+        """[labels, value] pairs"""
+        with self._lock:
+            values = dict(self.values)
+            functions = dict(self.functions)
+        for key, function in functions.items():
+            try:
+                values[key] = function()
+            except Exception:
+                log.exception(f"Failed to read {self.name}")
+        return [[dict(zip(self.labels, key)), value] for key, value in values.items()]
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self.key(labels)
+        with self._lock:
+            self.values[key] = value
+
+
+class Histogram(Metric):
+    """Distribution of observed values, e.g. latencies in seconds
+
+    Args:
+      buckets (tuple): increasing upper bounds of the buckets
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self._lock:
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = {
+                    'buckets': [0] * (len(self.buckets) + 1), 'sum': 0, 'count': 0}
+            # the last count is for values above every bound
+            counts['buckets'][bisect_left(self.buckets, value)] += 1
+            counts['sum'] += value
+            counts['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the seconds the block takes"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            return [
+                [dict(zip(self.labels, key)), {
+                    'buckets': list(counts['buckets']),
+                    'sum': counts['sum'],
+                    'count': counts['count'],
+                }]
+                for key, counts in self.values.items()
+            ]
+
+
+class Registry(object):
+    """Every metric recorded by one process
+
+    Args:
+      labels (dict): labels added to every sample, e.g. the process name
+    """
+    def __init__(self, labels=None):
+        self.labels = dict(labels or {})
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help, labels, **kwargs):
+        with self._lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, help, labels, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"{name} is already a {metric.kind}")
+            return metric
+
+    def counter(self, name, help, labels=()):
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name, help, labels=()):
+        return self._get(Gauge, name, help, labels)
+
+    def histogram(self, name, help, labels=(), buckets=BUCKETS):
+        return self._get(Histogram, name, help, labels, buckets=buckets)
+
+    def snapshot(self):
+        """JSON-serializable copy of every metric's current values"""
+        with self._lock:
+            metrics = list(self.metrics.values())
+        return {
+            'labels': self.labels,
+            'metrics': [{
+                'name': metric.name,
+                'kind': metric.kind,
+                'help': metric.help,
+                'buckets': list(getattr(metric, 'buckets', [])),
+                'samples': metric.samples(),
+            } for metric in metrics],
+        }
+
+
+# metrics of this process
+registry = Registry()
+
+# shared by the simulator's writes and the dashboard's queries
+db_call_seconds = registry.histogram(
+    'db_call_seconds', 'Seconds spent in database calls', ['call'])
+
+
+def rate_of(counter):
+    """Function giving a counter's per-second rate since it was last called
+
+    Meant for `Gauge.track`, so the rate covers the time between reads.
+    """
+    last = {'total': 0, 'at': time.monotonic()}
+    def rate():
+        total = sum(value for _, value in counter.samples())
+        now = time.monotonic()
+        elapsed = now - last['at']
+        per_second = (total - last['total']) / elapsed if elapsed > 0 else 0.0
+        last['total'], last['at'] = total, now
+        return per_second
+    return rate
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', r'\\').replace('"', r'\"'))
+        for name, value in labels.items()
+    )
+    return '{' + pairs + '}'
+
+
+def render(snapshots):
+    """Prometheus text exposition of one or more registry snapshots
+
+    Samples of the same metric from different snapshots are grouped under
+    one family, told apart by each snapshot's labels.
+    """
+    families = {}
+    for snapshot in snapshots:
+        for metric in snapshot['metrics']:
+            family = families.setdefault(metric['name'], (metric, []))
+            for labels, value in metric['samples']:
+                family[1].append(({**snapshot['labels'], **labels}, value, metric['buckets']))
+
+    lines = []
+    for name, (metric, samples) in sorted(families.items()):
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        for labels, value, buckets in samples:
+            if metric['kind'] != 'histogram':
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(list(buckets) + ['+Inf'], value['buckets']):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels({**labels, 'le': bound})} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {value['sum']}")
+            lines.append(f"{name}_count{_format_labels(labels)} {value['count']}")
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_path(name):
+    return os.path.join(METRICS_DIR, f'{name}.json')
+
+
+def write_metrics(name, metrics_registry=registry):
+    """Save a snapshot of `metrics_registry` for other processes to read"""
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = metrics_path(name)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(metrics_registry.snapshot(), f)
+    os.replace(tmp_path, path)
+
+
+def clear_metrics(prefix='simulator'):
+    """Delete the snapshots saved under names starting with `prefix`
+
+    Snapshots outlive the process that wrote them, so a run clears those
+    of earlier runs, e.g. kitchens of a previous fleet, before writing
+    its own.
+    """
+    for path in glob.glob(metrics_path(f'{prefix}*')):
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+
+
+def read_metrics():
+    """Snapshots saved by other processes"""
+    snapshots = []
+    for path in sorted(glob.glob(metrics_path('*'))):
+        try:
+            with open(path) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            # being replaced, or left behind half-written
+            continue
+    return snapshots
+
+
+class MetricsReporter(object):
+    """Write a registry's snapshot every `interval` seconds in the background
+
+    Args:
+      name (str): name the snapshot is saved under
+      interval (float): seconds between snapshots
+      metrics_registry (Registry): registry to save
+    """
+    def __init__(self, name, interval, metrics_registry=registry):
+        self.name = name
+        self.interval = interval
+        self.registry = metrics_registry
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def _report_periodically(self):
+        while not self._stopped.wait(self.interval):
+            self.report()
+
+    def report(self):
+        try:
+            write_metrics(self.name, self.registry)
+        except OSError:
+            log.exception("Failed to write metrics")
+
+    def start(self):
+        if self._thread is not None or not self.interval:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._report_periodically, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop reporting, writing one last snapshot"""
+        if self._thread is not None:
+            self._stopped.set()
+            self._thread.join()
+            self._thread = None
+            self.report()
@@ -0,0 +1,10 @@
+"""Migration 3: change sequence for incremental reads of orders"""
+
+VERSION = 3
+
+MIGRATION_SQL = [
+    # set by every write to an order from a single increasing sequence,
+    # so readers can fetch just the rows changed since their last read
+    "ALTER TABLE orders ADD COLUMN change_seq INTEGER;",
+    "CREATE INDEX orders_change_seq ON orders (change_seq);",
+]
@@ -0,0 +1,13 @@
+"""Migration 5: latest checkpoint of a running simulation"""
+
+VERSION = 5
+
+MIGRATION_SQL = [
+    """
+    CREATE TABLE checkpoints (
+      id               INTEGER  PRIMARY KEY --only ever 1
+    , event_seq        INTEGER --last event logged before the checkpoint
+    , state            TEXT --json
+    );
+    """,
+]
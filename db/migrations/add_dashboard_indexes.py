@@ -0,0 +1,15 @@
+"""Migration 2: indexes matching the dashboard's query patterns"""
+
+VERSION = 2
+
+MIGRATION_SQL = [
+    # recent_order_times: latest completed orders
+    "CREATE INDEX orders_status_completed_at ON orders (status, completed_at);",
+    # recent_order_times and max_timestamp: max(completed_at)
+    "CREATE INDEX orders_completed_at ON orders (completed_at);",
+    # max_timestamp: max(started_at)
+    "CREATE INDEX orders_started_at ON orders (started_at);",
+    # all_timestamps reads just these columns, and max_timestamp needs
+    # max(received_at), so one covering index serves both
+    "CREATE INDEX orders_timestamps ON orders (received_at, started_at, completed_at);",
+]
@@ -0,0 +1,61 @@
+"""Migration 4: append-only log of order events
+
+The simulator only appends to `order_events`. Triggers project each event
+onto `orders`, which stays the current state of every order (and, through
+its own triggers, keeps the rollups up to date) for the dashboard.
+"""
+
+VERSION = 4
+
+UP_SQL = """
+CREATE TABLE order_events (
+  seq              INTEGER  PRIMARY KEY --append order
+, order_id         INTEGER  NOT NULL
+, event            TEXT  NOT NULL --one of {received, item_started, item_completed, order_completed}
+, at               INTEGER  NOT NULL --epochs
+, item             TEXT --item events only
+, unit             INTEGER --item events only; position of the unit within its order
+, customer_name    TEXT --received only
+, service          TEXT --received only
+, total_price      INTEGER --received only
+, items            TEXT --received only; json
+);
+"""
+
+# the event's seq doubles as the order's change sequence
+PROJECTION_TRIGGERS_SQL = [
+    """
+    CREATE TRIGGER order_events_received AFTER INSERT ON order_events
+    WHEN NEW.event = 'received'
+    BEGIN
+      INSERT INTO orders (id, status, received_at, customer_name, service, total_price, items, change_seq)
+      VALUES (NEW.order_id, 'Queued', NEW.at, NEW.customer_name, NEW.service, NEW.total_price, NEW.items, NEW.seq);
+    END;
+    """,
+    # an order starts with its first item
+    """
+    CREATE TRIGGER order_events_item_started AFTER INSERT ON order_events
+    WHEN NEW.event = 'item_started'
+    BEGIN
+      UPDATE orders
+      SET started_at = NEW.at
+      , status = 'In Progress'
+      , change_seq = NEW.seq
+      WHERE id = NEW.order_id
+      AND started_at IS NULL;
+    END;
+    """,
+    """
+    CREATE TRIGGER order_events_order_completed AFTER INSERT ON order_events
+    WHEN NEW.event = 'order_completed'
+    BEGIN
+      UPDATE orders
+      SET completed_at = NEW.at
+      , status = 'Completed'
+      , change_seq = NEW.seq
+      WHERE id = NEW.order_id;
+    END;
+    """,
+]
+
+MIGRATION_SQL = [UP_SQL] + PROJECTION_TRIGGERS_SQL
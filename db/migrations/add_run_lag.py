@@ -0,0 +1,17 @@
+"""Migration 6: how far a real-time run is behind the wall clock"""
+
+VERSION = 6
+
+MIGRATION_SQL = [
+    # one row per check of a real-time run's lag, see simulator/pacing.py
+    """
+    CREATE TABLE run_lag (
+      seq              INTEGER  PRIMARY KEY
+    , at               REAL --simulation time of the check
+    , checked_at       REAL --wall time (epoch) of the check
+    , lag              REAL --wall seconds behind schedule
+    , speed            REAL --speed the run is going at after the check
+    , coalesced        INTEGER --whether database writes are being coalesced
+    );
+    """,
+]
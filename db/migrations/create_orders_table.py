@@ -1,11 +1,6 @@
-#! /usr/bin python
+"""Migration 1: orders table and the dashboard's rollup tables"""
 
-import sys
-
-from db.connection import (
-    execute_sql,
-    css_cursor,
-)
+VERSION = 1
 
 UP_SQL = """
 CREATE TABLE orders (
@@ -21,15 +16,107 @@ CREATE TABLE orders (
 );
 """
 
-DOWN_SQL = """
-DROP TABLE IF EXISTS orders;
-"""
+# dashboard aggregates, kept up to date by triggers on orders so the
+# dashboard reads a handful of rows instead of scanning every order
+DOW = "cast(strftime('%w', {t}.received_at - 8*60*60, 'unixepoch') as int)"
+HOUR = "cast(strftime('%H', {t}.received_at - 8*60*60, 'unixepoch') as int)"
+TIME_OF_DAY = f"""CASE
+    WHEN {HOUR} BETWEEN 5 AND 10 THEN 'Breakfast'
+    WHEN {HOUR} BETWEEN 11 AND 15 THEN 'Lunch'
+    WHEN {HOUR} BETWEEN 16 AND 22 THEN 'Dinner'
+    ELSE 'Late Night'
+    END"""
+
+ROLLUP_TABLES_SQL = [
+    """
+    CREATE TABLE rollup_spend_by_day_and_service (
+      service          TEXT
+    , dow              INTEGER --0 is Sunday, PST
+    , cnt              INTEGER
+    , total_spent      INTEGER
+    , PRIMARY KEY (service, dow)
+    );
+    """,
+    """
+    CREATE TABLE rollup_spend_by_time_of_day (
+      time_of_day      TEXT  PRIMARY KEY --one of {Breakfast, Lunch, Dinner, Late Night}
+    , cnt              INTEGER
+    , total_spent      INTEGER
+    );
+    """,
+    """
+    CREATE TABLE rollup_orders_by_status (
+      status           TEXT  PRIMARY KEY
+    , cnt              INTEGER
+    );
+    """,
+    """
+    CREATE TABLE rollup_total_spend (
+      id               INTEGER  PRIMARY KEY CHECK (id = 1) --single row
+    , cnt              INTEGER
+    , total_spent      INTEGER
+    );
+    """,
+]
+
+
+def _add_to_rollups(t, sign):
+    """Statements adding (sign=1) or removing (sign=-1) an order's row"""
+    dow, time_of_day = DOW.format(t=t), TIME_OF_DAY.format(t=t)
+    return f"""
+    INSERT OR IGNORE INTO rollup_spend_by_day_and_service VALUES ({t}.service, {dow}, 0, 0);
+    UPDATE rollup_spend_by_day_and_service
+    SET cnt = cnt + {sign}, total_spent = total_spent + {sign} * {t}.total_price
+    WHERE service IS {t}.service AND dow IS {dow};
+
+    INSERT OR IGNORE INTO rollup_spend_by_time_of_day VALUES ({time_of_day}, 0, 0);
+    UPDATE rollup_spend_by_time_of_day
+    SET cnt = cnt + {sign}, total_spent = total_spent + {sign} * {t}.total_price
+    WHERE time_of_day = {time_of_day};
+
+    INSERT OR IGNORE INTO rollup_total_spend VALUES (1, 0, 0);
+    UPDATE rollup_total_spend
+    SET cnt = cnt + {sign}, total_spent = total_spent + {sign} * {t}.total_price;
+    """
+
+
+def _add_to_status_rollup(t, sign):
+    return f"""
+    INSERT OR IGNORE INTO rollup_orders_by_status VALUES ({t}.status, 0);
+    UPDATE rollup_orders_by_status SET cnt = cnt + {sign} WHERE status IS {t}.status;
+    """
+
 
-def recreate_orders_table():
-    """Drop and recreate orders table"""
-    with css_cursor() as cur:
-        execute_sql(DOWN_SQL, cur, verbose=True)
-        execute_sql(UP_SQL, cur, verbose=True)
+ROLLUP_TRIGGERS_SQL = [
+    f"""
+    CREATE TRIGGER rollup_order_inserted AFTER INSERT ON orders
+    BEGIN
+    {_add_to_rollups('NEW', 1)}
+    {_add_to_status_rollup('NEW', 1)}
+    END;
+    """,
+    f"""
+    CREATE TRIGGER rollup_order_deleted AFTER DELETE ON orders
+    BEGIN
+    {_add_to_rollups('OLD', -1)}
+    {_add_to_status_rollup('OLD', -1)}
+    END;
+    """,
+    f"""
+    CREATE TRIGGER rollup_order_status_changed AFTER UPDATE OF status ON orders
+    WHEN OLD.status IS NOT NEW.status
+    BEGIN
+    {_add_to_status_rollup('OLD', -1)}
+    {_add_to_status_rollup('NEW', 1)}
+    END;
+    """,
+    f"""
+    CREATE TRIGGER rollup_order_changed AFTER UPDATE OF service, received_at, total_price ON orders
+    BEGIN
+    {_add_to_rollups('OLD', -1)}
+    {_add_to_rollups('NEW', 1)}
+    END;
+    """,
+]
 
-if __name__ == '__main__':
-    run_migration()
+MIGRATION_SQL = [UP_SQL] + ROLLUP_TABLES_SQL + ROLLUP_TRIGGERS_SQL
@@ -0,0 +1,119 @@
+#! /usr/bin python
+"""Versioned schema migrations for the CSS database
+
+Each migration module defines a `VERSION` and a list of statements in
+`MIGRATION_SQL`. The version of the last migration applied is stored in
+the database's `user_version` pragma, so running the migrations again
+only applies new ones and existing data is kept.
+
+Usage:
+  python -m db.migrations.migrate             # apply pending migrations
+  python -m db.migrations.migrate --recreate  # wipe and rebuild the schema
+"""
+
+import argparse
+import logging
+
+from db.connection import (
+    execute_sql,
+    css_cursor,
+)
+from db.migrations import (
+    add_change_seq,
+    add_checkpoints,
+    add_dashboard_indexes,
+    add_order_events,
+    add_run_lag,
+    create_orders_table,
+    project_orders_in_batches,
+)
+
+log = logging.getLogger(__name__)
+
+# in the order they must be applied
+MIGRATIONS = [
+    create_orders_table,
+    add_dashboard_indexes,
+    add_change_seq,
+    add_order_events,
+    add_checkpoints,
+    add_run_lag,
+    project_orders_in_batches,
+]
+
+LATEST_VERSION = MIGRATIONS[-1].VERSION
+
+
+def schema_version(cur):
+    """Version of the last migration applied to the database"""
+    cur.execute("PRAGMA user_version;")
+    return cur.fetchone()[0]
+
+
+def migrate(cur, target=LATEST_VERSION, verbose=False):
+    """Apply every migration newer than the database's schema version
+
+    Each migration runs in its own transaction together with the version
+    bump, so a failed migration leaves the database at the previous version.
+
+    Args:
+      cur (cursor): open cursor with no transaction in progress
+      target (int): version to migrate up to
+      verbose (bool): whether to log the SQL or not
+
+    Returns:
+      int: the schema version after migrating
+    """
+    version = schema_version(cur)
+    for migration in MIGRATIONS:
+        if not version < migration.VERSION <= target:
+            continue
+        log.info(f"Applying migration {migration.VERSION}: {migration.__name__}")
+        cur.execute("BEGIN;")
+        try:
+            for sql in migration.MIGRATION_SQL:
+                execute_sql(sql, cur, verbose=verbose)
+            execute_sql(f"PRAGMA user_version = {migration.VERSION};", cur)
+        except Exception:
+            cur.execute("ROLLBACK;")
+            raise
+        cur.execute("COMMIT;")
+        version = migration.VERSION
+    return version
+
+
+def drop_schema(cur):
+    """Drop every table (and with them, their indexes and triggers)"""
+    cur.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%';")
+    for name, in cur.fetchall():
+        execute_sql(f'DROP TABLE IF EXISTS "{name}";', cur, verbose=True)
+    execute_sql("PRAGMA user_version = 0;", cur)
+
+
+def recreate_orders_table(database=None):
+    """Drop all data and rebuild the schema at the latest version
+
+    Args:
+      database (str): path to the database; defaults to CSS_DATABASE
+    """
+    with css_cursor(database=database) as cur:
+        drop_schema(cur)
+        migrate(cur, verbose=True)
+
+
+def run_migrations():
+    """Bring an existing database up to the latest version, keeping its data"""
+    with css_cursor() as cur:
+        return migrate(cur, verbose=True)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--recreate', action='store_true',
+                        help='drop all data and rebuild the schema')
+    args = parser.parse_args()
+    if args.recreate:
+        recreate_orders_table()
+    else:
+        run_migrations()
@@ -0,0 +1,27 @@
+"""Migration 7: project order events onto orders once per batch
+
+The triggers from migration 4 updated `orders` in place for every event
+appended. Instead, each batch of events is now projected in one go by
+the statements in db/projection.py, run at the end of the batch's
+transaction, so an order's row is written at most once per status it
+reaches in a batch. `order_projection` records the last event projected;
+events already in the log were projected by the triggers.
+"""
+
+VERSION = 7
+
+MIGRATION_SQL = [
+    "DROP TRIGGER order_events_received;",
+    "DROP TRIGGER order_events_item_started;",
+    "DROP TRIGGER order_events_order_completed;",
+    """
+    CREATE TABLE order_projection (
+      id               INTEGER  PRIMARY KEY --only ever 1
+    , event_seq        INTEGER  NOT NULL --last event projected onto orders
+    );
+    """,
+    """
+    INSERT INTO order_projection (id, event_seq)
+    SELECT 1, coalesce(max(seq), 0) FROM order_events;
+    """,
+]
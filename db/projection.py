@@ -0,0 +1,72 @@
+"""Derive the orders table from the order event log in batches
+
+`PROJECT_ORDERS_SQL` brings `orders` up to date with every event appended
+since the last projection. Writers of order events run it at the end of
+each flush (see `BatchWriter`'s `after_flush`), in the same transaction
+as the events, so readers never see one without the other. Each order is
+inserted once and updated once per status it reaches in the batch, with
+the `change_seq` of the event that got it there, and the rollup triggers
+on `orders` fire once per update rather than once per event.
+"""
+
+# events not yet projected
+NEW_EVENTS = "seq > (SELECT event_seq FROM order_projection WHERE id = 1)"
+
+PROJECT_ORDERS_SQL = [
+    f"""
+    INSERT INTO orders (id, status, received_at, customer_name, service, total_price, items, change_seq)
+    SELECT order_id, 'Queued', at, customer_name, service, total_price, items, seq
+    FROM order_events
+    WHERE {NEW_EVENTS}
+    AND event = 'received'
+    ORDER BY seq;
+    """,
+    # when each order of the batch started (with its first item) and
+    # completed. UPDATE ... FROM needs SQLite 3.33 and the images ship
+    # 3.27, so the updates look each order up in this per-connection table
+    """
+    CREATE TEMP TABLE IF NOT EXISTS order_changes (
+      order_id         INTEGER  PRIMARY KEY
+    , started_at       INTEGER
+    , started_seq      INTEGER
+    , completed_at     INTEGER
+    , completed_seq    INTEGER
+    );
+    """,
+    "DELETE FROM order_changes;",
+    f"""
+    INSERT INTO order_changes
+    SELECT
+      order_id
+    , min(CASE WHEN event = 'item_started' THEN at END)
+    , min(CASE WHEN event = 'item_started' THEN seq END)
+    , max(CASE WHEN event = 'order_completed' THEN at END)
+    , max(CASE WHEN event = 'order_completed' THEN seq END)
+    FROM order_events
+    WHERE {NEW_EVENTS}
+    AND event IN ('item_started', 'order_completed')
+    GROUP BY order_id;
+    """,
+    """
+    UPDATE orders
+    SET (started_at, change_seq) = (
+        SELECT started_at, started_seq FROM order_changes WHERE order_id = orders.id
+    )
+    , status = 'In Progress'
+    WHERE started_at IS NULL
+    AND id IN (SELECT order_id FROM order_changes WHERE started_at IS NOT NULL);
+    """,
+    """
+    UPDATE orders
+    SET (completed_at, change_seq) = (
+        SELECT completed_at, completed_seq FROM order_changes WHERE order_id = orders.id
+    )
+    , status = 'Completed'
+    WHERE id IN (SELECT order_id FROM order_changes WHERE completed_at IS NOT NULL);
+    """,
+    """
+    UPDATE order_projection
+    SET event_seq = (SELECT coalesce(max(seq), 0) FROM order_events)
+    WHERE id = 1;
+    """,
+]
@@ -0,0 +1,50 @@
+"""Where each kitchen of a sharded fleet keeps its orders
+
+A fleet run gives every kitchen its own database, so kitchens never
+contend for SQLite's write lock, and lists them in a manifest that the
+dashboard reads to find them. Without a manifest there is just the one
+kitchen writing to CSS_DATABASE.
+"""
+
+import json
+import os
+
+FLEET_MANIFEST = 'db/fleet.json'
+
+
+def shard_database(kitchen):
+    """Path to the database of one kitchen
+
+    Args:
+      kitchen (str): kitchen name
+    """
+    return f'db/kitchen_{kitchen}.db'
+
+
+def write_manifest(kitchens, path=FLEET_MANIFEST):
+    """Record the kitchens of a fleet run
+
+    Written to a temporary file first so readers never see half of it.
+
+    Args:
+      kitchens (list): dicts with at least `kitchen` and `database` keys
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'kitchens': kitchens}, f)
+    os.replace(tmp_path, path)
+
+
+def read_manifest(path=FLEET_MANIFEST):
+    """Kitchens of the last fleet run, or an empty list if there is none"""
+    try:
+        with open(path) as f:
+            return json.load(f)['kitchens']
+    except (OSError, ValueError, KeyError):
+        return []
+
+
+def clear_manifest(path=FLEET_MANIFEST):
+    """Go back to a single kitchen writing to CSS_DATABASE"""
+    if os.path.exists(path):
+        os.remove(path)
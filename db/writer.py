@@ -0,0 +1,144 @@
+"""Buffered, write-behind access to the CSS database"""
+
+from itertools import groupby
+import logging
+import sqlite3
+import threading
+import time
+
+from db.connection import (
+    CSS_DATABASE,
+    connect,
+)
+from db.metrics import (
+    db_call_seconds,
+    registry,
+)
+
+log = logging.getLogger(__name__)
+
+statements_written = registry.counter(
+    'db_statements_written_total', 'Statements flushed by batch writers')
+
+
+class BatchWriter(object):
+    """Queue write statements and flush them to the database in bulk
+
+    Statements are kept in the order they were written and flushed over one
+    long-lived connection in a single transaction. Consecutive statements
+    with the same SQL are sent together through `executemany`. A flush
+    happens as soon as `batch_size` statements are pending or the oldest
+    pending statement is `max_latency` seconds old, so readers never see
+    data more than `max_latency` seconds stale while the writer is running.
+    Listeners are told about each batch once it is committed. A batch that
+    fails, e.g. because the database stayed locked, is kept and retried by
+    the next flush.
+
+    Args:
+      database (str): path to the SQLite database
+      batch_size (int): number of pending statements that triggers a flush
+      max_latency (float): max seconds a statement may wait to be flushed
+      after_flush (list): statements run at the end of every flush, in the
+        same transaction, e.g. to derive tables from what was written
+    """
+    def __init__(self, database=CSS_DATABASE, batch_size=500, max_latency=1, after_flush=()):
+        self.database = database
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.after_flush = list(after_flush)
+        self.pending = []
+        self.oldest_pending = None
+        self._conn = None
+        # the flusher thread and the simulation share the buffer
+        self._lock = threading.RLock()
+        self._stopped = threading.Event()
+        self._flusher = None
+        self.listeners = []
+
+    def add_listener(self, callback):
+        """Call `callback` with the (sql, runtime_values) statements of every
+        committed flush
+        """
+        self.listeners.append(callback)
+
+    @property
+    def connection(self):
+        """Long-lived connection, opened on first use"""
+        if self._conn is None:
+            self._conn = connect(self.database)
+        return self._conn
+
+    def write(self, sql, runtime_values):
+        """Queue one statement, flushing if the flush policy says so
+
+        Args:
+          sql (str): parameterized sql statement
+          runtime_values (tuple): values to bind
+        """
+        with self._lock:
+            now = time.monotonic()
+            if not self.pending:
+                self.oldest_pending = now
+            self.pending.append((sql, runtime_values))
+            if (len(self.pending) >= self.batch_size
+                    or now - self.oldest_pending >= self.max_latency):
+                self.flush()
+
+    def flush(self):
+        """Write all pending statements in one transaction
+
+        Returns:
+          int: number of statements written
+        """
+        with self._lock:
+            if not self.pending:
+                return 0
+            pending = self.pending
+            conn = self.connection
+            # commits on success, rolls back the whole batch on error, in
+            # which case it stays pending for the next flush
+            with db_call_seconds.time(call='flush'), conn:
+                for sql, group in groupby(pending, key=lambda stmt: stmt[0]):
+                    conn.executemany(sql, [values for _, values in group])
+                for sql in self.after_flush:
+                    conn.execute(sql)
+            self.pending = []
+            self.oldest_pending = None
+            statements_written.inc(len(pending))
+            for callback in self.listeners:
+                callback(pending)
+            return len(pending)
+
+    def _flush_periodically(self):
+        while not self._stopped.wait(self.max_latency):
+            try:
+                self.flush()
+            except sqlite3.Error:
+                log.exception("Background flush failed")
+
+    def start(self):
+        """Start flushing in the background every `max_latency` seconds
+
+        This bounds staleness even when no new statements are written,
+        e.g. while the simulation waits for the next order.
+        """
+        if self._flusher is not None:
+            return
+        self._stopped.clear()
+        self._flusher = threading.Thread(target=self._flush_periodically, daemon=True)
+        self._flusher.start()
+
+    def stop(self):
+        """Stop the background flusher and flush anything still pending"""
+        if self._flusher is not None:
+            self._stopped.set()
+            self._flusher.join()
+            self._flusher = None
+        self.flush()
+
+    def close(self):
+        """Flush and close the connection"""
+        self.stop()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
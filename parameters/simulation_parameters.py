@@ -1,8 +1,95 @@
 # multiple of real time
 SIMULATION_SPEED=300
 
+# set to False to run as fast as possible on a virtual clock (ignores SIMULATION_SPEED)
+REALTIME=True
+
+# 'simpy' for the SimPy model, 'heap' for the equivalent (faster) heap-based model
+ENGINE='simpy'
+
+# wall-clock seconds between checkpoints of a heap engine run; 0 to disable
+CHECKPOINT_INTERVAL=30
+
+# on start, pick up from the last checkpoint (if any) instead of starting over
+RESUME=True
+
+# orders file (JSON Lines or a JSON array) to read as the simulation goes
+# instead of loading data/orders.json up front; None to load it
+STREAM_ORDERS=None
+
+# seconds by which a streamed file's orders may be out of arrival order
+STREAM_LOOKAHEAD=300
+
+# seconds before its arrival that a streamed order is handed to SimPy
+STREAM_SCHEDULE_AHEAD=60
+
+# port the simulator accepts live orders on (see simulator/ingest.py), on
+# top of those in data/orders.json; None to disable
+INGEST_PORT=None
+
+# live orders waiting for the simulation before more are turned away
+INGEST_QUEUE_SIZE=1000
+
+# wall seconds between checks of how far a real-time run is behind
+LAG_CHECK_INTERVAL=1
+
+# when a real-time run falls behind, coalesce database writes and then
+# lower the speed until it keeps up, raising it again once it catches up
+ADAPTIVE_SPEED=False
+
+# wall seconds behind schedule at which an adaptive run backs off
+LAG_THRESHOLD=2
+
+# speed an adaptive run never slows down beyond
+MIN_SIMULATION_SPEED=10
+
+# which queued item a free cook takes next: 'fifo', 'shortest_cook_time',
+# 'smallest_order' or 'service_priority' (see simulator/scheduling.py);
+# only 'fifo' runs on the heap engine
+SCHEDULING_POLICY='fifo'
+
+# services served first under 'service_priority', highest priority first;
+# orders from any other service come after them
+SERVICE_PRIORITY=['Caviar', 'Grubhub', 'Postmates']
+
 # resources to process order items in parallel
 NUM_COOKS=120
 
+# cooks at each station (e.g. {'grill': 40, 'fryer': 30, 'cold_prep': 20})
+# that items declaring a `station` in data/items.json are made at; items
+# without one are made by the NUM_COOKS general cooks. None to ignore
+# stations and let any cook make any item. SimPy engine only
+STATIONS=None
+
+# kitchens a fleet run (simulator/fleet.py) splits orders across
+NUM_KITCHENS=4
+
+# seconds between snapshots of the simulator's metrics for the dashboard's
+# /metrics; 0 to disable
+METRICS_INTERVAL=5
+
+# sample the simulator's stacks during a run and write a flame graph
+# profile to db/profiles/
+PROFILE=False
+
+# seconds between stack samples while profiling
+PROFILE_INTERVAL=0.005
+
 # refresh interval in seconds
 DASHBOARD_REFRESH_INTERVAL=5
+
+# buffered database writes are flushed once this many are pending...
+DB_BATCH_SIZE=500
+
+# ...or once the oldest pending write is this many seconds old
+DB_MAX_LATENCY=1
+
+# max query results the dashboard caches between database changes
+DASHBOARD_CACHE_SIZE=64
+
+# resolutions in seconds of the order status graph, each dividing the
+# next; recent history is drawn at the finest, older history coarser
+STATUS_RESOLUTIONS=[60, 600, 3600, 21600]
+
+# most points per line of the order status graph, however long the run
+STATUS_MAX_POINTS=600
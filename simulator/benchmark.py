@@ -0,0 +1,167 @@
+"""Benchmark the simulator on synthetic orders of increasing size
+
+For each size, deterministic synthetic orders (see synthetic_orders.py)
+are written as JSON Lines and streamed through a batch simulation on each
+engine, writing to a scratch database. Measures, per size:
+  simulator.<size>.<engine>.events_per_sec: events logged per second,
+    database writes included
+  simulator.<size>.<engine>.orders_per_sec: orders simulated per second
+  simulator.<size>.db_write.statements_per_sec: statements flushed per
+    second of time spent flushing
+
+The heap engine's database for each size is kept in db/benchmarks/ for
+dash/benchmark.py to query. Results go to db/benchmarks/simulator.json and
+are compared against db/benchmark_baseline.json.
+
+Usage:
+  python benchmark.py
+  python benchmark.py --sizes 1m 10m --engines heap
+  python benchmark.py --update-baseline
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+from db.benchmark import (
+    RESULTS_DIR,
+    add_arguments,
+    finish,
+    result,
+)
+from db.connection import connect
+from db.metrics import db_call_seconds
+from db.migrations.migrate import migrate
+from db.projection import PROJECT_ORDERS_SQL
+from db.writer import (
+    BatchWriter,
+    statements_written,
+)
+import order_simulator
+from order_simulator import simulate_orders
+from order_stream import OrderStream
+from parameters.simulation_parameters import NUM_COOKS
+from synthetic_orders import (
+    format_size,
+    generate_orders,
+    parse_size,
+    write_orders,
+)
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+log.addHandler(
+    logging.StreamHandler(sys.stderr)
+)
+
+
+# SimPy takes minutes beyond this many orders
+SIMPY_MAX_ORDERS = 100000
+
+
+def bench_database(size):
+    """Database the heap engine run of `size` orders leaves for the dashboard benchmark"""
+    return os.path.join(RESULTS_DIR, f'orders_{size}.db')
+
+
+def remove_database(database):
+    for path in [database, database + '-wal', database + '-shm']:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def flush_totals():
+    """Seconds spent flushing and statements flushed so far in this process"""
+    seconds = sum(
+        value['sum'] for labels, value in db_call_seconds.samples() if labels['call'] == 'flush')
+    statements = sum(value for _, value in statements_written.samples())
+    return seconds, statements
+
+
+def run_simulation(orders_path, database, engine, num_cooks):
+    """Stream orders through a batch simulation into a fresh database
+
+    Returns:
+      dict: elapsed seconds, events and orders simulated, and the seconds
+        and statements spent flushing
+    """
+    remove_database(database)
+    writer = BatchWriter(database=database, batch_size=10000, max_latency=60,
+                         after_flush=PROJECT_ORDERS_SQL)
+    migrate(writer.connection.cursor())
+    previous_writer, order_simulator.db_writer = order_simulator.db_writer, writer
+    flush_seconds, statements = flush_totals()
+    stream = OrderStream(orders_path, lookahead=0)
+    start = time.perf_counter()
+    try:
+        simulate_orders(stream, num_cooks=num_cooks, realtime=False, reset_db=False,
+                        engine=engine, checkpoint_interval=0)
+    finally:
+        order_simulator.db_writer = previous_writer
+        writer.close()
+    elapsed = time.perf_counter() - start
+    conn = connect(database, readonly=True)
+    events, = conn.execute("SELECT count(*) FROM order_events;").fetchone()
+    conn.close()
+    total_seconds, total_statements = flush_totals()
+    return {
+        'elapsed': elapsed,
+        'events': events,
+        'orders': stream.count,
+        'flush_seconds': total_seconds - flush_seconds,
+        'statements': total_statements - statements,
+    }
+
+
+def run_suite(sizes, engines, num_cooks, seed):
+    """Benchmark every engine at every size
+
+    Returns:
+      dict: results keyed by benchmark name
+    """
+    results = {}
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for num_orders in sizes:
+            size = format_size(num_orders)
+            orders_path = os.path.join(tmpdir, f'orders_{size}.jsonl')
+            write_orders(generate_orders(num_orders, seed), orders_path)
+            for engine in engines:
+                if engine == 'simpy' and num_orders > SIMPY_MAX_ORDERS:
+                    continue
+                database = (
+                    bench_database(size) if engine == 'heap'
+                    else os.path.join(tmpdir, f'{engine}.db')
+                )
+                run = run_simulation(orders_path, database, engine, num_cooks)
+                prefix = f'simulator.{size}.{engine}'
+                results[f'{prefix}.events_per_sec'] = result(
+                    run['events'] / run['elapsed'], 'events/sec', 'higher')
+                results[f'{prefix}.orders_per_sec'] = result(
+                    run['orders'] / run['elapsed'], 'orders/sec', 'higher')
+                if engine == 'heap':
+                    results[f'simulator.{size}.db_write.statements_per_sec'] = result(
+                        run['statements'] / max(run['flush_seconds'], 1e-9), 'statements/sec', 'higher')
+                log.info(f"{prefix}: {run['events']} events in {run['elapsed']:.2f}s")
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', nargs='+', default=['1k', '10k', '100k'],
+                        help='order counts to run, e.g. 1k 10k 100k 1m 10m')
+    parser.add_argument('--engines', nargs='+', choices=['simpy', 'heap'], default=['simpy', 'heap'])
+    parser.add_argument('--num-cooks', type=int, default=NUM_COOKS)
+    parser.add_argument('--seed', type=int, default=0)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    # per-run logs and metrics snapshots would only get in the way
+    order_simulator.log.setLevel(logging.WARNING)
+    order_simulator.metrics_reporter.interval = 0
+    results = run_suite([parse_size(size) for size in args.sizes], args.engines,
+                        args.num_cooks, args.seed)
+    sys.exit(finish('simulator', results, args))
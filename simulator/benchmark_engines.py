@@ -0,0 +1,73 @@
+"""Benchmark the heap engine against the SimPy engine
+
+Both engines run the same synthetic order stream as an in-memory batch
+simulation, and must produce identical results for the timing to count.
+
+Usage:
+  python benchmark_engines.py --orders 100000 --num-cooks 120
+"""
+
+import argparse
+from datetime import datetime
+import logging
+import random
+import time
+
+import order_simulator
+from order_simulator import (
+    cook_times,
+    ENV_START,
+    TIME_BUFFER,
+)
+from sweep import run_configuration
+
+
+def synthetic_orders(num_orders, seed=0, mean_gap=20):
+    """Deterministic orders with random menu items and Poisson arrivals
+
+    Args:
+      num_orders (int): orders to generate
+      seed (int): random seed
+      mean_gap (float): mean seconds between orders
+    """
+    rng = random.Random(seed)
+    menu_items = sorted(cook_times)
+    ts = ENV_START + TIME_BUFFER
+    orders = []
+    for _ in range(num_orders):
+        orders.append({
+            'items': [
+                {'name': rng.choice(menu_items), 'price_per_unit': rng.randint(1, 20), 'quantity': rng.randint(1, 3)}
+                for _ in range(rng.randint(1, 4))
+            ],
+            'name': 'Benchy McBenchFace',
+            'service': rng.choice(['Grubhub', 'Postmates', 'Caviar']),
+            'ordered_at': datetime.fromtimestamp(int(ts)).strftime('%Y-%m-%dT%H:%M:%S'),
+        })
+        ts += rng.expovariate(1 / mean_gap)
+    return orders
+
+
+def time_engine(engine, orders, num_cooks):
+    """Run one in-memory batch simulation and time it"""
+    start = time.perf_counter()
+    result = run_configuration({'num_cooks': num_cooks, 'engine': engine}, orders)
+    return time.perf_counter() - start, result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--orders', type=int, default=100000)
+    parser.add_argument('--num-cooks', type=int, default=120)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    order_simulator.log.setLevel(logging.WARNING)
+    orders = synthetic_orders(args.orders, seed=args.seed)
+    timings = {}
+    results = {}
+    for engine in ['simpy', 'heap']:
+        timings[engine], results[engine] = time_engine(engine, orders, args.num_cooks)
+        print(f"{engine:>6}: {timings[engine]:8.2f}s  {args.orders / timings[engine]:10.0f} orders/sec")
+    assert results['heap'] == results['simpy'], "engines disagree"
+    print(f"speedup: {timings['simpy'] / timings['heap']:.1f}x")
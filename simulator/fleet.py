@@ -0,0 +1,207 @@
+"""Simulate a fleet of kitchens, one process per kitchen
+
+Orders are partitioned by kitchen and each kitchen runs as its own
+simulation in its own process, with its own cooks and its own database
+(see db/shards.py). Kitchens share nothing, so throughput grows with the
+number of cores. The dashboard can show the whole fleet or one kitchen.
+
+Usage:
+  python fleet.py --kitchens 4 --num-cooks 30
+  python fleet.py --kitchens 4 --num-cooks 20 40 20 40 --batch --engine heap
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import sys
+import time
+
+from db.metrics import (
+    clear_metrics,
+    MetricsReporter,
+    registry,
+)
+from db.shards import (
+    shard_database,
+    write_manifest,
+)
+from db.migrations.migrate import recreate_orders_table
+from db.projection import PROJECT_ORDERS_SQL
+from db.writer import BatchWriter
+import order_simulator
+from order_simulator import (
+    count_events,
+    orders,
+    publish_order_events,
+    simulate_orders,
+)
+from parameters.simulation_parameters import (
+    DB_BATCH_SIZE,
+    DB_MAX_LATENCY,
+    ENGINE,
+    METRICS_INTERVAL,
+    NUM_COOKS,
+    NUM_KITCHENS,
+    REALTIME,
+    SIMULATION_SPEED,
+)
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+log.addHandler(
+    logging.StreamHandler(sys.stderr)
+)
+
+
+def partition_orders(orders_to_split, num_kitchens):
+    """Assign each order to a kitchen
+
+    Orders that name a `kitchen` go to it; the rest are dealt out round
+    robin, which keeps kitchens evenly loaded over time.
+
+    Args:
+      orders_to_split (list): orders to assign
+      num_kitchens (int): number of kitchens for unassigned orders
+
+    Returns:
+      dict: kitchen name to its orders, in their original order
+    """
+    kitchens = {str(k): [] for k in range(num_kitchens)}
+    for idx, order in enumerate(orders_to_split):
+        kitchen = str(order.get('kitchen', idx % num_kitchens))
+        kitchens.setdefault(kitchen, []).append(order)
+    return kitchens
+
+
+def run_kitchen(kitchen, database, kitchen_orders, params):
+    """Simulate one kitchen against its own database
+
+    Runs in a worker process, once `simulate_fleet` has created the
+    kitchen's database.
+
+    Args:
+      kitchen (str): kitchen name
+      database (str): path to the kitchen's migrated database
+      kitchen_orders (list): orders for this kitchen
+      params (dict): keyword arguments for `simulate_orders`
+
+    Returns:
+      dict: summary of the run
+    """
+    writer = BatchWriter(
+        database=database,
+        batch_size=DB_BATCH_SIZE,
+        max_latency=DB_MAX_LATENCY,
+        after_flush=PROJECT_ORDERS_SQL,
+    )
+    writer.add_listener(publish_order_events)
+    writer.add_listener(count_events)
+    previous_writer, order_simulator.db_writer = order_simulator.db_writer, writer
+    # each kitchen reports its own metrics
+    registry.labels['kitchen'] = kitchen
+    previous_reporter, order_simulator.metrics_reporter = (
+        order_simulator.metrics_reporter,
+        MetricsReporter(f'simulator_kitchen_{kitchen}', METRICS_INTERVAL),
+    )
+    start = time.perf_counter()
+    try:
+        sim_kitchen = simulate_orders(kitchen_orders, reset_db=False, **params)
+    finally:
+        order_simulator.db_writer = previous_writer
+        order_simulator.metrics_reporter = previous_reporter
+        registry.labels.pop('kitchen', None)
+        writer.close()
+    return {
+        'kitchen': kitchen,
+        'orders': len(kitchen_orders),
+        'num_cooks': sim_kitchen.num_cooks,
+        'elapsed': time.perf_counter() - start,
+    }
+
+
+def simulate_fleet(orders_to_run, num_kitchens=NUM_KITCHENS, num_cooks=NUM_COOKS,
+                   speed=SIMULATION_SPEED, realtime=REALTIME, engine=ENGINE,
+                   max_workers=None):
+    """Simulate every kitchen in parallel
+
+    Args:
+      orders_to_run (list): orders for the whole fleet
+      num_kitchens (int): kitchens to split unassigned orders across
+      num_cooks (int or list): cooks per kitchen, either one count for
+        every kitchen or one count per kitchen
+      speed (int): speed at which to run the simulator
+      realtime (bool): if False, run as fast as possible
+      engine (str): simulation engine, 'simpy' or 'heap'
+      max_workers (int): worker processes; defaults to one per kitchen
+
+    Returns:
+      list: one summary per kitchen
+    """
+    kitchens = partition_orders(orders_to_run, num_kitchens)
+    if isinstance(num_cooks, int):
+        num_cooks = [num_cooks] * len(kitchens)
+    if len(num_cooks) != len(kitchens):
+        raise ValueError(
+            f"Got {len(num_cooks)} cook counts for {len(kitchens)} kitchens")
+
+    shards = [{
+        'kitchen': kitchen,
+        'database': shard_database(kitchen),
+        'num_cooks': cooks,
+    } for kitchen, cooks in zip(kitchens, num_cooks)]
+    # the dashboard opens every shard the manifest lists
+    for shard in shards:
+        recreate_orders_table(shard['database'])
+    write_manifest(shards)
+    # kitchens of an earlier run stop reporting
+    clear_metrics()
+
+    max_workers = max_workers or len(shards)
+    log.info(f"Simulating {len(shards)} kitchens on {max_workers} workers")
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(
+                run_kitchen,
+                shard['kitchen'],
+                shard['database'],
+                kitchens[shard['kitchen']],
+                {'speed': speed, 'num_cooks': shard['num_cooks'],
+                 'realtime': realtime, 'engine': engine},
+            )
+            for shard in shards
+        ]
+        results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - start
+    log.info(
+        f"Simulated {len(orders_to_run)} orders in {elapsed:.2f}s "
+        f"({len(orders_to_run) / max(elapsed, 1e-9):.0f} orders/sec)"
+    )
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--kitchens', type=int, default=NUM_KITCHENS,
+                        help='kitchens to split orders across')
+    parser.add_argument('--num-cooks', type=int, nargs='+', default=[NUM_COOKS],
+                        help='cooks per kitchen: one count for all, or one per kitchen')
+    parser.add_argument('--engine', choices=['simpy', 'heap'], default=ENGINE,
+                        help='simulation engine')
+    parser.add_argument('--batch', action='store_true',
+                        help='run as fast as possible instead of in real time')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='worker processes (default: one per kitchen)')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    simulate_fleet(
+        orders,
+        num_kitchens=args.kitchens,
+        num_cooks=args.num_cooks[0] if len(args.num_cooks) == 1 else args.num_cooks,
+        realtime=not args.batch,
+        engine=args.engine,
+        max_workers=args.workers,
+    )
@@ -0,0 +1,152 @@
+"""Heap-based kitchen model, a lightweight alternative to SimPy
+
+With FIFO dispatch, the moment an item is requested already determines
+when it will start: it takes the first cook to become free after every
+item requested before it. So instead of one SimPy process per item, the
+kitchen only needs a min-heap of the times busy cooks become free.
+"""
+
+import heapq
+import time
+
+
+class VirtualClock(object):
+    """Simulation clock that jumps straight to the next event
+
+    Exposes `now` like a SimPy environment so it can be passed to the
+    same database update functions.
+
+    Args:
+      initial_time (int): simulation start time
+    """
+    def __init__(self, initial_time=0):
+        self.now = initial_time
+
+    def advance(self, until):
+        """Move the clock forward to `until`"""
+        self.now = until
+
+
+class RealtimeClock(VirtualClock):
+    """Simulation clock paced against wall time
+
+    Mirrors `simpy.rt.RealtimeEnvironment` with `strict=False`: the clock
+    sleeps until an event is due, and if it falls behind it just carries on.
+
+    Args:
+      initial_time (int): simulation start time
+      factor (float): real seconds per simulated second
+    """
+    def __init__(self, initial_time=0, factor=1.0):
+        super().__init__(initial_time)
+        self.factor = factor
+        self.real_start = time.monotonic()
+        self.env_start = initial_time
+
+    def advance(self, until):
+        delay = (
+            self.real_start
+            + (until - self.env_start) * self.factor
+            - time.monotonic()
+        )
+        if delay > 0:
+            time.sleep(delay)
+        self.now = until
+
+    def set_factor(self, factor):
+        """Go on at a new pace from the current time, forgiving any lag"""
+        self.real_start = time.monotonic()
+        self.env_start = self.now
+        self.factor = factor
+
+
+class HeapKitchen(object):
+    """A kitchen with `num_cooks` identical cooks and a FIFO item queue
+
+    Produces the same start times and stats as `Kitchen` running on SimPy,
+    including its tie-breaking: a cook that frees up at time t only picks
+    up a new item after every item requested at t has joined the queue.
+
+    Args:
+      env (VirtualClock): the simulation clock
+      num_cooks (int): total resources available
+    """
+    def __init__(self, env, num_cooks):
+        self.env = env
+        self.num_cooks = num_cooks
+        # the only scheduling policy this model reproduces
+        self.policy = 'fifo'
+        # times at which each busy cook becomes free
+        self.cooks_free_at = []
+        # start times of items that had to wait for a cook
+        self.queued_until = []
+        # running stats, matching Kitchen
+        self.busy_time = 0
+        self.items_requested = 0
+        self.queue_length_total = 0
+        self.max_queue_length = 0
+
+    def request_item(self, requested_at, cook_time):
+        """Assign an item to the first cook available
+
+        Items must be requested in nondecreasing `requested_at` order.
+
+        Args:
+          requested_at (int): time the item is requested
+          cook_time (int): the seconds for the item to be cooked
+
+        Returns:
+          int: time the item starts cooking
+        """
+        if len(self.cooks_free_at) < self.num_cooks:
+            # some cook has not been used yet
+            start, queued = requested_at, False
+        else:
+            free_at = heapq.heappop(self.cooks_free_at)
+            start = max(requested_at, free_at)
+            # a cook freed at exactly `requested_at` is released after the
+            # request has already joined the queue
+            queued = free_at >= requested_at
+
+        # drop items that left the queue before this request
+        while self.queued_until and self.queued_until[0] < requested_at:
+            heapq.heappop(self.queued_until)
+        if queued:
+            heapq.heappush(self.queued_until, start)
+
+        heapq.heappush(self.cooks_free_at, start + cook_time)
+        self.busy_time += cook_time
+        queue_length = len(self.queued_until)
+        self.items_requested += 1
+        self.queue_length_total += queue_length
+        self.max_queue_length = max(self.max_queue_length, queue_length)
+        return start
+
+    @property
+    def queue_length(self):
+        """Items waiting for a cook at the current time"""
+        return sum(1 for start in list(self.queued_until) if start > self.env.now)
+
+    @property
+    def cooks_busy(self):
+        """Cooks preparing an item at the current time"""
+        return sum(1 for free_at in list(self.cooks_free_at) if free_at > self.env.now)
+
+    # running state saved in checkpoints
+    STATE_FIELDS = [
+        'cooks_free_at',
+        'queued_until',
+        'busy_time',
+        'items_requested',
+        'queue_length_total',
+        'max_queue_length',
+    ]
+
+    def state(self):
+        """JSON-serializable state needed to carry on where the kitchen left off"""
+        return {field: getattr(self, field) for field in self.STATE_FIELDS}
+
+    def load_state(self, state):
+        """Restore state saved by `state`"""
+        for field in self.STATE_FIELDS:
+            setattr(self, field, state[field])
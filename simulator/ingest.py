@@ -0,0 +1,208 @@
+"""Accept live orders over HTTP and feed them into a running simulation
+
+Orders are POSTed to /orders in the same shape as data/orders.json, one
+order or a list of them, and wait in a bounded queue until the simulation
+takes them. Their `ordered_at` is ignored: a live order is received when
+it reaches the kitchen. When the queue is full, requests are rejected with
+503 and a Retry-After header rather than buffered without limit, so a
+client sending faster than the kitchen keeps up finds out straight away.
+GET /status reports the queue depth, counts and how far the simulation
+has fallen behind the wall clock.
+
+Usage (live orders only, no orders file):
+  python ingest.py --port 8060 --num-cooks 120 --speed 1
+"""
+
+import argparse
+from http.server import (
+    BaseHTTPRequestHandler,
+    ThreadingHTTPServer,
+)
+import json
+import logging
+import queue
+import sys
+import threading
+
+from parameters.simulation_parameters import (
+    INGEST_PORT,
+    INGEST_QUEUE_SIZE,
+    NUM_COOKS,
+    SIMULATION_SPEED,
+)
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+log.addHandler(
+    logging.StreamHandler(sys.stderr)
+)
+
+# wall-clock seconds between checks of the queue by the simulation
+POLL_INTERVAL = 0.05
+# seconds a rejected client is asked to wait before retrying
+RETRY_AFTER = 1
+
+
+def validate_order(order, menu):
+    """Check an order has the fields the simulator uses
+
+    Args:
+      order (dict): order in the data/orders.json shape
+      menu (dict): item names the kitchen can cook
+
+    Raises:
+      ValueError: if the order can't be simulated
+    """
+    if not isinstance(order, dict):
+        raise ValueError("orders must be json objects")
+    for field in ['name', 'service']:
+        if not isinstance(order.get(field), str):
+            raise ValueError(f"order {field!r} must be a string")
+    if not isinstance(order.get('items'), list):
+        raise ValueError("order 'items' must be a list")
+    for item in order['items']:
+        if not isinstance(item, dict) or item.get('name') not in menu:
+            raise ValueError(f"unknown item {item!r}")
+        if not isinstance(item.get('quantity'), int) or item['quantity'] < 0:
+            raise ValueError("item quantity must be a non-negative integer")
+        if not isinstance(item.get('price_per_unit'), (int, float)):
+            raise ValueError("item price_per_unit must be a number")
+
+
+class OrderIngest(object):
+    """Bounded queue of live orders, filled by an HTTP server
+
+    Args:
+      menu (dict): item names the kitchen can cook
+      port (int): port to listen on; 0 picks a free one
+      queue_size (int): orders waiting for the simulation before new
+        ones are rejected
+      host (str): address to listen on
+    """
+    def __init__(self, menu, port=INGEST_PORT, queue_size=INGEST_QUEUE_SIZE, host='0.0.0.0'):
+        self.menu = menu
+        self.address = (host, port)
+        self.queue_size = queue_size
+        self.orders = queue.Queue()
+        self.lock = threading.Lock()
+        self.server = None
+        # running counts for /status
+        self.accepted = 0
+        self.rejected = 0
+        self.taken = 0
+        self.lag = 0.0
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def start(self):
+        """Listen for orders in a background thread"""
+        self.server = ThreadingHTTPServer(self.address, IngestHandler)
+        self.server.daemon_threads = True
+        self.server.ingest = self
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        log.info(f"Accepting live orders on port {self.port}")
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def submit(self, orders):
+        """Queue orders for the simulation, all or none of them
+
+        Args:
+          orders (list): validated orders
+
+        Returns:
+          bool: False if there isn't room for them all
+        """
+        with self.lock:
+            if self.orders.qsize() + len(orders) > self.queue_size:
+                self.rejected += len(orders)
+                return False
+            for order in orders:
+                self.orders.put_nowait(order)
+            self.accepted += len(orders)
+            return True
+
+    def take(self):
+        """Every order waiting, oldest first"""
+        taken = []
+        while True:
+            try:
+                taken.append(self.orders.get_nowait())
+            except queue.Empty:
+                break
+        with self.lock:
+            self.taken += len(taken)
+        return taken
+
+    def status(self):
+        with self.lock:
+            return {
+                'queued': self.orders.qsize(),
+                'queue_size': self.queue_size,
+                'accepted': self.accepted,
+                'rejected': self.rejected,
+                'received': self.taken,
+                'lag': self.lag,
+            }
+
+
+class IngestHandler(BaseHTTPRequestHandler):
+    """POST /orders to queue orders, GET /status for counts"""
+
+    def send_json(self, code, body, headers=()):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path != '/status':
+            return self.send_json(404, {'error': 'not found'})
+        self.send_json(200, self.server.ingest.status())
+
+    def do_POST(self):
+        if self.path != '/orders':
+            return self.send_json(404, {'error': 'not found'})
+        ingest = self.server.ingest
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            orders = body if isinstance(body, list) else [body]
+            for order in orders:
+                validate_order(order, ingest.menu)
+        except ValueError as e:
+            return self.send_json(400, {'error': str(e)})
+        if not ingest.submit(orders):
+            return self.send_json(
+                503, {'error': 'queue full'}, [('Retry-After', str(RETRY_AFTER))])
+        self.send_json(202, {'accepted': len(orders)})
+
+    def log_message(self, format, *args):
+        log.debug(format % args)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--port', type=int, default=INGEST_PORT or 8060)
+    parser.add_argument('--num-cooks', type=int, default=NUM_COOKS)
+    parser.add_argument('--speed', type=float, default=SIMULATION_SPEED)
+    args = parser.parse_args()
+
+    # imported here, since the simulator imports this module
+    from order_simulator import (
+        cook_times,
+        simulate_orders,
+    )
+    simulate_orders(
+        [], speed=args.speed, num_cooks=args.num_cooks, realtime=True,
+        ingest=OrderIngest(cook_times, port=args.port),
+    )
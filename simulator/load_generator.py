@@ -0,0 +1,128 @@
+"""Send synthetic orders to a running simulator to find its sustained rate
+
+Each rate in --rates runs for --duration seconds with Poisson arrivals and
+items drawn from the menu, weighted by --mix. A rate is sustained if no
+orders were turned away and the simulation stayed within --max-lag
+seconds of the wall clock. The run stops at the first rate that isn't.
+The simulator must be accepting live orders (see ingest.py).
+
+Usage:
+  python load_generator.py --rates 10 20 50 100 --duration 30
+  python load_generator.py --rates 20 --mix "Dish 1=3" "Dish 2=1"
+"""
+
+import argparse
+from datetime import datetime
+import json
+import random
+import time
+from urllib.error import HTTPError
+from urllib.request import (
+    Request,
+    urlopen,
+)
+
+SERVICES = ['Grubhub', 'Postmates', 'Caviar']
+
+
+def parse_mix(mix, menu_items):
+    """Weights of menu items from NAME=WEIGHT pairs; uniform if none given"""
+    if not mix:
+        return {name: 1 for name in menu_items}
+    weights = {}
+    for pair in mix:
+        name, _, weight = pair.rpartition('=')
+        if name not in menu_items:
+            raise ValueError(f"{name!r} is not on the menu")
+        weights[name] = float(weight)
+    return weights
+
+
+def random_order(rng, weights, mean_items):
+    """One order in the data/orders.json shape"""
+    names = list(weights)
+    num_items = 1 + min(int(rng.expovariate(1 / max(mean_items - 1, 1e-9))), 20)
+    return {
+        'name': f"Load {rng.randrange(10**6)}",
+        'service': rng.choice(SERVICES),
+        'ordered_at': datetime.now().strftime('%Y-%m-%dT%H:%M:%S'),
+        'items': [
+            {'name': name, 'price_per_unit': rng.randint(1, 20), 'quantity': rng.randint(1, 3)}
+            for name in rng.choices(names, list(weights.values()), k=num_items)
+        ],
+    }
+
+
+def request_json(url, body=None):
+    """GET (or POST `body` to) `url`, returning the status and decoded reply"""
+    data = None if body is None else json.dumps(body).encode()
+    request = Request(url, data=data, headers={'Content-Type': 'application/json'})
+    try:
+        with urlopen(request) as response:
+            return response.status, json.load(response)
+    except HTTPError as e:
+        return e.code, json.load(e)
+
+
+def run_rate(url, rate, duration, weights, mean_items, rng):
+    """Send orders at `rate` per second for `duration` seconds
+
+    Orders that fall due while a request is in flight go out together in
+    the next one, so a slow server doesn't slow the arrival rate down.
+
+    Returns:
+      dict: counts of orders sent, accepted and rejected, and the highest
+        lag the simulator reported
+    """
+    result = {'rate': rate, 'sent': 0, 'accepted': 0, 'rejected': 0, 'max_lag': 0.0}
+    start = time.monotonic()
+    next_arrival = start + rng.expovariate(rate)
+    last_status = start
+    while next_arrival < start + duration:
+        time.sleep(max(0, next_arrival - time.monotonic()))
+        batch = []
+        while next_arrival <= time.monotonic() and next_arrival < start + duration:
+            batch.append(random_order(rng, weights, mean_items))
+            next_arrival += rng.expovariate(rate)
+        code, _ = request_json(f'{url}/orders', batch)
+        result['sent'] += len(batch)
+        result['accepted' if code == 202 else 'rejected'] += len(batch)
+        if time.monotonic() - last_status >= 1:
+            _, status = request_json(f'{url}/status')
+            result['max_lag'] = max(result['max_lag'], status['lag'])
+            last_status = time.monotonic()
+    _, status = request_json(f'{url}/status')
+    result['max_lag'] = max(result['max_lag'], status['lag'])
+    result['achieved'] = result['accepted'] / duration
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--url', default='http://localhost:8060')
+    parser.add_argument('--rates', type=float, nargs='+', default=[1, 2, 5, 10, 20, 50, 100],
+                        help='orders per second to try, in increasing order')
+    parser.add_argument('--duration', type=float, default=30,
+                        help='seconds to hold each rate')
+    parser.add_argument('--mix', nargs='*', default=[],
+                        help='menu item weights as NAME=WEIGHT; uniform by default')
+    parser.add_argument('--mean-items', type=float, default=2,
+                        help='mean number of item lines per order')
+    parser.add_argument('--max-lag', type=float, default=1,
+                        help='seconds behind the wall clock the simulator may fall')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with open('data/items.json') as f:
+        weights = parse_mix(args.mix, {item['name'] for item in json.load(f)})
+    rng = random.Random(args.seed)
+
+    sustained = None
+    print('rate\tachieved\trejected\tmax_lag')
+    for rate in args.rates:
+        result = run_rate(args.url, rate, args.duration, weights, args.mean_items, rng)
+        print(f"{rate:g}\t{result['achieved']:.1f}\t{result['rejected']}\t{result['max_lag']:.2f}")
+        if result['rejected'] or result['max_lag'] > args.max_lag:
+            break
+        sustained = rate
+    print(f"Max sustained rate: {sustained if sustained is not None else 'below the lowest rate'} orders/sec")
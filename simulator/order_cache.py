@@ -0,0 +1,239 @@
+"""Preparsed binary cache of an orders file
+
+Parsing a large orders.json (and every `ordered_at` timestamp in it) is
+most of the simulator's startup time. Compiling it once stores the orders
+as flat arrays next to the source: arrival epochs, indexes into a table
+of interned strings (customer, service, item names), and per-item
+quantities and prices. Loading memory-maps that file, so startup no longer
+depends on the number of orders, and orders are only built into dicts as
+they are read.
+
+The cache is keyed on a hash of the source file, so editing orders.json
+just compiles a new one.
+
+Usage:
+  python order_cache.py data/orders.json
+"""
+
+from array import array
+from datetime import datetime
+import glob
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+
+MAGIC = b'ORDCACH1'
+# index stored for an order without a kitchen
+NO_STRING = 2**32 - 1
+
+# (name, array typecode); per-order sections have one value per order,
+# per-item sections one per item line, and item_offsets one more than orders
+SECTIONS = [
+    ('ordered_at', 'q'),
+    ('name', 'I'),
+    ('service', 'I'),
+    ('kitchen', 'I'),
+    ('item_offsets', 'Q'),
+    ('item_name', 'I'),
+    ('quantity', 'I'),
+    ('price', 'd'),
+    ('string_offsets', 'Q'),
+    ('string_data', 'B'),
+]
+
+
+def get_time(ts):
+    """Parse timestamps into epochs; ignore fractional seconds"""
+    ts_parts = ts.split('.')
+    return int(datetime.strptime(ts_parts[0], '%Y-%m-%dT%H:%M:%S').timestamp())
+
+
+def file_hash(path):
+    """sha256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_path(source, source_hash):
+    """Where the cache of `source` with contents hashing to `source_hash` lives"""
+    stem, _ = os.path.splitext(source)
+    return f'{stem}.{source_hash[:16]}.cache'
+
+
+def compile_orders(source, path=None):
+    """Parse an orders file once and write its binary cache
+
+    Args:
+      source (str): path to the orders json
+      path (str): where to write the cache; defaults to `cache_path`
+
+    Returns:
+      str: path of the cache
+    """
+    source_hash = file_hash(source)
+    path = path or cache_path(source, source_hash)
+    with open(source) as f:
+        orders = json.load(f)
+
+    strings = {}
+    def intern(value):
+        if value is None:
+            return NO_STRING
+        code = strings.get(value)
+        if code is None:
+            code = strings[value] = len(strings)
+        return code
+
+    columns = {name: array(typecode) for name, typecode in SECTIONS}
+    columns['item_offsets'].append(0)
+    for order in orders:
+        columns['ordered_at'].append(get_time(order['ordered_at']))
+        columns['name'].append(intern(order['name']))
+        columns['service'].append(intern(order['service']))
+        kitchen = order.get('kitchen')
+        columns['kitchen'].append(intern(None if kitchen is None else str(kitchen)))
+        for item in order['items']:
+            columns['item_name'].append(intern(item['name']))
+            columns['quantity'].append(item['quantity'])
+            columns['price'].append(item['price_per_unit'])
+        columns['item_offsets'].append(len(columns['item_name']))
+
+    # strings are decoded one at a time as they are used
+    for value in strings:
+        columns['string_offsets'].append(len(columns['string_data']))
+        columns['string_data'].frombytes(value.encode())
+    columns['string_offsets'].append(len(columns['string_data']))
+
+    # sections start on 8 byte boundaries so they can be cast in place
+    sections, offset = {}, 0
+    for name, typecode in SECTIONS:
+        sections[name] = [offset, len(columns[name])]
+        offset += -(-len(columns[name]) * columns[name].itemsize // 8) * 8
+    header = json.dumps({
+        'source_hash': source_hash,
+        'num_orders': len(orders),
+        'min_ordered_at': min(columns['ordered_at'], default=None),
+        'byteorder': sys.byteorder,
+        'sections': sections,
+    }).encode()
+    header += b' ' * (-len(header) % 8)
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        for name, _ in SECTIONS:
+            data = columns[name].tobytes()
+            f.write(data)
+            f.write(b'\0' * (-len(data) % 8))
+    os.replace(tmp_path, path)
+    return path
+
+
+class OrderTable(object):
+    """Read-only sequence of orders backed by a memory-mapped cache
+
+    Indexing builds the same order dicts as the source file, with the
+    parsed arrival time under `ordered_at_epoch` instead of the
+    `ordered_at` string.
+
+    Args:
+      path (str): path to a cache written by `compile_orders`
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not an order cache")
+        header_size, = struct.unpack_from('<Q', self._mmap, len(MAGIC))
+        start = len(MAGIC) + 8
+        header = json.loads(self._mmap[start:start + header_size])
+        if header['byteorder'] != sys.byteorder:
+            raise ValueError(f"{path} was compiled on a machine with another byte order")
+        self.source_hash = header['source_hash']
+        self.min_ordered_at = header['min_ordered_at']
+        self._strings = {}
+        self._len = header['num_orders']
+
+        data = memoryview(self._mmap)[start + header_size:]
+        for name, typecode in SECTIONS:
+            offset, length = header['sections'][name]
+            size = length * struct.calcsize(typecode)
+            setattr(self, name, data[offset:offset + size].cast(typecode))
+
+    def string(self, idx):
+        """Interned string number `idx`"""
+        value = self._strings.get(idx)
+        if value is None:
+            start, end = self.string_offsets[idx], self.string_offsets[idx + 1]
+            value = self._strings[idx] = bytes(self.string_data[start:end]).decode()
+        return value
+
+    def __reduce__(self):
+        # worker processes map the file again rather than copying orders
+        return (OrderTable, (self.path,))
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(self._len))]
+        if idx < 0:
+            idx += self._len
+        if not 0 <= idx < self._len:
+            raise IndexError('order index out of range')
+        string = self.string
+        items = []
+        for line in range(self.item_offsets[idx], self.item_offsets[idx + 1]):
+            price = self.price[line]
+            items.append({
+                'name': string(self.item_name[line]),
+                'price_per_unit': int(price) if price.is_integer() else price,
+                'quantity': self.quantity[line],
+            })
+        order = {
+            'name': string(self.name[idx]),
+            'service': string(self.service[idx]),
+            'ordered_at_epoch': self.ordered_at[idx],
+            'items': items,
+        }
+        if self.kitchen[idx] != NO_STRING:
+            order['kitchen'] = string(self.kitchen[idx])
+        return order
+
+    def __iter__(self):
+        for idx in range(self._len):
+            yield self[idx]
+
+
+def load_orders(source):
+    """Orders from `source`, compiling its cache first if needed
+
+    Args:
+      source (str): path to the orders json
+
+    Returns:
+      OrderTable: the orders
+    """
+    source_hash = file_hash(source)
+    path = cache_path(source, source_hash)
+    if not os.path.exists(path):
+        # caches of earlier versions of the source are no use anymore
+        for stale in glob.glob(cache_path(source, '*')):
+            os.remove(stale)
+        compile_orders(source, path)
+    return OrderTable(path)
+
+
+if __name__ == '__main__':
+    for source in sys.argv[1:]:
+        print(f"Compiled {source} to {load_orders(source).path}")
@@ -1,20 +1,78 @@
 """Process orders and write to database"""
 
-from datetime import datetime
+from collections import Counter
 import json
+import heapq
+from itertools import islice
 import logging
+import math
+import os
 import sys
+import time
 
 import simpy
 
-from db.connection import (
-    css_cursor,
-    execute_sql,
+from db.events import EventPublisher
+from db.metrics import (
+    clear_metrics,
+    MetricsReporter,
+    rate_of,
+    registry,
+)
+from db.migrations.migrate import (
+    migrate,
+    recreate_orders_table,
+)
+from db.profiler import (
+    PROFILES_DIR,
+    SamplingProfiler,
+)
+from db.projection import PROJECT_ORDERS_SQL
+from db.shards import clear_manifest
+from db.writer import BatchWriter
+from heap_kitchen import (
+    HeapKitchen,
+    RealtimeClock,
+    VirtualClock,
+)
+from order_cache import (
+    get_time,
+    load_orders,
+)
+from ingest import (
+    OrderIngest,
+    POLL_INTERVAL,
+)
+from order_stream import OrderStream
+from pacing import (
+    LagMonitor,
+    monitor_lag,
+    PacedEnvironment,
+    realtime_lag,
+)
+from scheduling import (
+    get_policy,
+    PriorityResource,
 )
-from db.migrations.create_orders_table import recreate_orders_table
 from parameters.simulation_parameters import (
+    ADAPTIVE_SPEED,
+    CHECKPOINT_INTERVAL,
+    DB_BATCH_SIZE,
+    DB_MAX_LATENCY,
+    ENGINE,
+    INGEST_PORT,
+    METRICS_INTERVAL,
     NUM_COOKS,
+    PROFILE,
+    PROFILE_INTERVAL,
+    REALTIME,
+    RESUME,
+    SCHEDULING_POLICY,
+    STATIONS,
     SIMULATION_SPEED,
+    STREAM_LOOKAHEAD,
+    STREAM_ORDERS,
+    STREAM_SCHEDULE_AHEAD,
 )
 
 
@@ -28,170 +86,733 @@ log.addHandler(
     logging.StreamHandler(sys.stderr)
 )
 
-# load data
-with open('data/orders.json') as f:
-    orders = json.load(f)
+# load data; orders come from a preparsed cache of the json
+orders = load_orders('data/orders.json')
 with open('data/items.json') as f:
     menu = json.load(f)
 
 # transform items into cook time lookup
 cook_times = {i['name']:i['cook_time'] for i in menu}
+# station each item is made at, if items.json names one
+item_stations = {i['name']:i.get('station') for i in menu}
+# where items without a station of their own are made
+GENERAL_STATION = 'general'
 
 
-def get_time(ts):
-    """Parse timestamps into epochs; ignore fractional seconds"""
-    ts_parts = ts.split('.')
-    return int(datetime.strptime(ts_parts[0], '%Y-%m-%dT%H:%M:%S').timestamp())
+def order_time(order):
+    """Epoch an order is received at, parsing its timestamp at most once"""
+    epoch = order.get('ordered_at_epoch')
+    if epoch is None:
+        epoch = order['ordered_at_epoch'] = get_time(order['ordered_at'])
+    return epoch
 
 # seconds before first order to start simulation
 TIME_BUFFER = 10
-tstamps = [get_time(order['ordered_at']) for order in orders]
-ENV_START = min(tstamps) - TIME_BUFFER
+ENV_START = orders.min_ordered_at - TIME_BUFFER
 
 
 ##########################
 ##   MANAGE RESOURCES   ##
 ##########################
+class Station(object):
+    """A pool of cooks who prepare the items routed to their station
+
+    Args:
+      env (simpy.environment): the simulation environment
+      name (str): station name, e.g. 'grill'
+      num_cooks (int): cooks at the station
+    """
+    def __init__(self, env, name, num_cooks):
+        self.name = name
+        self.num_cooks = num_cooks
+        self.resources = PriorityResource(env, num_cooks)
+        # running stats for capacity planning
+        self.busy_time = 0
+        self.items_requested = 0
+        self.queue_length_total = 0
+        self.max_queue_length = 0
+
+    def record_request(self):
+        """Record the queue length seen by an item as it is requested"""
+        queue_length = len(self.resources.queue)
+        self.items_requested += 1
+        self.queue_length_total += queue_length
+        self.max_queue_length = max(self.max_queue_length, queue_length)
+
+    def utilization(self, duration):
+        """Share of the station's cook time spent cooking over `duration` seconds"""
+        capacity = self.num_cooks * duration
+        return self.busy_time / capacity if capacity else 0
+
+
 class Kitchen(object):
     """A kitchen has a limited number of cooks to make food in parallel.
 
-    Assume each cook prepares one item at a time, and any cook is capable
-    of preparing any item. When an item is received, it goes to an arbitrary
-    available cook and takes {cook_time} seconds to prepare. If no cooks
-    are available, the item is enqueued until a cook is available.
+    Assume each cook prepares one item at a time. Items are made at their
+    station (grill, fryer, ...) as declared in data/items.json, by any of
+    that station's cooks; items without a station, or every item when no
+    stations are given, go to a general station of `num_cooks` cooks.
+    When an item is received, it goes to an arbitrary available cook at
+    its station and takes {cook_time} seconds to prepare. If no cooks
+    there are available, the item is enqueued until one is, and the
+    scheduling policy decides which queued item goes next.
 
     Args:
       env (simpy.environment): the simulation environment
-      num_cooks (int): total resources available
+      num_cooks (int): cooks at the general station
+      policy (str): scheduling policy, one of scheduling.POLICIES
+      stations (dict): cooks at each station items can be routed to
+
+    Raises:
+      ValueError: if an item's station has no cooks in `stations`
     """
-    def __init__(self, env, num_cooks):
+    def __init__(self, env, num_cooks, policy='fifo', stations=None):
         self.env = env
-        self.resources = simpy.Resource(env, num_cooks)
-        # track order ids for items started to avoid updating the database
-        # as multiple items come in for the same order
-        self.orders_started = []
-
-    def prepare_food(self, order_id, cook_time):
-        """The cooking process for a single item
-
-        This should be called multiple times per order, once for each
-        item within the order.
+        self.policy = policy
+        self.priority = get_policy(policy)
+        self.stations = {}
+        # item name -> station, for items not made at the general station
+        self.routes = {}
+        if stations:
+            for item, station in item_stations.items():
+                if station is None:
+                    continue
+                if station not in stations:
+                    raise ValueError(f"{item} is made at {station!r}, which has no cooks")
+                self.routes[item] = station
+            for name, station_cooks in stations.items():
+                self.stations[name] = Station(env, name, station_cooks)
+        if len(self.routes) < len(cook_times):
+            self.stations.setdefault(GENERAL_STATION, Station(env, GENERAL_STATION, num_cooks))
+        self.num_cooks = sum(station.num_cooks for station in self.stations.values())
+
+    def station_for(self, item_name):
+        """Station an item is made at"""
+        return self.stations[self.routes.get(item_name, GENERAL_STATION)]
+
+    # stats over every station, as for a single pool of cooks
+    @property
+    def busy_time(self):
+        return sum(station.busy_time for station in self.stations.values())
+
+    @property
+    def items_requested(self):
+        return sum(station.items_requested for station in self.stations.values())
+
+    @property
+    def queue_length_total(self):
+        return sum(station.queue_length_total for station in self.stations.values())
+
+    @property
+    def max_queue_length(self):
+        return max(station.max_queue_length for station in self.stations.values())
+
+    @property
+    def queue_length(self):
+        """Items waiting for a cook right now"""
+        return sum(len(station.resources.queue) for station in self.stations.values())
+
+    @property
+    def cooks_busy(self):
+        """Cooks preparing an item right now"""
+        return sum(station.resources.count for station in self.stations.values())
+
+    def start_cooking(self, cook_time, station):
+        """Record a unit of an item starting to cook
 
         Args:
-          order_id (int): primary key for the order
           cook_time (int): the seconds for the item to be cooked
+          station (Station): the station cooking it
         """
-        if order_id not in self.orders_started:
-            self.orders_started.append(order_id)
-            update_db_order_started(self.env, order_id)
-        yield self.env.timeout(cook_time)
+        station.busy_time += cook_time
 
 
 ##########################
 ##      GENERATORS      ##
 ##########################
-def request_item(env, order, item, kitchen):
-    """Request a kitchen resource for one item in an order"""
-    with kitchen.resources.request() as request:
-        # waiting until a cook is available
-        yield request
-        # item is being cooked
-        yield env.process(kitchen.prepare_food(order['id'], cook_times[item['name']]))
-        # item done
+class ItemLine(object):
+    """One item of an order, with every unit cooked without a process of its own
+
+    Each unit is requested straight from its station's cooks. Callbacks
+    on the request and on the cooking timeout log the unit starting and
+    finishing, and then hand the cook back. So an order costs one process
+    plus an object per item line, rather than two processes per unit.
+
+    Args:
+      env (simpy.environment): the simulation environment
+      order (dict): the order
+      item (dict): the item line of the order
+      kitchen (Kitchen): the kitchen cooking it
+      countdown (Countdown): units of the order still to finish
+    """
+    def __init__(self, env, order, item, kitchen, countdown):
+        self.env = env
+        self.order_id = order['id']
+        self.name = item['name']
+        self.cook_time = cook_times[self.name]
+        self.kitchen = kitchen
+        self.station = kitchen.station_for(self.name)
+        self.countdown = countdown
+
+    def request(self, unit, priority):
+        """Queue one unit for a cook"""
+        request = self.station.resources.request(priority=priority)
+        self.station.record_request()
+        request.unit = unit
+        request.callbacks.append(self.start)
+
+    def start(self, request):
+        update_db_item_started(self.env, self.order_id, self.name, request.unit)
+        self.kitchen.start_cooking(self.cook_time, self.station)
+        self.env.timeout(self.cook_time, request).callbacks.append(self.finish)
+
+    def finish(self, cooked):
+        request = cooked.value
+        update_db_item_completed(self.env, self.order_id, self.name, request.unit)
+        # the cook is free one step later, as when each unit had a process:
+        # items requested at this same time join the queue first
+        self.env.timeout(0, request).callbacks.append(self.release)
+        self.countdown.finish_unit()
+
+    def release(self, event):
+        self.station.resources.release(event.value)
+
+
+class Countdown(object):
+    """Units of an order still to finish, and an event for when none are left
+
+    Args:
+      env (simpy.environment): the simulation environment
+      units (int): units in the order
+    """
+    def __init__(self, env, units):
+        self.remaining = units
+        self.done = env.event()
+
+    def finish_unit(self):
+        self.remaining -= 1
+        if not self.remaining:
+            self.done.succeed()
 
 
 def process_order(env, order, kitchen):
     """Process a single order"""
     # wait until {order_time} to trigger order
-    yield env.timeout(get_time(order['ordered_at'])-ENV_START)
+    yield env.timeout(max(0, order_time(order)-env.now))
     if not order['items']:
         log.info(f"Order {order['id']} has no items and will not be processed")
         return
     update_db_order_received(env, order)
-    events = []
+    order_cook_time = sum(cook_times[item['name']] * item['quantity'] for item in order['items'])
+    countdown = Countdown(env, sum(item['quantity'] for item in order['items']))
+    unit = 0
     for item in order['items']:
+        line = ItemLine(env, order, item, kitchen, countdown)
+        priority = kitchen.priority(order, line.cook_time, order_cook_time)
         for _ in range(item['quantity']):
             # request each order item simultaneously
-            events.append(env.process(request_item(env, order, item, kitchen))) 
+            line.request(unit, priority)
+            unit += 1
     # wait until all items in the order have been cooked
-    yield env.all_of(events)
+    if countdown.remaining:
+        yield countdown.done
     update_db_order_completed(env, order['id'])
 
 
+def feed_orders(env, stream, kitchen, schedule_ahead=STREAM_SCHEDULE_AHEAD):
+    """Start each order's process shortly before it arrives
+
+    SimPy only holds the orders due in the next `schedule_ahead` seconds,
+    plus the ones being cooked, instead of a process for every order.
+    """
+    for order in stream:
+        yield env.timeout(max(0, order_time(order)-schedule_ahead-env.now))
+        env.process(process_order(env, order, kitchen))
+
+
+def feed_live_orders(env, ingest, kitchen, first_id):
+    """Receive orders from an OrderIngest as they come in
+
+    Live orders are received at the first whole second of simulation
+    time after they are taken from the queue, which is checked every
+    POLL_INTERVAL seconds of wall time. Polls fall between whole seconds
+    whenever the speed isn't a multiple of 1 / POLL_INTERVAL, and event
+    times are whole seconds like those of loaded orders.
+    """
+    next_id = first_id
+    while True:
+        ingest.lag = realtime_lag(env)
+        for order in ingest.take():
+            order['id'] = next_id
+            order['ordered_at_epoch'] = math.ceil(env.now)
+            next_id += 1
+            env.process(process_order(env, order, kitchen))
+        # a real-time environment runs 1/factor simulated seconds per
+        # second, and an adaptive run may change its factor
+        yield env.timeout(POLL_INTERVAL / getattr(env, 'factor', 1))
+
+
+##########################
+##     HEAP ENGINE      ##
+##########################
+# database updates at the same timestamp run in this order
+ORDER_RECEIVED, ITEM_STARTED, ITEM_COMPLETED, ORDER_COMPLETED = range(4)
+
+
+def run_heap_kitchen(env, orders, kitchen, checkpoint_interval=0, checkpoint=None,
+                     monitor=None):
+    """Process orders through a HeapKitchen instead of SimPy processes
+
+    Makes the same database updates at the same simulated times as
+    `process_order`, with no per-item processes or events.
+
+    Args:
+      env (VirtualClock): the simulation clock
+      orders (list or OrderStream): orders with ids assigned
+      kitchen (HeapKitchen): the kitchen to process orders in
+      checkpoint_interval (float): wall-clock seconds between checkpoints;
+        0 to disable
+      checkpoint (dict): state saved by `save_checkpoint` to carry on
+        from, with `kitchen` already restored from it
+      monitor (LagMonitor): checks the lag of a real-time run as it goes
+    """
+    if isinstance(orders, OrderStream):
+        # already in arrival order, and read as they arrive
+        arrivals, num_orders = orders, None
+    else:
+        # sort is stable, so orders received together keep their original order
+        arrivals, num_orders = sorted(orders, key=order_time), len(orders)
+    pending, first_arrival = [], 0
+    if checkpoint is not None:
+        pending = [tuple(update) for update in checkpoint['pending']]
+        heapq.heapify(pending)
+        first_arrival = checkpoint['next_arrival']
+    last_checkpoint = time.monotonic()
+
+    def run_until(until):
+        # make updates due before `until`
+        while pending and pending[0][0] < until:
+            ts, kind, order_id, unit, item = heapq.heappop(pending)
+            env.advance(ts)
+            if monitor is not None:
+                monitor.poll()
+            if kind == ITEM_STARTED:
+                update_db_item_started(env, order_id, item, unit)
+            elif kind == ITEM_COMPLETED:
+                update_db_item_completed(env, order_id, item, unit)
+            else:
+                update_db_order_completed(env, order_id)
+
+    # a resumed stream reads past the orders that had already arrived
+    for idx, order in enumerate(islice(arrivals, first_arrival, None), first_arrival):
+        if checkpoint_interval and time.monotonic() - last_checkpoint >= checkpoint_interval:
+            save_checkpoint(env, kitchen, idx, pending, num_orders)
+            last_checkpoint = time.monotonic()
+        received_at = order_time(order)
+        run_until(received_at)
+        env.advance(received_at)
+        if monitor is not None:
+            monitor.poll()
+        if not order['items']:
+            log.info(f"Order {order['id']} has no items and will not be processed")
+            continue
+        update_db_order_received(env, order)
+        unit, completed_at = 0, received_at
+        for item in order['items']:
+            cook_time = cook_times[item['name']]
+            for _ in range(item['quantity']):
+                start = kitchen.request_item(received_at, cook_time)
+                heapq.heappush(pending, (start, ITEM_STARTED, order['id'], unit, item['name']))
+                heapq.heappush(pending, (start + cook_time, ITEM_COMPLETED, order['id'], unit, item['name']))
+                completed_at = max(completed_at, start + cook_time)
+                unit += 1
+        heapq.heappush(pending, (completed_at, ORDER_COMPLETED, order['id'], None, None))
+    run_until(float('inf'))
+
+
 ##########################
 ##      DB UPDATES      ##
 ##########################
+# the simulator only appends events; each flush projects them onto the
+# orders table (and with it the dashboard's rollups), see db/projection.py
+INSERT_EVENT_SQL = """
+INSERT INTO order_events (order_id, event, at, item, unit, customer_name, service, total_price, items)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);
+"""
+
+# buffer writes and flush them in bulk over one connection
+db_writer = BatchWriter(batch_size=DB_BATCH_SIZE, max_latency=DB_MAX_LATENCY,
+                        after_flush=PROJECT_ORDERS_SQL)
+event_publisher = EventPublisher()
+
+
+def publish_order_events(statements):
+    """Tell the dashboard about events once they are committed"""
+    event_publisher.publish([
+        (values[1], values[0], values[2]) for sql, values in statements if sql == INSERT_EVENT_SQL
+    ])
+
+db_writer.add_listener(publish_order_events)
+
+
+##########################
+##       METRICS        ##
+##########################
+registry.labels['process'] = 'simulator'
+events_logged = registry.counter(
+    'sim_events_total', 'Order events logged by the simulator', ['event'])
+registry.gauge(
+    'sim_events_per_second', 'Order events logged per second of wall time'
+).track(rate_of(events_logged))
+registry.gauge(
+    'db_writer_pending', 'Statements waiting to be flushed'
+).track(lambda: len(db_writer.pending))
+sim_clock = registry.gauge('sim_clock', 'Current simulation time (epoch seconds)')
+sim_lag = registry.gauge('sim_lag_seconds', 'Seconds a real-time run is behind the wall clock')
+sim_speed = registry.gauge('sim_speed', 'Multiple of real time a real-time run is going at')
+writes_coalesced = registry.gauge(
+    'db_writes_coalesced', 'Whether a lagging run is coalescing database writes')
+queue_length = registry.gauge('kitchen_queue_length', 'Items waiting for a cook')
+cook_utilization = registry.gauge('kitchen_cook_utilization', 'Share of cooks preparing an item')
+station_queue_length = registry.gauge(
+    'station_queue_length', 'Items waiting for a cook at each station', ['station'])
+station_utilization = registry.gauge(
+    'station_cook_utilization', "Share of each station's cooks preparing an item", ['station'])
+
+# snapshots of `registry` for the dashboard's /metrics
+metrics_reporter = MetricsReporter('simulator', METRICS_INTERVAL)
+
+
+def count_events(statements):
+    """Count the events in each flushed batch"""
+    counts = Counter(values[1] for sql, values in statements if sql == INSERT_EVENT_SQL)
+    for event, count in counts.items():
+        events_logged.inc(count, event=event)
+
+db_writer.add_listener(count_events)
+
+
+def track_kitchen(env, kitchen, monitor=None):
+    """Report the state of a run's kitchen along with its other metrics"""
+    sim_clock.track(lambda: env.now)
+    sim_lag.track(lambda: realtime_lag(env))
+    sim_speed.track(lambda: monitor.speed if monitor is not None else 0)
+    writes_coalesced.track(lambda: int(monitor is not None and monitor.coalesced))
+    queue_length.track(lambda: kitchen.queue_length)
+    cook_utilization.track(lambda: kitchen.cooks_busy / kitchen.num_cooks)
+    # only the SimPy kitchen has stations
+    station_queue_length.clear()
+    station_utilization.clear()
+    for name, station in getattr(kitchen, 'stations', {}).items():
+        station_queue_length.track(lambda s=station: len(s.resources.queue), station=name)
+        station_utilization.track(
+            lambda s=station: s.resources.count / s.num_cooks, station=name)
+
+
+# events a resumed run regenerates that were logged before the restart
+_events_to_skip = 0
+
+
+def log_event(env, order_id, event, item=None, unit=None, details=(None,) * 4):
+    """Append one event for an order at the current simulation time"""
+    global _events_to_skip
+    if _events_to_skip:
+        _events_to_skip -= 1
+        return
+    db_writer.write(INSERT_EVENT_SQL, (order_id, event, env.now, item, unit) + details)
+
+
 def update_db_order_received(env, order):
-    """Inserts an order when it is first received"""
-    SQL = f"""
-    INSERT INTO orders (id, status, received_at, customer_name, service, total_price, items)
-    VALUES (
-        {order['id']}
-        , 'Queued'
-        , {env.now}
-        , '{order['name']}'
-        , '{order['service']}'
-        , {sum([i['price_per_unit'] * i['quantity'] for i in order['items']])}
-        , '{json.dumps({i['name'].replace("'", "''"):i['quantity'] for i in order['items']})}'
-    );
-    """
-    with css_cursor() as cur:
-        execute_sql(SQL, cur)
+    """Logs an order when it is first received"""
+    log_event(env, order['id'], 'received', details=(
+        order['name'],
+        order['service'],
+        sum([i['price_per_unit'] * i['quantity'] for i in order['items']]),
+        json.dumps({i['name']:i['quantity'] for i in order['items']}),
+    ))
 
 
-def update_db_order_started(env, order_id):
-    """Updates the database when the order starts being prepared"""
-    SQL = f"""
-    UPDATE orders
-    SET started_at = {env.now}
-    , status = 'In Progress'
-    WHERE id = {order_id};
-    """
-    with css_cursor() as cur:
-        execute_sql(SQL, cur)
+def update_db_item_started(env, order_id, item, unit):
+    """Logs a unit of an item starting to be prepared"""
+    log_event(env, order_id, 'item_started', item, unit)
+
+
+def update_db_item_completed(env, order_id, item, unit):
+    """Logs a unit of an item being ready"""
+    log_event(env, order_id, 'item_completed', item, unit)
 
 
 def update_db_order_completed(env, order_id):
-    """Updates the database when the order is completed"""
-    SQL = f"""
-    UPDATE orders
-    SET completed_at = {env.now}
-    , status = 'Completed'
-    WHERE id = {order_id};
+    """Logs an order once all of its items are ready"""
+    log_event(env, order_id, 'order_completed')
+
+
+##########################
+##     CHECKPOINTS      ##
+##########################
+# saved in the same transaction as every event logged before it
+SAVE_CHECKPOINT_SQL = """
+INSERT OR REPLACE INTO checkpoints (id, event_seq, state)
+VALUES (1, (SELECT coalesce(max(seq), 0) FROM order_events), ?);
+"""
+
+LOAD_CHECKPOINT_SQL = """
+SELECT
+  event_seq
+, state
+, (SELECT coalesce(max(seq), 0) FROM order_events) as last_seq
+, (SELECT max(at) FROM order_events) as last_at
+FROM checkpoints
+WHERE id = 1;
+"""
+
+
+def save_checkpoint(env, kitchen, next_arrival, pending, num_orders):
+    """Save everything needed to carry on a heap engine run from here
+
+    The checkpoint is flushed together with every event logged so far,
+    so it never gets ahead of the event log.
+
+    Args:
+      env (VirtualClock): the simulation clock
+      kitchen (HeapKitchen): the kitchen
+      next_arrival (int): position of the next order to arrive, in
+        arrival order
+      pending (list): heap of updates not yet made
+      num_orders (int): orders in the run, to check the same orders are
+        resumed; None for a stream
+    """
+    state = {
+        'now': env.now,
+        'next_arrival': next_arrival,
+        'pending': pending,
+        'num_orders': num_orders,
+        'num_cooks': kitchen.num_cooks,
+        'kitchen': kitchen.state(),
+    }
+    db_writer.write(SAVE_CHECKPOINT_SQL, (json.dumps(state),))
+    db_writer.flush()
+
+
+def load_checkpoint():
+    """Latest checkpoint of an interrupted run, if there is one
+
+    Returns:
+      dict: the saved state, plus `events_logged_since` (events logged
+        after the checkpoint, which resuming regenerates) and `last_at`
+        (time of the last event logged); None if there is no checkpoint
     """
-    with css_cursor() as cur:
-        execute_sql(SQL, cur)
+    cur = db_writer.connection.cursor()
+    # databases from before checkpoints get the table, keeping their data
+    migrate(cur)
+    row = cur.execute(LOAD_CHECKPOINT_SQL).fetchone()
+    if row is None:
+        return None
+    event_seq, state, last_seq, last_at = row
+    checkpoint = json.loads(state)
+    checkpoint['events_logged_since'] = last_seq - event_seq
+    checkpoint['last_at'] = last_at
+    return checkpoint
+
+
+def clear_checkpoint():
+    """Forget the checkpoint once a run finishes"""
+    db_writer.write("DELETE FROM checkpoints;", ())
 
 
 ##########################
 ##    RUN SIMULATOR     ##
 ##########################
-def simulate_orders(orders, speed=SIMULATION_SPEED, num_cooks=NUM_COOKS):
+def write_profile(profiler):
+    """Save a run's profile and log where most of its time went"""
+    path = os.path.join(PROFILES_DIR, time.strftime('simulator-%Y%m%d-%H%M%S.folded'))
+    profiler.write(path)
+    hot = ', '.join(f"{name} {share:.0%}" for name, share in profiler.top(5))
+    log.info(f"Wrote {profiler.samples} stack samples to {path}; hottest: {hot}")
+
+
+def log_stations(kitchen, duration):
+    """Log how busy each station was over a run, busiest first"""
+    for station in sorted(kitchen.stations.values(), key=lambda s: -s.utilization(duration)):
+        log.info(
+            f"Station {station.name}: {station.num_cooks} cooks, "
+            f"{station.utilization(duration):.0%} utilization, "
+            f"queue {station.queue_length_total / max(station.items_requested, 1):.1f} avg, "
+            f"{station.max_queue_length} max")
+
+
+def simulate_orders(orders, speed=SIMULATION_SPEED, num_cooks=NUM_COOKS,
+                    realtime=REALTIME, reset_db=True, engine=ENGINE,
+                    checkpoint_interval=CHECKPOINT_INTERVAL, resume=False,
+                    ingest=None, profile=PROFILE, adaptive=ADAPTIVE_SPEED,
+                    policy=SCHEDULING_POLICY, stations=STATIONS):
     """Simulate orders coming in over time
 
     Args:
+      orders (list or OrderStream): orders to simulate; a stream is read
+        as the simulation reaches its orders rather than all up front
       speed (int): speed at which to run the simulator, where 1 is real
         time, 2 is twice as fast, etc.
       num_cooks (int): cooks (simulation resources) available to cook
         items in parallel
+      realtime (bool): if False, run on a virtual clock as fast as
+        possible and ignore `speed`; results are still streamed to the
+        database in batches
+      reset_db (bool): whether to recreate the orders table first; pass
+        False when `db_writer` points at a database prepared by the caller
+      engine (str): 'simpy' to run the SimPy model, or 'heap' to run the
+        equivalent HeapKitchen model, which is much faster on large runs
+      checkpoint_interval (float): wall-clock seconds between checkpoints
+        of a heap engine run; 0 to disable
+      resume (bool): carry on from the checkpoint of an interrupted run
+        of the same orders, if there is one, without resetting the
+        database. Only heap engine runs save checkpoints, so a resumed
+        run always uses the heap engine and the checkpoint's cook count
+      ingest (OrderIngest): also take live orders from this, after the
+        loaded ones; the run then goes on until it is interrupted. Only
+        real-time SimPy runs take live orders
+      profile (bool): sample the run's stacks and write them to
+        PROFILES_DIR in collapsed (flame graph) format
+      adaptive (bool): if a real-time run falls behind, coalesce database
+        writes and then lower its speed until it keeps up (see pacing.py).
+        Real-time runs log how far behind they are either way
+      policy (str): which queued item a free cook takes next, one of
+        scheduling.POLICIES. The heap engine only models 'fifo', and only
+        FIFO runs resume from checkpoints
+      stations (dict): cooks at each station items are routed to, on top
+        of the `num_cooks` general cooks for items without a station (see
+        `Kitchen`). Only SimPy runs model stations
+
+    Returns:
+      Kitchen: the kitchen (or HeapKitchen) after the run, with its
+        utilization stats
     """
-    # clear table before starting
-    recreate_orders_table()
+    global _events_to_skip
+    if engine not in ('simpy', 'heap'):
+        raise ValueError(f"Unknown simulation engine {engine!r}")
+    streaming = isinstance(orders, OrderStream)
+    num_orders = None if streaming else len(orders)
+    if ingest is not None and (engine != 'simpy' or not realtime or streaming or resume):
+        raise ValueError("Live orders need a real-time SimPy run of loaded orders")
+    get_policy(policy)
+    if engine == 'heap' and policy != 'fifo':
+        raise ValueError(f"The heap engine only schedules items FIFO, not {policy!r}")
+    if engine == 'heap' and stations:
+        raise ValueError("The heap engine only models one pool of cooks, not stations")
+    # checkpoints come from heap engine runs: FIFO, without stations
+    checkpoint = load_checkpoint() if resume and policy == 'fifo' and not stations else None
+    if checkpoint is not None and checkpoint['num_orders'] != num_orders:
+        raise ValueError(
+            f"Checkpoint is for {checkpoint['num_orders'] or 'a stream of'} orders, "
+            f"not {num_orders or 'a stream of'}")
+    if checkpoint is None and reset_db:
+        # clear table before starting
+        recreate_orders_table()
+    if streaming:
+        # the stream assigns ids as it reads orders
+        first = orders.peek()
+        env_start = ENV_START if first is None else order_time(first) - TIME_BUFFER
+    else:
+        # ids are set on the order dicts, so build them once (e.g. from an OrderTable)
+        orders = list(orders)
+        for idx, order in enumerate(orders):
+            order['id'] = idx+1
+        env_start = ENV_START
+
     # create an environment and start the setup process
-    env = simpy.rt.RealtimeEnvironment(
-        initial_time=ENV_START,
-        factor=1/speed,
-        strict=False,
-    )
-    kitchen = Kitchen(env, num_cooks=num_cooks)
-    for idx, order in enumerate(orders):
-        order['id'] = idx+1
-        env.process(process_order(env, order, kitchen))
+    if checkpoint is not None:
+        engine, num_cooks = 'heap', checkpoint['num_cooks']
+        _events_to_skip = checkpoint['events_logged_since']
+        # catch up to the last event logged without waiting
+        initial_time = max(checkpoint['now'], checkpoint['last_at'] or env_start)
+        log.info(
+            f"Resuming from checkpoint at {checkpoint['now']} "
+            f"({_events_to_skip} events already logged since)")
+    else:
+        _events_to_skip = 0
+        initial_time = env_start
+    if engine == 'heap':
+        if realtime:
+            env = RealtimeClock(initial_time=initial_time, factor=1/speed)
+        else:
+            env = VirtualClock(initial_time=initial_time)
+        kitchen = HeapKitchen(env, num_cooks=num_cooks)
+        if checkpoint is not None:
+            kitchen.load_state(checkpoint['kitchen'])
+            env.now = checkpoint['now']
+        monitor = LagMonitor(env, db_writer, speed, adaptive=adaptive) if realtime else None
+        run = lambda: run_heap_kitchen(
+            env, orders, kitchen,
+            checkpoint_interval=checkpoint_interval,
+            checkpoint=checkpoint,
+            monitor=monitor,
+        )
+    else:
+        if realtime:
+            env = PacedEnvironment(initial_time=env_start, factor=1/speed)
+        else:
+            env = simpy.Environment(initial_time=env_start)
+        kitchen = Kitchen(env, num_cooks=num_cooks, policy=policy, stations=stations)
+        monitor = LagMonitor(env, db_writer, speed, adaptive=adaptive) if realtime else None
+        if monitor is not None:
+            env.process(monitor_lag(env, monitor))
+        if streaming:
+            env.process(feed_orders(env, orders, kitchen))
+        else:
+            for order in orders:
+                env.process(process_order(env, order, kitchen))
+        if ingest is not None:
+            # live order ids follow those of the loaded orders
+            env.process(feed_live_orders(env, ingest, kitchen, len(orders)+1))
+            ingest.start()
+        run = env.run
 
     # run simulation
-    log.info(f"Starting simulation at speed {speed}X with {num_cooks} cooks")
-    env.run()
+    if realtime:
+        log.info(f"Starting {engine} simulation at speed {speed}X with {kitchen.num_cooks} {policy} cooks")
+    else:
+        log.info(f"Starting {engine} batch simulation with {kitchen.num_cooks} {policy} cooks")
+    track_kitchen(env, kitchen, monitor)
+    profiler = SamplingProfiler(PROFILE_INTERVAL) if profile else None
+    db_writer.start()
+    metrics_reporter.start()
+    if profiler is not None:
+        profiler.start()
+    start = time.perf_counter()
+    try:
+        run()
+        clear_checkpoint()
+    finally:
+        if ingest is not None:
+            ingest.stop()
+        if monitor is not None:
+            monitor.finish()
+        # write out anything still buffered
+        db_writer.stop()
+        metrics_reporter.stop()
+        if profiler is not None:
+            profiler.stop()
+            write_profile(profiler)
+    elapsed = time.perf_counter() - start
+    num_orders = orders.count if streaming else len(orders)
+    if ingest is not None:
+        num_orders += ingest.taken
+    log.info(
+        f"Simulated {num_orders} orders in {elapsed:.2f}s "
+        f"({num_orders / max(elapsed, 1e-9):.0f} orders/sec)"
+    )
+    if stations and isinstance(kitchen, Kitchen):
+        log_stations(kitchen, env.now - env_start)
+    return kitchen
 
 
 if __name__ == '__main__':
-    simulate_orders(orders)
+    # a single kitchen replaces any earlier fleet on the dashboard
+    clear_manifest()
+    clear_metrics()
+    if INGEST_PORT:
+        simulate_orders(orders, ingest=OrderIngest(cook_times, port=INGEST_PORT))
+    elif STREAM_ORDERS:
+        simulate_orders(OrderStream(STREAM_ORDERS, lookahead=STREAM_LOOKAHEAD), resume=RESUME)
+    else:
+        simulate_orders(orders, resume=RESUME)
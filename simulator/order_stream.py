@@ -0,0 +1,140 @@
+"""Read orders from a file as the simulation needs them
+
+Instead of loading every order up front, a stream decodes orders one at a
+time from a JSON Lines file (or a JSON array, like data/orders.json) and
+hands them out in arrival order. Files only need to be roughly sorted:
+orders are held in a heap until they are `lookahead` seconds behind the
+latest order read, so memory grows with the orders in that window rather
+than with the file.
+
+An order that turns up after orders it should have preceded is received as
+soon as it is read, like a late ticket, rather than in the past.
+"""
+
+import heapq
+import json
+import logging
+import sys
+
+from order_cache import get_time
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+log.addHandler(
+    logging.StreamHandler(sys.stderr)
+)
+
+CHUNK_SIZE = 1 << 16
+# characters between orders in either format
+SEPARATORS = ' \t\r\n,'
+
+
+def read_orders(path, chunk_size=CHUNK_SIZE):
+    """Decode orders one at a time from a JSON Lines file or a JSON array
+
+    Args:
+      path (str): path to the orders file
+      chunk_size (int): characters read from the file at a time
+
+    Yields:
+      dict: orders in file order
+    """
+    decoder = json.JSONDecoder()
+    with open(path) as f:
+        buffer, pos, eof = '', 0, False
+        started = False
+        while True:
+            # skip to the start of the next order
+            while pos < len(buffer) and buffer[pos] in SEPARATORS:
+                pos += 1
+            if pos == len(buffer):
+                if eof:
+                    return
+                buffer, pos = f.read(chunk_size), 0
+                eof = not buffer
+                continue
+            if not started:
+                started = True
+                if buffer[pos] == '[':
+                    pos += 1
+                    continue
+            if buffer[pos] == ']':
+                return
+            try:
+                order, end = decoder.raw_decode(buffer, pos)
+            except ValueError:
+                # the order runs past the end of what was read so far
+                if eof:
+                    raise
+                chunk = f.read(chunk_size)
+                buffer, pos, eof = buffer[pos:] + chunk, 0, not chunk
+                continue
+            pos = end
+            yield order
+
+
+class OrderStream(object):
+    """Orders of a file in arrival order, read only as far as needed
+
+    Each order gets its `id` (its position in the file, from 1, as for a
+    loaded file) and its parsed `ordered_at_epoch` as it is read.
+
+    Args:
+      path (str): path to the orders file
+      lookahead (int): seconds by which orders in the file may be out of
+        arrival order
+    """
+    def __init__(self, path, lookahead):
+        self.path = path
+        self.lookahead = lookahead
+        # orders read from the file so far
+        self.count = 0
+        self._orders = self._read()
+        self._heap = []
+        self._exhausted = False
+        # the latest arrival time read and the latest handed out
+        self._latest = self._released = None
+
+    def _read(self):
+        for order in read_orders(self.path):
+            self.count += 1
+            order['id'] = self.count
+            if order.get('ordered_at_epoch') is None:
+                order['ordered_at_epoch'] = get_time(order['ordered_at'])
+            yield order
+
+    def _fill(self, until):
+        """Read at least one order, and on until one arrives after `until`"""
+        while not self._exhausted and (not self._heap or self._latest <= until):
+            order = next(self._orders, None)
+            if order is None:
+                self._exhausted = True
+                return
+            epoch = order['ordered_at_epoch']
+            if self._released is not None and epoch < self._released:
+                log.warning(
+                    f"Order {order['id']} arrives {self._released - epoch}s after orders "
+                    f"it precedes; receiving it at {self._released}")
+                epoch = order['ordered_at_epoch'] = self._released
+            self._latest = epoch if self._latest is None else max(self._latest, epoch)
+            # ties keep file order, as a stable sort would
+            heapq.heappush(self._heap, (epoch, order['id'], order))
+
+    def peek(self):
+        """The next order without handing it out, or None at the end"""
+        self._fill(float('-inf'))
+        if not self._heap:
+            return None
+        # only orders within `lookahead` of the earliest can still precede it
+        self._fill(self._heap[0][0] + self.lookahead)
+        return self._heap[0][2]
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.peek() is None:
+            raise StopIteration
+        epoch, _, order = heapq.heappop(self._heap)
+        self._released = epoch
+        return order
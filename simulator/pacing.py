@@ -0,0 +1,176 @@
+"""Measure how far a real-time simulation is behind, and back off if asked
+
+A real-time run (SimPy's non-strict `RealtimeEnvironment` or the heap
+engine's `RealtimeClock`) that can't keep up with its speed silently
+drifts behind the wall clock. `LagMonitor` checks the drift every few
+wall seconds and logs it to the `run_lag` table with the run's events.
+In adaptive mode it also backs off while the run keeps falling further
+behind: first by coalescing database writes into bigger, less frequent
+batches, then by halving the speed, down to a minimum. Once the run has
+stayed caught up for a few checks it steps back up the same way, to the
+speed it was asked for.
+"""
+
+import logging
+import sys
+import time
+
+import simpy
+
+from parameters.simulation_parameters import (
+    ADAPTIVE_SPEED,
+    LAG_CHECK_INTERVAL,
+    LAG_THRESHOLD,
+    MIN_SIMULATION_SPEED,
+)
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+log.addHandler(
+    logging.StreamHandler(sys.stderr)
+)
+
+# coalesced writes flush this many times fewer, bigger batches
+COALESCE_FACTOR = 4
+# consecutive checks a run must stay caught up for before speeding up again
+CAUGHT_UP_CHECKS = 5
+
+INSERT_LAG_SQL = """
+INSERT INTO run_lag (at, checked_at, lag, speed, coalesced)
+VALUES (?, ?, ?, ?, ?);
+"""
+
+
+def realtime_lag(env):
+    """Wall seconds a real-time simulation is behind schedule; 0 if not real time"""
+    if not hasattr(env, 'real_start'):
+        return 0.0
+    due = env.real_start + (env.now - env.env_start) * env.factor
+    return max(0.0, time.monotonic() - due)
+
+
+class PacedEnvironment(simpy.rt.RealtimeEnvironment):
+    """Non-strict real-time SimPy environment whose speed can change mid-run
+
+    Args:
+      initial_time (int): simulation start time
+      factor (float): real seconds per simulated second
+    """
+    def __init__(self, initial_time=0, factor=1.0):
+        super().__init__(initial_time=initial_time, factor=factor, strict=False)
+
+    def set_factor(self, factor):
+        """Go on at a new pace from the current time, forgiving any lag"""
+        self.real_start = time.monotonic()
+        self.env_start = self.now
+        self._factor = factor
+
+
+class LagMonitor(object):
+    """Measure a real-time run's lag and, if adaptive, adjust its pace
+
+    Slowing down starts the new pace from the current time, so the lag
+    measured after that is against the new pace.
+
+    Args:
+      env (PacedEnvironment or RealtimeClock): the run's clock
+      writer (BatchWriter): writer the checks are logged through, and
+        whose batching is coalesced when backing off
+      speed (float): speed the run was asked to go at
+      adaptive (bool): back off when the run falls behind, rather than
+        just measuring the lag
+      threshold (float): wall seconds behind schedule past which to back off
+      min_speed (float): speed not to slow down beyond
+      interval (float): wall seconds between checks
+    """
+    def __init__(self, env, writer, speed, adaptive=ADAPTIVE_SPEED,
+                 threshold=LAG_THRESHOLD, min_speed=MIN_SIMULATION_SPEED,
+                 interval=LAG_CHECK_INTERVAL):
+        self.env = env
+        self.writer = writer
+        self.target_speed = speed
+        self.speed = speed
+        self.adaptive = adaptive
+        self.threshold = threshold
+        self.min_speed = min(min_speed, speed)
+        self.interval = interval
+        self.coalesced = False
+        self.lag = 0.0
+        self.max_lag = 0.0
+        # lag at the previous check, against the current pace
+        self._last_lag = 0.0
+        self.checks = 0
+        self.caught_up = 0
+        self._batching = (writer.batch_size, writer.max_latency)
+        self._last_check = time.monotonic()
+
+    def poll(self):
+        """Check the lag if `interval` has passed since the last check"""
+        if time.monotonic() - self._last_check >= self.interval:
+            self.check()
+
+    def check(self, adapt=True):
+        """Measure the lag, log it and, if adaptive, adapt to it"""
+        self._last_check = time.monotonic()
+        self.lag = realtime_lag(self.env)
+        previous, self._last_lag = self._last_lag, self.lag
+        self.max_lag = max(self.max_lag, self.lag)
+        self.checks += 1
+        self.caught_up = self.caught_up + 1 if self.lag <= self.threshold / 4 else 0
+        if self.adaptive and adapt:
+            if self.lag > self.threshold and self.lag >= previous:
+                # behind, and not catching up
+                self.back_off()
+            elif self.caught_up >= CAUGHT_UP_CHECKS:
+                self.step_up()
+                self.caught_up = 0
+        self.writer.write(INSERT_LAG_SQL, (
+            self.env.now, time.time(), self.lag, self.speed, int(self.coalesced)))
+
+    def back_off(self):
+        if not self.coalesced:
+            self.coalesce(True)
+        elif self.speed > self.min_speed:
+            self.set_speed(max(self.speed / 2, self.min_speed))
+
+    def step_up(self):
+        if self.speed < self.target_speed:
+            self.set_speed(min(self.speed * 2, self.target_speed))
+        elif self.coalesced:
+            self.coalesce(False)
+
+    def coalesce(self, coalesced):
+        """Flush bigger batches less often while behind, or go back to normal"""
+        batch_size, max_latency = self._batching
+        if coalesced:
+            batch_size, max_latency = batch_size * COALESCE_FACTOR, max_latency * COALESCE_FACTOR
+        self.writer.batch_size, self.writer.max_latency = batch_size, max_latency
+        self.coalesced = coalesced
+        log.info(
+            f"{self.lag:.1f}s behind; {'coalescing' if coalesced else 'no longer coalescing'} "
+            f"database writes")
+
+    def set_speed(self, speed):
+        log.info(f"{self.lag:.1f}s behind; going from speed {self.speed:g}X to {speed:g}X")
+        self.speed = speed
+        self.env.set_factor(1 / speed)
+        self._last_lag = 0.0
+
+    def finish(self):
+        """Log the final lag, put the writer's batching back and sum up the run"""
+        self.check(adapt=False)
+        if self.coalesced:
+            self.coalesce(False)
+        log.info(
+            f"Max lag {self.max_lag:.1f}s over {self.checks} checks; "
+            f"finished at speed {self.speed:g}X of {self.target_speed:g}X")
+
+
+def monitor_lag(env, monitor):
+    """SimPy process checking a run's lag until nothing else is scheduled"""
+    while True:
+        # a real-time environment runs 1/factor simulated seconds per second
+        yield env.timeout(monitor.interval / env.factor)
+        monitor.check()
+        if env.peek() == float('inf'):
+            return
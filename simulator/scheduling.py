@@ -0,0 +1,86 @@
+"""Policies deciding which queued item a free cook takes next
+
+A policy gives each unit of an item a priority when it is requested; a
+free cook takes the queued unit with the lowest priority, and units with
+the same priority in the order they were requested. Each policy is a
+function of the order, the unit's cook time and the total cook time of
+its order.
+
+FIFO (every unit the same priority) is the kitchen's original behavior.
+An order's units are all requested when it arrives, so under FIFO a
+large order is served before every order behind it, however small.
+The other policies let small orders through:
+  shortest_cook_time: quickest units first
+  smallest_order: units of the orders with the least cooking to do first,
+    so orders are finished rather than interleaved
+  service_priority: orders from the services in SERVICE_PRIORITY first,
+    in that order, then everyone else
+"""
+
+import simpy
+from simpy.resources.resource import SortedQueue
+
+from parameters.simulation_parameters import SERVICE_PRIORITY
+
+
+def fifo(order, cook_time, order_cook_time):
+    return 0
+
+
+def shortest_cook_time(order, cook_time, order_cook_time):
+    return cook_time
+
+
+def smallest_order(order, cook_time, order_cook_time):
+    return order_cook_time
+
+
+def service_priority(order, cook_time, order_cook_time):
+    try:
+        return SERVICE_PRIORITY.index(order['service'])
+    except ValueError:
+        return len(SERVICE_PRIORITY)
+
+
+POLICIES = {
+    'fifo': fifo,
+    'shortest_cook_time': shortest_cook_time,
+    'smallest_order': smallest_order,
+    'service_priority': service_priority,
+}
+
+
+class RequestQueue(SortedQueue):
+    """SimPy's queue of prioritized requests, without the sort per request
+
+    `SortedQueue` re-sorts the whole queue on every request, which makes
+    a long queue quadratic. Inserting each request after those with the
+    same or a lower key keeps the same order.
+    """
+    def append(self, item):
+        if self.maxlen is not None and len(self) >= self.maxlen:
+            raise RuntimeError('Cannot append event. Queue is full.')
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if item.key < self[mid].key:
+                hi = mid
+            else:
+                lo = mid + 1
+        self.insert(lo, item)
+
+
+class PriorityResource(simpy.PriorityResource):
+    """`simpy.PriorityResource` with a queue that scales to long queues"""
+    PutQueue = RequestQueue
+
+
+def get_policy(name):
+    """Priority function of the policy called `name`
+
+    Raises:
+      ValueError: if there is no such policy
+    """
+    if name not in POLICIES:
+        raise ValueError(f"Unknown scheduling policy {name!r}; choose from {sorted(POLICIES)}")
+    return POLICIES[name]
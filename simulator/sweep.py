@@ -0,0 +1,206 @@
+"""Sweep simulator parameters in parallel and summarize each configuration
+
+Each configuration runs as an isolated batch simulation in its own worker
+process, writing to a private in-memory database, so a sweep uses every
+core and never touches the dashboard's database.
+
+Usage:
+  python sweep.py --num-cooks 80 100 120 140 --engine heap --output sweep.csv
+  python sweep.py --policy fifo shortest_cook_time smallest_order service_priority
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import itertools
+import logging
+import os
+import sys
+
+from db.migrations.migrate import migrate
+from db.projection import PROJECT_ORDERS_SQL
+from db.writer import BatchWriter
+import order_simulator
+from order_simulator import (
+    ENV_START,
+    orders,
+    simulate_orders,
+)
+from parameters.simulation_parameters import (
+    ENGINE,
+    NUM_COOKS,
+    SCHEDULING_POLICY,
+)
+from scheduling import POLICIES
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+log.addHandler(
+    logging.StreamHandler(sys.stderr)
+)
+
+RESULT_COLUMNS = [
+    'num_cooks',
+    'policy',
+    'orders',
+    'p50_fulfillment_time',
+    'p95_fulfillment_time',
+    'p99_fulfillment_time',
+    'avg_queue_length',
+    'max_queue_length',
+    'cook_utilization',
+    'station_utilization',
+]
+
+# orders shared by every configuration a worker runs
+_worker_orders = None
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an already sorted list
+
+    Args:
+      values (list): sorted values
+      pct (float): percentile between 0 and 100
+    """
+    if not values:
+        return None
+    rank = max(int(-(-pct * len(values) // 100)), 1)
+    return values[rank - 1]
+
+
+def build_grid(**params):
+    """Cartesian product of parameter values as a list of kwargs dicts
+
+    Args:
+      params: lists of values keyed by `simulate_orders` argument name
+    """
+    keys = sorted(params)
+    return [
+        dict(zip(keys, values))
+        for values in itertools.product(*[params[k] for k in keys])
+    ]
+
+
+def summarize(conn, kitchen, num_orders):
+    """Compute the results row for one finished simulation
+
+    Args:
+      conn (connection): connection holding the run's orders table
+      kitchen (Kitchen): the kitchen after the run
+      num_orders (int): orders submitted to the run
+    """
+    fulfillment_times = [row[0] for row in conn.execute("""
+        SELECT completed_at - received_at
+        FROM orders
+        WHERE completed_at IS NOT NULL
+        ORDER BY 1;
+    """)]
+    first_order, = conn.execute("SELECT min(received_at) FROM orders;").fetchone()
+    duration = kitchen.env.now - (first_order or ENV_START)
+    capacity = kitchen.num_cooks * duration
+    return {
+        'num_cooks': kitchen.num_cooks,
+        'policy': kitchen.policy,
+        'orders': num_orders,
+        'p50_fulfillment_time': percentile(fulfillment_times, 50),
+        'p95_fulfillment_time': percentile(fulfillment_times, 95),
+        'p99_fulfillment_time': percentile(fulfillment_times, 99),
+        'avg_queue_length': round(
+            kitchen.queue_length_total / max(kitchen.items_requested, 1), 2),
+        'max_queue_length': kitchen.max_queue_length,
+        'cook_utilization': round(kitchen.busy_time / capacity, 4) if capacity else 0,
+        # e.g. 'grill=0.97 fryer=0.52'; the heap engine has no stations
+        'station_utilization': ' '.join(
+            f'{station.name}={station.utilization(duration):.4f}'
+            for station in getattr(kitchen, 'stations', {}).values()
+        ),
+    }
+
+
+def run_configuration(params, orders_to_run=None):
+    """Run one batch simulation against a private in-memory database
+
+    Args:
+      params (dict): keyword arguments for `simulate_orders`
+      orders_to_run (list): orders to simulate; defaults to the worker's
+        shared order set
+    """
+    orders_to_run = orders_to_run if orders_to_run is not None else _worker_orders
+    writer = BatchWriter(database=':memory:', batch_size=10000, max_latency=60,
+                         after_flush=PROJECT_ORDERS_SQL)
+    migrate(writer.connection.cursor())
+    previous_writer, order_simulator.db_writer = order_simulator.db_writer, writer
+    try:
+        kitchen = simulate_orders(
+            [dict(order) for order in orders_to_run],
+            realtime=False,
+            reset_db=False,
+            **params
+        )
+        return summarize(writer.connection, kitchen, len(orders_to_run))
+    finally:
+        order_simulator.db_writer = previous_writer
+        writer.close()
+
+
+def _init_worker(worker_orders):
+    global _worker_orders
+    _worker_orders = worker_orders
+    # per-run logs and metrics from many processes are just noise
+    order_simulator.log.setLevel(logging.WARNING)
+    order_simulator.metrics_reporter.interval = 0
+
+
+def sweep(grid, orders_to_run, max_workers=None):
+    """Run every configuration in the grid across a process pool
+
+    Args:
+      grid (list): kwargs dicts for `simulate_orders`, one per configuration
+      orders_to_run (list): orders every configuration simulates
+      max_workers (int): worker processes; defaults to the number of cores
+
+    Returns:
+      list: one results row per configuration, in grid order
+    """
+    max_workers = max_workers or os.cpu_count()
+    log.info(f"Running {len(grid)} configurations on {max_workers} workers")
+    with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_init_worker,
+            initargs=(orders_to_run,)) as executor:
+        return list(executor.map(run_configuration, grid))
+
+
+def write_results(results, f):
+    """Write results rows as CSV"""
+    writer = csv.DictWriter(f, fieldnames=RESULT_COLUMNS)
+    writer.writeheader()
+    writer.writerows(results)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--num-cooks', type=int, nargs='+', default=[NUM_COOKS],
+                        help='cook counts to simulate')
+    parser.add_argument('--engine', choices=['simpy', 'heap'], default=ENGINE,
+                        help='simulation engine to run every configuration on')
+    parser.add_argument('--policy', nargs='+', choices=sorted(POLICIES),
+                        default=[SCHEDULING_POLICY],
+                        help='scheduling policies to compare; only fifo runs on the heap engine')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='worker processes (default: all cores)')
+    parser.add_argument('--output', default=None,
+                        help='CSV file to write results to (default: stdout)')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    grid = build_grid(num_cooks=args.num_cooks, engine=[args.engine], policy=args.policy)
+    results = sweep(grid, orders, max_workers=args.workers)
+    if args.output:
+        with open(args.output, 'w', newline='') as f:
+            write_results(results, f)
+    else:
+        write_results(results, sys.stdout)
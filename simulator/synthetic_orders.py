@@ -0,0 +1,123 @@
+"""Deterministic synthetic orders with a realistic mix, at any scale
+
+Orders are drawn from the menu in data/items.json. A few dishes account
+for most orders, most orders have one or two dishes, and arrivals follow
+a daily cycle with lunch and dinner rushes. The same seed always gives
+the same orders. Orders are generated lazily, so 10M of them can be
+written out without holding them in memory.
+
+Usage:
+  python synthetic_orders.py --orders 1000000 --output data/synthetic.jsonl
+"""
+
+import argparse
+from datetime import datetime
+import json
+import math
+import random
+
+# when the generated orders start
+START = '2019-02-18T16:00:00'
+SERVICES = ['Grubhub', 'Postmates', 'Caviar', 'DoorDash', 'UberEats']
+SERVICE_WEIGHTS = [30, 25, 15, 20, 10]
+# distinct customers; regulars order more than once
+NUM_CUSTOMERS = 50000
+# share of the mean order rate at each hour of the day
+HOURLY_RATE = [
+    0.2, 0.1, 0.05, 0.05, 0.05, 0.1, 0.3, 0.6, 0.8, 0.8, 0.9, 1.4,
+    2.2, 1.8, 1.0, 0.8, 1.0, 1.6, 2.4, 2.6, 1.8, 1.2, 0.7, 0.4,
+]
+
+
+def load_menu(path='data/items.json'):
+    with open(path) as f:
+        return json.load(f)
+
+
+def parse_size(size):
+    """Order count from a size like '10k' or '1m'"""
+    size = str(size).lower()
+    scale = {'k': 10**3, 'm': 10**6}.get(size[-1])
+    return int(float(size[:-1]) * scale) if scale else int(size)
+
+
+def format_size(num_orders):
+    """Inverse of `parse_size` for round sizes, e.g. 10000 -> '10k'"""
+    for suffix, scale in [('m', 10**6), ('k', 10**3)]:
+        if num_orders >= scale and num_orders % scale == 0:
+            return f'{num_orders // scale}{suffix}'
+    return str(num_orders)
+
+
+def generate_orders(num_orders, seed=0, orders_per_hour=300, menu=None):
+    """Yield synthetic orders in arrival order
+
+    Args:
+      num_orders (int): orders to generate
+      seed (int): random seed
+      orders_per_hour (float): mean arrival rate over a day
+      menu (list): items with `name` and `cook_time`; data/items.json by default
+
+    Yields:
+      dict: orders in the data/orders.json shape
+    """
+    rng = random.Random(seed)
+    menu = menu if menu is not None else load_menu()
+    # popularity falls off with rank (Zipf), in an order fixed by the seed
+    dishes = [item['name'] for item in menu]
+    rng.shuffle(dishes)
+    popularity = [1 / rank for rank in range(1, len(dishes) + 1)]
+    # dishes that take longer to cook cost more
+    prices = {item['name']: 5 + item['cook_time'] // 60 for item in menu}
+
+    peak_rate = max(HOURLY_RATE) * orders_per_hour / 3600
+    ts = datetime.strptime(START, '%Y-%m-%dT%H:%M:%S').timestamp()
+    for _ in range(num_orders):
+        # thinned Poisson process following the daily cycle
+        while True:
+            ts += rng.expovariate(peak_rate)
+            hour = datetime.fromtimestamp(ts).hour
+            if rng.random() * max(HOURLY_RATE) < HOURLY_RATE[hour]:
+                break
+        num_dishes = min(1 + int(math.log(1 - rng.random()) / math.log(0.45)), len(dishes))
+        chosen = []
+        while len(chosen) < num_dishes:
+            dish = rng.choices(dishes, popularity)[0]
+            if dish not in chosen:
+                chosen.append(dish)
+        yield {
+            'name': f'Customer {int(rng.paretovariate(1.2)) % NUM_CUSTOMERS}',
+            'service': rng.choices(SERVICES, SERVICE_WEIGHTS)[0],
+            'ordered_at': datetime.fromtimestamp(ts).strftime('%Y-%m-%dT%H:%M:%S.%f'),
+            'items': [
+                {'name': dish, 'price_per_unit': prices[dish], 'quantity': rng.choices([1, 2, 3], [70, 20, 10])[0]}
+                for dish in chosen
+            ],
+        }
+
+
+def write_orders(orders, path):
+    """Write orders as JSON Lines, one at a time
+
+    Returns:
+      int: orders written
+    """
+    count = 0
+    with open(path, 'w') as f:
+        for order in orders:
+            f.write(json.dumps(order))
+            f.write('\n')
+            count += 1
+    return count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--orders', default='100k', help="order count, e.g. 5000, 10k or 1m")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--orders-per-hour', type=float, default=300)
+    parser.add_argument('--output', required=True)
+    args = parser.parse_args()
+    count = write_orders(
+        generate_orders(parse_size(args.orders), args.seed, args.orders_per_hour), args.output)
+    print(f"Wrote {count} orders to {args.output}")
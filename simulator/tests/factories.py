@@ -0,0 +1,54 @@
+from datetime import datetime
+import random
+
+from order_simulator import (
+    cook_times,
+    get_time,
+)
+
+BASE_TIME = get_time('2019-02-18T16:01:00')
+
+
+def make_order(items=(('Dish 1', 1),), service='SoTesty', delay=0):
+    """An order placed `delay` seconds after BASE_TIME
+
+    Args:
+      items (list): (menu item name, quantity) pairs
+      service (str): delivery service the order came from
+      delay (float): seconds after BASE_TIME it was ordered at
+
+    Returns:
+      dict: the order as it appears in orders.json
+    """
+    return {
+        'items': [{'name': name, 'price_per_unit': 1, 'quantity': quantity} for name, quantity in items],
+        'name': 'Testy McTestFace',
+        'service': service,
+        'ordered_at': datetime.fromtimestamp(BASE_TIME + delay).strftime('%Y-%m-%dT%H:%M:%S.%f'),
+    }
+
+
+def random_orders(num_orders, seed, max_gap=60):
+    """Orders with random items and arrival gaps, including simultaneous ones
+
+    Some orders have no items, and the orders are shuffled since arrival
+    order in the file shouldn't matter.
+
+    Args:
+      num_orders (int): orders to make
+      seed (int): seed for the random generator
+      max_gap (int): most seconds between one order and the next
+
+    Returns:
+      list: orders as they appear in orders.json
+    """
+    rng = random.Random(seed)
+    menu_items = sorted(cook_times)
+    orders = []
+    delay = 0
+    for _ in range(num_orders):
+        delay += rng.choice([0, 0, rng.randint(1, max_gap)])
+        items = [(rng.choice(menu_items), rng.randint(1, 4)) for _ in range(rng.choice([0, 1, 1, 2, 3, 5]))]
+        orders.append(make_order(items, delay=delay))
+    rng.shuffle(orders)
+    return orders
@@ -0,0 +1,88 @@
+import os
+import tempfile
+from unittest import (
+    mock,
+    TestCase,
+)
+
+from benchmark import run_simulation
+from db.benchmark import (
+    compare,
+    result,
+)
+from synthetic_orders import (
+    format_size,
+    generate_orders,
+    load_menu,
+    parse_size,
+    write_orders,
+)
+
+
+class TestSyntheticOrders(TestCase):
+
+    def test_deterministic(self):
+        """The same seed always gives the same orders"""
+        assert list(generate_orders(50, seed=3)) == list(generate_orders(50, seed=3))
+        assert list(generate_orders(50, seed=3)) != list(generate_orders(50, seed=4))
+
+
+    def test_orders_from_menu(self):
+        """Synthetic orders arrive in order and only use items on the menu"""
+        menu = {item['name'] for item in load_menu()}
+        orders = list(generate_orders(500))
+        assert [o['ordered_at'] for o in orders] == sorted(o['ordered_at'] for o in orders)
+        for order in orders:
+            assert order['items']
+            for item in order['items']:
+                assert item['name'] in menu
+                assert item['quantity'] in (1, 2, 3)
+
+
+    def test_sizes(self):
+        """Sizes parse from and format to their short form"""
+        assert parse_size('10k') == 10000
+        assert parse_size('1m') == 1000000
+        assert parse_size('250') == 250
+        assert format_size(100000) == '100k'
+        assert format_size(10000000) == '10m'
+        assert format_size(1500) == '1500'
+
+
+class TestBenchmark(TestCase):
+
+    def test_compare(self):
+        """Only changes past the tolerance, and the minimum for timings, regress"""
+        baseline = {
+            'throughput': result(1000, 'events/sec', 'higher'),
+            'query': result(0.1, 'seconds', 'lower'),
+            'tiny_query': result(0.001, 'seconds', 'lower'),
+        }
+        results = {
+            'throughput': result(700, 'events/sec', 'higher'),
+            'query': result(0.11, 'seconds', 'lower'),
+            'tiny_query': result(0.003, 'seconds', 'lower'),
+            'new_query': result(0.5, 'seconds', 'lower'),
+        }
+        rows = {row[0]: row for row in compare(results, baseline, tolerance=0.25)}
+        # 30% fewer events per second
+        assert rows['throughput'][4]
+        # 10% slower is within tolerance
+        assert not rows['query'][4]
+        # three times slower, but by less than the noise floor
+        assert not rows['tiny_query'][4]
+        # nothing to compare against
+        assert rows['new_query'][1:] == (None, 0.5, None, False)
+
+
+    def test_run_simulation(self):
+        """Streams orders through a batch run into a fresh database"""
+        with tempfile.TemporaryDirectory() as tmpdir, \
+                mock.patch('order_simulator.metrics_reporter.interval', 0):
+            orders_path = os.path.join(tmpdir, 'orders.jsonl')
+            write_orders(generate_orders(100, seed=1), orders_path)
+            run = run_simulation(orders_path, os.path.join(tmpdir, 'bench.db'), 'heap', num_cooks=5)
+        assert run['orders'] == 100
+        # received and completed per order, and a start and finish per unit
+        assert run['events'] > 200
+        assert run['statements'] >= run['events']
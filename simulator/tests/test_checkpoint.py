@@ -0,0 +1,79 @@
+from unittest import (
+    mock,
+    TestCase,
+)
+
+from db.connection import css_cursor
+from factories import random_orders
+import order_simulator
+from order_simulator import (
+    load_checkpoint,
+    simulate_orders,
+)
+
+def logged():
+    """Everything the run wrote, apart from the event sequence numbers"""
+    with css_cursor() as cur:
+        cur.execute("SELECT order_id, event, at, item, unit FROM order_events ORDER BY seq;")
+        events = cur.fetchall()
+        cur.execute("SELECT id, status, received_at, started_at, completed_at, total_price FROM orders ORDER BY id;")
+        return events, cur.fetchall()
+
+
+class TestCheckpoint(TestCase):
+
+    def test_resume_matches_uninterrupted_run(self):
+        """A run resumed after a crash should log exactly what an uninterrupted run does"""
+        orders = random_orders(60, seed=3)
+        simulate_orders([dict(o) for o in orders], num_cooks=3, realtime=False, engine='heap')
+        expected = logged()
+
+        received = order_simulator.update_db_order_received
+        calls = []
+        def crash(env, order):
+            calls.append(order['id'])
+            if len(calls) > 40:
+                raise RuntimeError('crash')
+            received(env, order)
+        save = order_simulator.save_checkpoint
+        def save_once(env, kitchen, next_arrival, *args):
+            if next_arrival == 20:
+                save(env, kitchen, next_arrival, *args)
+        with mock.patch('order_simulator.update_db_order_received', side_effect=crash), \
+                mock.patch('order_simulator.save_checkpoint', side_effect=save_once):
+            with self.assertRaises(RuntimeError):
+                simulate_orders(
+                    [dict(o) for o in orders], num_cooks=3, realtime=False,
+                    engine='heap', checkpoint_interval=1e-9,
+                )
+        checkpoint = load_checkpoint()
+        assert checkpoint['next_arrival'] == 20
+        # events logged after the checkpoint, before the crash
+        assert checkpoint['events_logged_since'] > 0
+
+        # the engine and cook count come from the checkpoint
+        simulate_orders(
+            [dict(o) for o in orders], num_cooks=1, realtime=False,
+            engine='simpy', resume=True,
+        )
+        assert logged() == expected
+        assert load_checkpoint() is None
+
+
+    def test_resume_without_checkpoint_starts_over(self):
+        """Resuming with no checkpoint saved runs the whole simulation"""
+        orders = random_orders(5, seed=4)
+        simulate_orders([dict(o) for o in orders], realtime=False, engine='heap')
+        expected = logged()
+        simulate_orders([dict(o) for o in orders], realtime=False, engine='heap', resume=True)
+        assert logged() == expected
+
+
+    def test_resume_rejects_other_orders(self):
+        """A checkpoint is only resumed with the orders it was saved for"""
+        orders = random_orders(5, seed=5)
+        with mock.patch('order_simulator.update_db_order_received', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                simulate_orders(orders, realtime=False, engine='heap', checkpoint_interval=1e-9)
+        with self.assertRaises(ValueError):
+            simulate_orders(orders[:4], realtime=False, engine='heap', resume=True)
@@ -0,0 +1,63 @@
+import os
+import sqlite3
+import tempfile
+import threading
+from unittest import (
+    mock,
+    TestCase,
+)
+
+from db import connection
+from db.benchmark_concurrency import run_benchmark
+from db.connection import (
+    close_connections,
+    css_cursor,
+    execute_sql,
+    get_connection,
+)
+
+
+class TestConnection(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.database = os.path.join(self.tmpdir.name, 'test.db')
+        patcher = mock.patch.object(connection, 'CSS_DATABASE', self.database)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.tmpdir.cleanup)
+        self.addCleanup(close_connections)
+
+
+    def test_connections_persist_per_thread(self):
+        """Each thread reuses its own connection"""
+        conn = get_connection()
+        assert get_connection() is conn
+        other = []
+        t = threading.Thread(target=lambda: other.append(get_connection()))
+        t.start()
+        t.join()
+        assert other[0] is not conn
+
+
+    def test_wal_and_read_only(self):
+        """Writers enable WAL; read-only connections can't write"""
+        with css_cursor() as cur:
+            cur.execute("PRAGMA journal_mode;")
+            assert cur.fetchone()[0] == 'wal'
+            execute_sql("CREATE TABLE t (x INTEGER);", cur)
+            execute_sql("INSERT INTO t VALUES (?);", cur, [(1,), (2,)], many=True)
+        with css_cursor(readonly=True) as cur:
+            cur.execute("SELECT sum(x) FROM t;")
+            assert cur.fetchone()[0] == 3
+            with self.assertRaises(sqlite3.OperationalError):
+                cur.execute("INSERT INTO t VALUES (3);")
+
+
+    def test_concurrency_benchmark(self):
+        """One writer and several readers should run without lock errors"""
+        summary = run_benchmark(readers=2, seconds=0.5, database=self.database)
+        assert summary['write_statements_per_sec'] > 0
+        assert summary['reads_per_sec'] > 0
+        assert summary['write_errors'] == 0
+        assert summary['read_errors'] == 0
@@ -0,0 +1,59 @@
+import os
+import tempfile
+from unittest import (
+    mock,
+    TestCase,
+)
+
+from db.events import (
+    EventListener,
+    EventPublisher,
+)
+from factories import make_order
+import order_simulator
+from order_simulator import simulate_orders
+
+
+class TestEvents(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = os.path.join(self.tmpdir.name, 'events.sock')
+        self.listener = EventListener(self.path)
+        self.listener.start()
+        self.addCleanup(self.listener.stop)
+        self.publisher = EventPublisher(self.path)
+        self.addCleanup(self.publisher.close)
+
+
+    def test_listener_summarizes_events(self):
+        """Published events should wake waiters with a running summary"""
+        self.publisher.publish([('received', 1, 100), ('received', 2, 105), ('started', 1, 110)])
+        seq, summary = self.listener.wait(0, timeout=5)
+        assert seq == 1
+        assert summary['received'] == 2
+        assert summary['started'] == 1
+        assert summary['sim_time'] == 110
+        # nothing newer yet
+        assert self.listener.wait(seq, timeout=0.01) == (seq, None)
+
+
+    def test_publish_without_listener(self):
+        """Events should be dropped, not raised, when nobody is listening"""
+        publisher = EventPublisher(os.path.join(self.tmpdir.name, 'missing.sock'))
+        publisher.publish([('received', 1, 100)])
+        publisher.close()
+        assert publisher.dropped == 1
+
+
+    def test_simulation_publishes_events(self):
+        """Every order and item event should be reported"""
+        test_orders = [make_order(delay=60 * i) for i in range(3)]
+        with mock.patch.object(order_simulator, 'event_publisher', self.publisher):
+            simulate_orders(test_orders, realtime=False, engine='heap')
+        seq, summary = None, None
+        while seq is None or summary.get('order_completed', 0) < 3:
+            seq, summary = self.listener.wait(seq, timeout=5)
+            assert summary is not None
+        assert summary['received'] == summary['item_started'] == summary['item_completed'] == 3
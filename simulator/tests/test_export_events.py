@@ -0,0 +1,49 @@
+import math
+import os
+import tempfile
+from unittest import TestCase
+
+from db.export_events import (
+    export_events,
+    read_events,
+)
+from db.writer import BatchWriter
+from db.migrations.migrate import migrate
+from order_simulator import INSERT_EVENT_SQL
+
+
+class TestExportEvents(TestCase):
+
+    def test_round_trip(self):
+        """Every column should read back as it was logged"""
+        events = [
+            (1, 'received', 100, None, None, 'Testy', 'SoTesty', 7, '{"Dish 1": 2}'),
+            (1, 'item_started', 100, 'Dish 1', 0, None, None, None, None),
+            (2, 'received', 101, None, None, 'Testy', 'VeryTesty', 3, '{"Dish 1": 1}'),
+            (1, 'item_started', 102, 'Dish 1', 1, None, None, None, None),
+            (1, 'item_completed', 130, 'Dish 1', 0, None, None, None, None),
+            # stored as REAL, as live orders' times once were
+            (2, 'item_started', 131.5, 'Dish 1', 0, None, None, None, None),
+        ]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            database = os.path.join(tmpdir, 'events.db')
+            output = os.path.join(tmpdir, 'events.cols')
+            writer = BatchWriter(database=database)
+            migrate(writer.connection.cursor())
+            for values in events:
+                writer.write(INSERT_EVENT_SQL, values)
+            writer.close()
+
+            # several row groups
+            assert export_events(database, output, rows_per_group=2) == len(events)
+            columns = read_events(output)
+            assert list(columns['seq']) == [1, 2, 3, 4, 5, 6]
+            assert list(columns['order_id']) == [e[0] for e in events]
+            assert columns['event'] == [e[1] for e in events]
+            assert list(columns['at']) == [100, 100, 101, 102, 130, 131]
+            assert columns['item'] == [e[3] for e in events]
+            assert list(columns['unit']) == [-1, 0, -1, 1, 0, 0]
+            assert columns['service'] == [e[6] for e in events]
+            assert [p for p in columns['total_price'] if not math.isnan(p)] == [7, 3]
+
+            assert list(read_events(output, columns=['at'])) == ['at']
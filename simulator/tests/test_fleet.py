@@ -0,0 +1,85 @@
+from functools import partial
+import os
+import sqlite3
+import tempfile
+from unittest import (
+    mock,
+    TestCase,
+)
+
+from db.migrations.migrate import (
+    LATEST_VERSION,
+    schema_version,
+)
+from db.shards import (
+    read_manifest,
+    write_manifest,
+)
+from factories import make_order
+import fleet
+from fleet import (
+    partition_orders,
+    simulate_fleet,
+)
+
+
+class TestFleet(TestCase):
+
+    def test_partition_orders(self):
+        """Orders should go to the kitchen they name, or round robin"""
+        test_orders = [make_order(delay=i) for i in range(5)]
+        test_orders[4]['kitchen'] = 'downtown'
+        kitchens = partition_orders(test_orders, 2)
+        assert list(kitchens) == ['0', '1', 'downtown']
+        assert kitchens['0'] == [test_orders[0], test_orders[2]]
+        assert kitchens['1'] == [test_orders[1], test_orders[3]]
+        assert kitchens['downtown'] == [test_orders[4]]
+
+
+    def test_simulate_fleet(self):
+        """Each kitchen should write its own orders to its own database"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            manifest = os.path.join(tmpdir, 'fleet.json')
+            with mock.patch.object(fleet, 'shard_database',
+                                   lambda kitchen: os.path.join(tmpdir, f'{kitchen}.db')), \
+                    mock.patch.object(fleet, 'write_manifest',
+                                      partial(write_manifest, path=manifest)):
+                results = simulate_fleet(
+                    [make_order(delay=i) for i in range(30)], num_kitchens=3, num_cooks=[1, 2, 3],
+                    realtime=False, engine='heap',
+                )
+
+            assert [r['num_cooks'] for r in results] == [1, 2, 3]
+            shards = read_manifest(manifest)
+            assert [s['kitchen'] for s in shards] == ['0', '1', '2']
+            for shard in shards:
+                conn = sqlite3.connect(shard['database'])
+                count, completed = conn.execute(
+                    "SELECT count(*), count(completed_at) FROM orders;").fetchone()
+                conn.close()
+                assert count == completed == 10
+
+
+    def test_shards_migrated_before_manifest(self):
+        """Every shard the manifest lists should already be at the latest schema"""
+        versions = []
+        def check_shards(shards):
+            for shard in shards:
+                conn = sqlite3.connect(shard['database'])
+                versions.append(schema_version(conn.cursor()))
+                conn.close()
+            raise RuntimeError("stop before simulating")
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with mock.patch.object(fleet, 'shard_database',
+                                   lambda kitchen: os.path.join(tmpdir, f'{kitchen}.db')), \
+                    mock.patch.object(fleet, 'write_manifest', check_shards):
+                with self.assertRaises(RuntimeError):
+                    simulate_fleet([make_order(delay=i) for i in range(4)], num_kitchens=2, num_cooks=1)
+        assert versions == [LATEST_VERSION, LATEST_VERSION]
+
+
+    def test_cook_counts_must_match_kitchens(self):
+        """A list of cook counts needs one count per kitchen"""
+        with self.assertRaises(ValueError):
+            simulate_fleet([make_order(delay=i) for i in range(4)], num_kitchens=2, num_cooks=[1, 2, 3])
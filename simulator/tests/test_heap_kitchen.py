@@ -0,0 +1,85 @@
+from unittest import (
+    mock,
+    TestCase,
+)
+
+from factories import random_orders
+from heap_kitchen import *
+from order_simulator import simulate_orders
+from order_stream import OrderStream
+
+def record_run(orders, engine, num_cooks):
+    """Run a batch simulation, returning the kitchen and its database updates"""
+    updates = []
+    def record(kind):
+        def update(env, order, item=None, unit=None):
+            order_id = order['id'] if kind == 'received' else order
+            updates.append((order_id, kind, env.now, item, unit))
+        return update
+    with mock.patch('order_simulator.update_db_order_received', side_effect=record('received')), \
+            mock.patch('order_simulator.update_db_item_started', side_effect=record('item_started')), \
+            mock.patch('order_simulator.update_db_item_completed', side_effect=record('item_completed')), \
+            mock.patch('order_simulator.update_db_order_completed', side_effect=record('completed')):
+        kitchen = simulate_orders(
+            orders if isinstance(orders, OrderStream) else [dict(order) for order in orders],
+            num_cooks=num_cooks,
+            realtime=False,
+            reset_db=False,
+            engine=engine,
+        )
+    return kitchen, updates
+
+
+class TestHeapKitchen(TestCase):
+
+    def assert_engines_match(self, orders, num_cooks):
+        simpy_kitchen, simpy_updates = record_run(orders, 'simpy', num_cooks)
+        heap_kitchen, heap_updates = record_run(orders, 'heap', num_cooks)
+
+        # every order and item unit gets the same event timestamps
+        key = lambda u: tuple('' if v is None else v for v in u)
+        assert sorted(heap_updates, key=key) == sorted(simpy_updates, key=key)
+        # updates are made in time order, and inserts come before updates
+        assert [u[2] for u in heap_updates] == sorted(u[2] for u in heap_updates)
+        seen = set()
+        for order_id, kind, *_ in heap_updates:
+            assert (kind == 'received') != (order_id in seen)
+            seen.add(order_id)
+
+        for stat in ['busy_time', 'items_requested', 'queue_length_total', 'max_queue_length']:
+            assert getattr(heap_kitchen, stat) == getattr(simpy_kitchen, stat), stat
+        assert heap_kitchen.env.now == simpy_kitchen.env.now
+
+
+    def test_matches_simpy_without_queueing(self):
+        """With plenty of cooks, items start as soon as they're received"""
+        self.assert_engines_match(random_orders(50, seed=1), num_cooks=1000)
+
+
+    def test_matches_simpy_under_load(self):
+        """Queueing, simultaneous arrivals and cooks freed at arrival times"""
+        for seed in range(5):
+            self.assert_engines_match(random_orders(200, seed=seed), num_cooks=7)
+
+
+    def test_matches_simpy_single_cook(self):
+        """A single cook serializes every item in request order"""
+        self.assert_engines_match(random_orders(40, seed=11, max_gap=600), num_cooks=1)
+
+
+    def test_cook_freed_at_request_time(self):
+        """An item requested as a cook frees up still counts as queued"""
+        kitchen = HeapKitchen(VirtualClock(), num_cooks=1)
+        assert kitchen.request_item(0, 10) == 0
+        assert kitchen.request_item(10, 5) == 10
+        assert kitchen.max_queue_length == 1
+        assert kitchen.request_item(11, 5) == 15
+        assert kitchen.queue_length_total == 2
+
+
+    def test_unknown_engine(self):
+        """Unknown engines should be rejected before touching the database"""
+        with mock.patch('order_simulator.recreate_orders_table') as recreate:
+            with self.assertRaises(ValueError):
+                simulate_orders([], engine='nope')
+            recreate.assert_not_called()
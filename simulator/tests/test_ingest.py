@@ -0,0 +1,95 @@
+import json
+from unittest import (
+    mock,
+    TestCase,
+)
+from urllib.error import HTTPError
+from urllib.request import (
+    Request,
+    urlopen,
+)
+
+import simpy
+
+from factories import make_order
+from ingest import OrderIngest
+from order_simulator import (
+    cook_times,
+    feed_live_orders,
+    Kitchen,
+    simulate_orders,
+)
+
+MENU_ITEM = sorted(cook_times)[0]
+
+
+class TestIngest(TestCase):
+
+    def setUp(self):
+        self.ingest = OrderIngest(cook_times, port=0, queue_size=3, host='127.0.0.1')
+        self.ingest.start()
+        self.url = f'http://127.0.0.1:{self.ingest.port}'
+
+    def tearDown(self):
+        self.ingest.stop()
+
+    def post(self, body):
+        request = Request(f'{self.url}/orders', data=json.dumps(body).encode())
+        try:
+            with urlopen(request) as response:
+                return response.status, dict(response.headers), json.load(response)
+        except HTTPError as e:
+            return e.code, dict(e.headers), json.load(e)
+
+
+    def test_orders_queued(self):
+        """One order or a list of them are queued in the order they came"""
+        assert self.post(make_order([(MENU_ITEM, 1)]))[0] == 202
+        assert self.post([make_order([(MENU_ITEM, 2)]), make_order([(MENU_ITEM, 3)])])[0] == 202
+        assert [o['items'][0]['quantity'] for o in self.ingest.take()] == [1, 2, 3]
+        with urlopen(f'{self.url}/status') as response:
+            status = json.load(response)
+        assert status['accepted'] == 3 and status['received'] == 3 and status['queued'] == 0
+
+
+    def test_full_queue_rejects(self):
+        """Orders that don't all fit are turned away with a Retry-After"""
+        assert self.post([make_order([(MENU_ITEM, 1)]), make_order([(MENU_ITEM, 1)])])[0] == 202
+        code, headers, _ = self.post([make_order([(MENU_ITEM, 1)]), make_order([(MENU_ITEM, 1)])])
+        assert code == 503
+        assert 'Retry-After' in headers
+        assert len(self.ingest.take()) == 2
+        assert self.ingest.status()['rejected'] == 2
+
+
+    def test_invalid_order_rejected(self):
+        """Orders the kitchen can't cook never reach the queue"""
+        order = make_order([(MENU_ITEM, 1)])
+        order['items'][0]['name'] = 'Not A Dish'
+        code, _, body = self.post([make_order([(MENU_ITEM, 1)]), order])
+        assert code == 400
+        assert 'Not A Dish' in body['error']
+        assert self.ingest.take() == []
+
+
+    def test_live_orders_received_when_taken(self):
+        """Live orders get ids after the loaded ones and arrive at the next whole second"""
+        received = []
+        env = simpy.Environment(initial_time=100)
+        kitchen = Kitchen(env, num_cooks=2)
+        env.process(feed_live_orders(env, self.ingest, kitchen, first_id=11))
+        env.run(until=101)
+        self.ingest.submit([make_order([(MENU_ITEM, 1)]), make_order([(MENU_ITEM, 1)])])
+        with mock.patch('order_simulator.update_db_order_received',
+                        side_effect=lambda env, order: received.append((order['id'], env.now))), \
+                mock.patch('order_simulator.log_event'):
+            env.run(until=200)
+        # taken at the first check of the queue after they were queued,
+        # 101.05, and received at the next whole second
+        assert received == [(11, 102), (12, 102)]
+
+
+    def test_live_orders_need_realtime_simpy(self):
+        """Live orders are only taken by the SimPy engine"""
+        with self.assertRaises(ValueError):
+            simulate_orders([], engine='heap', ingest=self.ingest)
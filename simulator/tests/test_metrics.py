@@ -0,0 +1,117 @@
+import os
+import tempfile
+import time
+from unittest import (
+    mock,
+    TestCase,
+)
+
+from db.metrics import (
+    clear_metrics,
+    MetricsReporter,
+    rate_of,
+    read_metrics,
+    Registry,
+    render,
+)
+from db.profiler import SamplingProfiler
+from order_simulator import simulate_orders
+from tests.test_heap_kitchen import random_orders
+
+
+class TestMetrics(TestCase):
+
+    def test_render(self):
+        """Counters, gauges and cumulative histogram buckets in Prometheus format"""
+        metrics = Registry({'process': 'test'})
+        metrics.counter('events_total', 'Events', ['event']).inc(3, event='received')
+        metrics.gauge('queue_length', 'Queue').track(lambda: 7)
+        latency = metrics.histogram('call_seconds', 'Calls', ['call'], buckets=(0.1, 1))
+        for value in [0.05, 0.5, 5]:
+            latency.observe(value, call='flush')
+
+        text = render([metrics.snapshot()])
+        assert '# TYPE events_total counter' in text
+        assert 'events_total{process="test",event="received"} 3' in text
+        assert 'queue_length{process="test"} 7' in text
+        assert 'call_seconds_bucket{process="test",call="flush",le="0.1"} 1' in text
+        assert 'call_seconds_bucket{process="test",call="flush",le="1"} 2' in text
+        assert 'call_seconds_bucket{process="test",call="flush",le="+Inf"} 3' in text
+        assert 'call_seconds_count{process="test",call="flush"} 3' in text
+
+
+    def test_render_combines_processes(self):
+        """Each metric gets one family, with a sample per process"""
+        snapshots = []
+        for process in ['dash', 'simulator']:
+            metrics = Registry({'process': process})
+            metrics.counter('db_statements_written_total', 'Statements').inc(2)
+            snapshots.append(metrics.snapshot())
+        text = render(snapshots)
+        assert text.count('# TYPE db_statements_written_total') == 1
+        assert 'db_statements_written_total{process="dash"} 2' in text
+        assert 'db_statements_written_total{process="simulator"} 2' in text
+
+
+    def test_wrong_labels(self):
+        """Samples need exactly the metric's labels"""
+        counter = Registry().counter('events_total', 'Events', ['event'])
+        with self.assertRaises(ValueError):
+            counter.inc(kitchen='1')
+
+
+    def test_rate_of(self):
+        """A rate is the counter's increase per second since the last call"""
+        counter = Registry().counter('events_total', 'Events')
+        rate = rate_of(counter)
+        counter.inc(100)
+        time.sleep(0.05)
+        assert 0 < rate() <= 100 / 0.05
+
+
+    def test_simulator_reports_metrics(self):
+        """A run leaves a snapshot of its metrics for the dashboard"""
+        with tempfile.TemporaryDirectory() as tmpdir, \
+                mock.patch('db.metrics.METRICS_DIR', tmpdir), \
+                mock.patch('order_simulator.metrics_reporter', MetricsReporter('simulator', 60)), \
+                mock.patch('order_simulator.log_event'):
+            simulate_orders(random_orders(20, seed=1), realtime=False, reset_db=False, engine='heap')
+            snapshot, = read_metrics()
+        assert snapshot['labels']['process'] == 'simulator'
+        names = {metric['name'] for metric in snapshot['metrics']}
+        assert {'kitchen_queue_length', 'kitchen_cook_utilization', 'sim_clock'} <= names
+
+
+    def test_clear_metrics(self):
+        """Clearing the simulator's snapshots leaves the dashboard's"""
+        with tempfile.TemporaryDirectory() as tmpdir, \
+                mock.patch('db.metrics.METRICS_DIR', tmpdir):
+            for name in ['simulator', 'simulator_kitchen_3', 'dash']:
+                MetricsReporter(name, 60, Registry()).report()
+            clear_metrics()
+            assert sorted(os.listdir(tmpdir)) == ['dash.json']
+
+
+    def test_profiler(self):
+        """Profiled runs write collapsed stacks of the hot path"""
+        with tempfile.TemporaryDirectory() as tmpdir, \
+                mock.patch('order_simulator.PROFILES_DIR', tmpdir), \
+                mock.patch('order_simulator.PROFILE_INTERVAL', 0.001), \
+                mock.patch('order_simulator.log_event'):
+            simulate_orders(random_orders(2000, seed=1), num_cooks=5, realtime=False,
+                            reset_db=False, engine='simpy', profile=True)
+            path, = os.listdir(tmpdir)
+            with open(os.path.join(tmpdir, path)) as f:
+                stacks = f.read().splitlines()
+        assert stacks
+        assert any('order_simulator.py:simulate_orders' in line for line in stacks)
+        stack, count = stacks[0].rsplit(' ', 1)
+        assert int(count) > 0
+
+
+    def test_profiler_top(self):
+        """Hottest frames are those most often at the top of the stack"""
+        profiler = SamplingProfiler()
+        profiler.stacks.update({'a.py:main;a.py:slow': 3, 'a.py:main;a.py:fast': 1})
+        profiler.samples = 4
+        assert profiler.top(1) == [('a.py:slow', 0.75)]
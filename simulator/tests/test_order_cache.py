@@ -0,0 +1,97 @@
+import json
+import os
+import pickle
+import tempfile
+from unittest import (
+    mock,
+    TestCase,
+)
+
+from order_cache import (
+    get_time,
+    load_orders,
+)
+from order_simulator import order_time
+
+ORDERS = [
+    {
+        'id': 'a1',
+        'name': 'Testy McTestFace',
+        'service': 'SoTesty',
+        'ordered_at': '2019-02-18T16:01:00.5',
+        'items': [
+            {'name': 'Dish 1', 'price_per_unit': 3, 'quantity': 2},
+            {'name': 'Dish 2', 'price_per_unit': 2.5, 'quantity': 1},
+        ],
+    },
+    {
+        'id': 'a2',
+        'name': 'Tästy',
+        'service': 'VeryTesty',
+        'ordered_at': '2019-02-18T16:00:00',
+        'items': [],
+        'kitchen': 3,
+    },
+]
+
+
+class TestOrderCache(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.source = os.path.join(self.tmpdir.name, 'orders.json')
+        self.write_source(ORDERS)
+
+    def write_source(self, orders):
+        with open(self.source, 'w') as f:
+            json.dump(orders, f)
+
+
+    def test_orders_match_source(self):
+        """Cached orders should carry the same data, with parsed times"""
+        orders = load_orders(self.source)
+        assert len(orders) == 2
+        assert orders.min_ordered_at == get_time('2019-02-18T16:00:00')
+        assert orders[0] == {
+            'name': 'Testy McTestFace',
+            'service': 'SoTesty',
+            'ordered_at_epoch': get_time('2019-02-18T16:01:00'),
+            'items': ORDERS[0]['items'],
+        }
+        assert orders[-1]['name'] == 'Tästy'
+        assert orders[1]['items'] == []
+        assert orders[1]['kitchen'] == '3'
+        assert [o['service'] for o in orders] == ['SoTesty', 'VeryTesty']
+
+
+    def test_cache_keyed_on_source(self):
+        """The cache should be reused until the source changes"""
+        path = load_orders(self.source).path
+        with mock.patch('order_cache.compile_orders') as compile_orders:
+            assert load_orders(self.source).path == path
+            compile_orders.assert_not_called()
+
+        self.write_source(ORDERS[:1])
+        orders = load_orders(self.source)
+        assert orders.path != path
+        assert len(orders) == 1
+        # the stale cache is removed
+        assert not os.path.exists(path)
+
+
+    def test_pickles_by_path(self):
+        """Worker processes should get the table without copying every order"""
+        orders = load_orders(self.source)
+        data = pickle.dumps(orders)
+        assert len(data) < 200
+        assert list(pickle.loads(data)) == list(orders)
+
+
+    def test_order_time_parses_once(self):
+        """An order's time is parsed once and then kept on the order"""
+        order = dict(ORDERS[0])
+        with mock.patch('order_simulator.get_time', wraps=get_time) as parse:
+            assert order_time(order) == get_time('2019-02-18T16:01:00')
+            assert order_time(order) == get_time('2019-02-18T16:01:00')
+            assert parse.call_count == 1
@@ -0,0 +1,88 @@
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+from order_stream import (
+    OrderStream,
+    read_orders,
+)
+from order_simulator import order_time
+from tests.test_heap_kitchen import (
+    random_orders,
+    record_run,
+)
+
+
+class TestOrderStream(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.orders = random_orders(100, seed=3, max_gap=20)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, name, orders, jsonl=False):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, 'w') as f:
+            if jsonl:
+                f.writelines(json.dumps(order) + '\n' for order in orders)
+            else:
+                json.dump(orders, f, indent=2)
+        return path
+
+
+    def test_reads_json_array_and_lines(self):
+        """Both formats decode the same orders, even across small reads"""
+        array_path = self.write('orders.json', self.orders)
+        lines_path = self.write('orders.jsonl', self.orders, jsonl=True)
+        for path in [array_path, lines_path]:
+            assert list(read_orders(path, chunk_size=7)) == self.orders
+        assert list(read_orders(self.write('empty.json', []))) == []
+
+
+    def test_orders_handed_out_in_arrival_order(self):
+        """Orders come out sorted, with file-order ids and ties in file order"""
+        lookahead = max(order_time(dict(o)) for o in self.orders) - min(
+            order_time(dict(o)) for o in self.orders)
+        stream = OrderStream(self.write('orders.jsonl', self.orders, jsonl=True), lookahead)
+        streamed = [(order['ordered_at_epoch'], order['id']) for order in stream]
+        assert streamed == sorted(streamed)
+        assert stream.count == len(self.orders)
+
+
+    def test_reads_only_as_far_as_lookahead(self):
+        """An order isn't read until an earlier one is about to be handed out"""
+        orders = [
+            {'ordered_at': f'2019-02-18T16:0{minute}:00', 'items': []}
+            for minute in range(10)
+        ]
+        stream = OrderStream(self.write('orders.jsonl', orders, jsonl=True), lookahead=60)
+        assert next(stream)['id'] == 1
+        # just enough to know nothing can arrive before the second order
+        assert stream.count == 3
+
+
+    def test_late_order_received_when_read(self):
+        """An order out of order by more than the lookahead isn't received in the past"""
+        orders = [
+            {'ordered_at': '2019-02-18T16:05:00', 'items': []},
+            {'ordered_at': '2019-02-18T16:10:00', 'items': []},
+            {'ordered_at': '2019-02-18T16:00:00', 'items': []},
+        ]
+        with self.assertLogs('order_stream', 'WARNING'):
+            streamed = list(OrderStream(self.write('late.jsonl', orders, jsonl=True), lookahead=60))
+        assert [o['id'] for o in streamed] == [1, 3, 2]
+        assert streamed[1]['ordered_at_epoch'] == streamed[0]['ordered_at_epoch']
+
+
+    def test_streamed_run_matches_loaded_run(self):
+        """Both engines make the same updates whether orders are loaded or streamed"""
+        path = self.write('orders.jsonl', self.orders, jsonl=True)
+        for engine in ['simpy', 'heap']:
+            loaded_kitchen, loaded = record_run(self.orders, engine, num_cooks=5)
+            streamed_kitchen, streamed = record_run(
+                OrderStream(path, lookahead=3600), engine, num_cooks=5)
+            assert streamed == loaded, engine
+            assert streamed_kitchen.queue_length_total == loaded_kitchen.queue_length_total
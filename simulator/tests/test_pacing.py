@@ -0,0 +1,105 @@
+from unittest import (
+    mock,
+    TestCase,
+)
+
+from db.connection import css_cursor
+from heap_kitchen import RealtimeClock
+from order_simulator import simulate_orders
+from pacing import (
+    CAUGHT_UP_CHECKS,
+    LagMonitor,
+    PacedEnvironment,
+    realtime_lag,
+)
+from tests.test_heap_kitchen import random_orders
+
+
+class FakeWriter(object):
+    def __init__(self):
+        self.batch_size = 500
+        self.max_latency = 1
+        self.rows = []
+
+    def write(self, sql, values):
+        self.rows.append(values)
+
+
+class TestPacing(TestCase):
+
+    def test_set_factor(self):
+        """Changing pace starts the new schedule from the current time"""
+        for env in [RealtimeClock(initial_time=100, factor=0.1), PacedEnvironment(initial_time=100, factor=0.1)]:
+            env.real_start -= 5
+            assert realtime_lag(env) >= 5
+            env.set_factor(0.5)
+            assert env.factor == 0.5
+            assert realtime_lag(env) < 0.1
+
+
+    def test_lag_is_only_measured_by_default(self):
+        """Without adaptive pacing, lag is logged but nothing changes"""
+        env, writer = RealtimeClock(factor=0.1), FakeWriter()
+        monitor = LagMonitor(env, writer, speed=10, adaptive=False, threshold=1)
+        env.real_start -= 5
+        monitor.check()
+        assert monitor.lag >= 5
+        assert (monitor.speed, monitor.coalesced, writer.batch_size) == (10, False, 500)
+        at, checked_at, lag, speed, coalesced = writer.rows[-1]
+        assert (at, speed, coalesced) == (0, 10, 0)
+        assert lag >= 5
+
+
+    def test_adaptive_backs_off_and_recovers(self):
+        """Coalesce writes first, then halve the speed; undo both once caught up"""
+        env, writer = RealtimeClock(factor=1/40), FakeWriter()
+        monitor = LagMonitor(env, writer, speed=40, adaptive=True, threshold=1, min_speed=10)
+
+        steps = []
+        for offset in [-5, 2, -5, -5, -5]:
+            # moving real_start back puts the run further behind
+            env.real_start += offset
+            monitor.check()
+            steps.append((monitor.speed, monitor.coalesced))
+        # a lag that shrinks is left to catch up; slowing down starts afresh
+        assert steps == [(40, True), (40, True), (20, True), (10, True), (10, True)]
+        assert (writer.batch_size, writer.max_latency) == (2000, 4)
+        assert env.factor == 1/10
+
+        steps = []
+        env.set_factor(env.factor)
+        for _ in range(3 * CAUGHT_UP_CHECKS):
+            monitor.check()
+            steps.append((monitor.speed, monitor.coalesced))
+        assert steps[CAUGHT_UP_CHECKS - 2] == (10, True)
+        assert steps[CAUGHT_UP_CHECKS - 1] == (20, True)
+        assert steps[-1] == (40, False)
+        assert (writer.batch_size, writer.max_latency) == (500, 1)
+
+
+    def test_finish_restores_batching(self):
+        """Ending a run puts batching back as it was"""
+        env, writer = RealtimeClock(factor=1/40), FakeWriter()
+        monitor = LagMonitor(env, writer, speed=40, adaptive=True, threshold=1)
+        env.real_start -= 5
+        monitor.check()
+        assert writer.batch_size == 2000
+        monitor.finish()
+        assert (writer.batch_size, writer.max_latency) == (500, 1)
+
+
+    def test_realtime_run_logs_lag(self):
+        """Real-time runs log their lag, batch runs don't"""
+        orders = random_orders(20, seed=1, max_gap=30)
+        for engine in ['simpy', 'heap']:
+            with mock.patch('order_simulator.log_event'):
+                simulate_orders(orders, speed=5000, engine=engine, checkpoint_interval=0)
+            with css_cursor() as cur:
+                rows = cur.execute("SELECT at, lag, speed, coalesced FROM run_lag;").fetchall()
+            assert rows, engine
+            assert all(speed == 5000 and not coalesced for _, _, speed, coalesced in rows)
+
+        with mock.patch('order_simulator.log_event'):
+            simulate_orders(orders, realtime=False, engine='heap')
+        with css_cursor() as cur:
+            assert cur.execute("SELECT count(*) FROM run_lag;").fetchone() == (0,)
@@ -0,0 +1,54 @@
+from unittest import TestCase
+
+from factories import make_order
+from order_simulator import (
+    cook_times,
+    simulate_orders,
+)
+from sweep import run_configuration
+
+# the quickest and slowest dishes on the menu
+QUICK, SLOW = sorted(cook_times, key=cook_times.get)[0], sorted(cook_times, key=cook_times.get)[-1]
+
+
+class TestScheduling(TestCase):
+
+    def test_small_order_skips_the_queue(self):
+        """A quick one-item order shouldn't wait behind a big order"""
+        orders = [make_order([(SLOW, 4)]), make_order([(SLOW, 1)], delay=1), make_order([(QUICK, 1)], delay=2)]
+        results = {
+            policy: run_configuration({'num_cooks': 1, 'policy': policy}, orders)
+            for policy in ['fifo', 'shortest_cook_time', 'smallest_order']
+        }
+        S, Q = cook_times[SLOW], cook_times[QUICK]
+        for policy, result in results.items():
+            assert result['policy'] == policy
+            assert result['cook_utilization'] == 1
+        # FIFO serves the quick order last, after the middle one
+        assert results['fifo']['p50_fulfillment_time'] == 5 * S - 1
+        # the quick unit goes first, then the big order's units
+        assert results['shortest_cook_time']['p50_fulfillment_time'] == 4 * S + Q
+        # the quick order, then the middle one, then the big one
+        assert results['smallest_order']['p50_fulfillment_time'] == 2 * S + Q - 1
+
+
+    def test_service_priority(self):
+        """Listed services go first, in the order listed"""
+        orders = [
+            make_order([(SLOW, 2)]),
+            make_order([(SLOW, 1)], service='Postmates', delay=1),
+            make_order([(SLOW, 1)], service='Caviar', delay=2),
+        ]
+        result = run_configuration({'num_cooks': 1, 'policy': 'service_priority'}, orders)
+        # Caviar goes before Postmates, and both before the unlisted service
+        assert result['p50_fulfillment_time'] == 3 * cook_times[SLOW] - 1
+        assert result['p99_fulfillment_time'] == 4 * cook_times[SLOW]
+
+
+    def test_invalid_policies(self):
+        """Unknown policies, and policies the heap engine can't model, are rejected"""
+        with self.assertRaises(ValueError):
+            simulate_orders([make_order([(QUICK, 1)])], realtime=False, policy='random')
+        with self.assertRaises(ValueError):
+            simulate_orders([make_order([(QUICK, 1)])], realtime=False, engine='heap',
+                            policy='shortest_cook_time')
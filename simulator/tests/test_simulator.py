@@ -1,8 +1,18 @@
+import sqlite3
 from unittest import (
     mock,
     TestCase,
 )
 
+import simpy
+
+from db.connection import css_cursor
+from db.migrations.migrate import (
+    LATEST_VERSION,
+    migrate,
+    schema_version,
+)
+from db.projection import PROJECT_ORDERS_SQL
 from order_simulator import *
 
 class TestSimulator(TestCase):
@@ -24,12 +34,12 @@ class TestSimulator(TestCase):
     def test_regular_order_processed(self):
         """Order should be received and completed
 
-        Each database update should only be made once per order
+        Order updates should be made once per order, item updates once per unit
         """
         with mock.patch('order_simulator.update_db_order_received') as order_received, \
-                mock.patch('order_simulator.update_db_order_started') as order_started, \
+                mock.patch('order_simulator.update_db_item_started') as item_started, \
                 mock.patch('order_simulator.update_db_order_completed') as order_completed, \
-                mock.patch('order_simulator.css_cursor'):
+                mock.patch('order_simulator.db_writer'):
             order = {
                 'items': [
                     {'name': 'Puff Pastry Chicken Potpie', 'price_per_unit': 1, 'quantity': 1},
@@ -41,16 +51,43 @@ class TestSimulator(TestCase):
             }
             simulate_orders([order])
             order_received.assert_called_once()
-            order_started.assert_called_once()
+            assert item_started.call_count == 3
             order_completed.assert_called_once()
 
 
+    def test_units_without_processes(self):
+        """A large order is one process however many units it has"""
+        order = {
+            'items': [
+                {'name': 'Dish 1', 'price_per_unit': 1, 'quantity': 40},
+                {'name': 'Dish 2', 'price_per_unit': 1, 'quantity': 25},
+            ],
+            'name': 'Testy McTestFace',
+            'service': 'SoTesty',
+            'ordered_at': '2019-02-18T16:01:00'
+        }
+        processes = []
+        with mock.patch('order_simulator.update_db_item_completed') as item_completed, \
+                mock.patch('order_simulator.update_db_order_completed') as order_completed, \
+                mock.patch('order_simulator.log_event'), \
+                mock.patch.object(simpy.Environment, 'process',
+                                  lambda env, generator: processes.append(generator) or simpy.Process(env, generator)):
+            kitchen = simulate_orders([order], num_cooks=10, realtime=False)
+        assert len(processes) == 1
+        assert item_completed.call_count == 65
+        order_completed.assert_called_once()
+        # ten cooks make the first dish in 4 rounds, then the second in 3
+        env, _ = order_completed.call_args[0]
+        assert env.now == get_time(order['ordered_at']) + 4 * cook_times['Dish 1'] + 3 * cook_times['Dish 2']
+        assert kitchen.busy_time == 40 * cook_times['Dish 1'] + 25 * cook_times['Dish 2']
+
+
     def test_empty_order_not_processed(self):
         """An empty order should not be processed"""
         with mock.patch('order_simulator.update_db_order_received') as order_received, \
-                mock.patch('order_simulator.update_db_order_started') as order_started, \
+                mock.patch('order_simulator.update_db_item_started') as item_started, \
                 mock.patch('order_simulator.update_db_order_completed') as order_completed, \
-                mock.patch('order_simulator.css_cursor'):
+                mock.patch('order_simulator.db_writer'):
             empty_order = {
                 'items': [],
                 'name': 'Testy McTestFace',
@@ -59,7 +96,7 @@ class TestSimulator(TestCase):
             }
             simulate_orders([empty_order])
             order_received.assert_not_called()
-            order_started.assert_not_called()
+            item_started.assert_not_called()
             order_completed.assert_not_called()
 
  
@@ -70,3 +107,204 @@ class TestSimulator(TestCase):
             cur.execute("SELECT COUNT(*) FROM orders;")
             result = cur.fetchone()[0]
         assert result == 0
+
+
+    def test_batch_writer_flushes_in_order(self):
+        """Writes are buffered until the batch fills, then applied in order"""
+        writer = BatchWriter(database=':memory:', batch_size=3, max_latency=60)
+        writer.connection.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, val TEXT);")
+        writer.write("INSERT INTO t (id, val) VALUES (?, ?);", (1, 'a'))
+        writer.write("UPDATE t SET val = ? WHERE id = ?;", ('b', 1))
+        assert writer.connection.execute("SELECT COUNT(*) FROM t;").fetchone()[0] == 0
+
+        writer.write("INSERT INTO t (id, val) VALUES (?, ?);", (2, 'c'))
+        rows = writer.connection.execute("SELECT id, val FROM t ORDER BY id;").fetchall()
+        assert rows == [(1, 'b'), (2, 'c')]
+        assert writer.pending == []
+        writer.close()
+
+
+    def test_failed_flush_keeps_writes(self):
+        """Writes from a flush that fails should be retried by the next one"""
+        writer = BatchWriter(database=':memory:', batch_size=1000, max_latency=60)
+        writer.write("INSERT INTO t (id, val) VALUES (?, ?);", (1, 'a'))
+        writer.write("INSERT INTO t (id, val) VALUES (?, ?);", (2, 'b'))
+        # the table doesn't exist yet, so the whole batch rolls back
+        with self.assertRaises(sqlite3.OperationalError):
+            writer.flush()
+        assert len(writer.pending) == 2
+
+        writer.connection.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, val TEXT);")
+        assert writer.flush() == 2
+        rows = writer.connection.execute("SELECT id, val FROM t ORDER BY id;").fetchall()
+        assert rows == [(1, 'a'), (2, 'b')]
+        writer.close()
+
+
+    def test_simulation_flushes_buffered_writes(self):
+        """Every buffered write should be in the database once the run ends"""
+        order = {
+            'items': [{'name': 'Dish 1', 'price_per_unit': 3, 'quantity': 2}],
+            'name': "Testy O'TestFace",
+            'service': 'SoTesty',
+            'ordered_at': '2019-02-18T16:01:00'
+        }
+        with mock.patch.object(db_writer, 'batch_size', 1000), \
+                mock.patch.object(db_writer, 'max_latency', 60):
+            simulate_orders([order])
+        with css_cursor() as cur:
+            cur.execute("SELECT status, customer_name, total_price FROM orders;")
+            result = cur.fetchall()
+        assert result == [('Completed', "Testy O'TestFace", 6)]
+
+
+    def test_batch_mode_uses_virtual_clock(self):
+        """Batch mode should produce the same timestamps without waiting"""
+        order = {
+            'items': [{'name': 'Dish 1', 'price_per_unit': 1, 'quantity': 1}],
+            'name': 'Testy McTestFace',
+            'service': 'SoTesty',
+            'ordered_at': '2019-02-18T16:01:00'
+        }
+        with mock.patch('order_simulator.PacedEnvironment') as rt_env:
+            simulate_orders([order], realtime=False)
+            rt_env.assert_not_called()
+        with css_cursor() as cur:
+            cur.execute("SELECT received_at, started_at, completed_at FROM orders;")
+            result = cur.fetchone()
+        received_at = get_time(order['ordered_at'])
+        assert result == (received_at, received_at, received_at + cook_times['Dish 1'])
+
+
+    def test_rollups_match_orders(self):
+        """Rollup tables should match aggregating the orders table directly"""
+        test_orders = [
+            {
+                'items': [{'name': 'Dish 1', 'price_per_unit': i + 1, 'quantity': i % 3 + 1}],
+                'name': 'Testy McTestFace',
+                'service': ['SoTesty', 'VeryTesty'][i % 2],
+                'ordered_at': f'2019-02-{18 + i // 8}T{(16 + 3 * i) % 24:02d}:01:00'
+            }
+            for i in range(20)
+        ]
+        simulate_orders(test_orders, realtime=False, engine='heap')
+        with css_cursor() as cur:
+            cur.execute("DELETE FROM orders WHERE id = 3;")
+            cur.execute("UPDATE orders SET status = 'Queued', total_price = 100 WHERE id = 5;")
+
+        dow = "cast(strftime('%w', received_at - 8*60*60, 'unixepoch') as int)"
+        hour = "cast(strftime('%H', received_at - 8*60*60, 'unixepoch') as int)"
+        checks = [(
+            f"SELECT service, {dow} as dow, SUM(total_price) FROM orders GROUP BY 1, 2 ORDER BY 1, 2;",
+            "SELECT service, dow, total_spent FROM rollup_spend_by_day_and_service WHERE cnt > 0 ORDER BY 1, 2;",
+        ), (
+            f"""SELECT CASE
+                WHEN {hour} BETWEEN 5 AND 10 THEN 'Breakfast'
+                WHEN {hour} BETWEEN 11 AND 15 THEN 'Lunch'
+                WHEN {hour} BETWEEN 16 AND 22 THEN 'Dinner'
+                ELSE 'Late Night' END, SUM(total_price)
+            FROM orders GROUP BY 1 ORDER BY 1;""",
+            "SELECT time_of_day, total_spent FROM rollup_spend_by_time_of_day WHERE cnt > 0 ORDER BY 1;",
+        ), (
+            "SELECT status, COUNT(*) FROM orders GROUP BY 1 ORDER BY 1;",
+            "SELECT status, cnt FROM rollup_orders_by_status WHERE cnt > 0 ORDER BY 1;",
+        ), (
+            "SELECT SUM(total_price) FROM orders;",
+            "SELECT total_spent FROM rollup_total_spend;",
+        )]
+        with css_cursor() as cur:
+            for aggregate_sql, rollup_sql in checks:
+                cur.execute(aggregate_sql)
+                expected = cur.fetchall()
+                cur.execute(rollup_sql)
+                assert cur.fetchall() == expected
+
+
+    def test_change_seq_increases(self):
+        """Every event should stamp its order with a new, larger change sequence"""
+        test_orders = [
+            {
+                'items': [{'name': 'Dish 1', 'price_per_unit': 1, 'quantity': 1}],
+                'name': 'Testy McTestFace',
+                'service': 'SoTesty',
+                'ordered_at': f'2019-02-18T16:0{i}:00'
+            }
+            for i in range(3)
+        ]
+        simulate_orders(test_orders, realtime=False, engine='heap')
+        with css_cursor() as cur:
+            cur.execute("SELECT change_seq FROM orders ORDER BY completed_at;")
+            seqs = [row[0] for row in cur.fetchall()]
+        # received, item started, item completed and completed for each of
+        # the 3 orders, the last event being an order completing
+        assert max(seqs) == 12
+        assert seqs == sorted(seqs)
+
+    def test_orders_derived_from_events(self):
+        """The orders table should be the current state of the event log"""
+        test_orders = [
+            {
+                'items': [{'name': 'Dish 1', 'price_per_unit': 2, 'quantity': i + 1}],
+                'name': 'Testy McTestFace',
+                'service': 'SoTesty',
+                'ordered_at': '2019-02-18T16:00:00'
+            }
+            for i in range(4)
+        ]
+        simulate_orders(test_orders, realtime=False, engine='heap', num_cooks=2)
+        with css_cursor() as cur:
+            cur.execute("SELECT event, count(*) FROM order_events GROUP BY 1 ORDER BY 1;")
+            assert cur.fetchall() == [
+                ('item_completed', 10), ('item_started', 10), ('order_completed', 4), ('received', 4),
+            ]
+            cur.execute("""
+                SELECT o.id, o.status, o.total_price, o.started_at = min(e.at), o.completed_at = max(e.at)
+                FROM orders o JOIN order_events e ON e.order_id = o.id AND e.event LIKE 'item_%'
+                GROUP BY 1 ORDER BY 1;
+            """)
+            assert cur.fetchall() == [(i + 1, 'Completed', 2 * (i + 1), 1, 1) for i in range(4)]
+            # appended in time order
+            cur.execute("SELECT at FROM order_events ORDER BY seq;")
+            times = [row[0] for row in cur.fetchall()]
+            assert times == sorted(times)
+
+    def test_orders_projected_per_flush(self):
+        """Orders should follow their events across flushes, one update per status"""
+        writer = BatchWriter(database=':memory:', batch_size=1000, max_latency=60,
+                             after_flush=PROJECT_ORDERS_SQL)
+        migrate(writer.connection.cursor())
+        received = (None, None, 'Testy', 'SoTesty', 5, '{}')
+        item = lambda order_id, event, at, unit: (order_id, event, at, 'Dish 1', unit, None, None, None, None)
+        for values in [(1, 'received', 100) + received, item(1, 'item_started', 100, 0),
+                       (2, 'received', 101) + received]:
+            writer.write(INSERT_EVENT_SQL, values)
+        writer.flush()
+        for values in [item(1, 'item_started', 102, 1), item(2, 'item_started', 110, 0),
+                       item(1, 'item_completed', 130, 0), item(1, 'item_completed', 132, 1),
+                       (1, 'order_completed', 132) + (None,) * 6]:
+            writer.write(INSERT_EVENT_SQL, values)
+        writer.flush()
+        rows = writer.connection.execute(
+            "SELECT id, status, received_at, started_at, completed_at, change_seq FROM orders ORDER BY id;"
+        ).fetchall()
+        assert rows == [(1, 'Completed', 100, 100, 132, 8), (2, 'In Progress', 101, 110, None, 5)]
+        assert writer.connection.execute("SELECT event_seq FROM order_projection;").fetchone() == (8,)
+        writer.close()
+
+
+    def test_migrations_keep_data(self):
+        """Migrating an existing database should apply only new migrations"""
+        conn = sqlite3.connect(':memory:')
+        cur = conn.cursor()
+        assert migrate(cur, target=1) == 1
+        cur.execute("INSERT INTO orders (id, status, service, total_price) VALUES (1, 'Queued', 'SoTesty', 5);")
+        conn.commit()
+
+        assert migrate(cur) == LATEST_VERSION
+        assert schema_version(cur) == LATEST_VERSION
+        cur.execute("SELECT id, status FROM orders;")
+        assert cur.fetchall() == [(1, 'Queued')]
+        cur.execute("SELECT count(*) FROM sqlite_master WHERE type = 'index' AND name LIKE 'orders_%';")
+        assert cur.fetchone()[0] > 0
+        # nothing left to apply
+        assert migrate(cur) == LATEST_VERSION
@@ -0,0 +1,53 @@
+from unittest import (
+    mock,
+    TestCase,
+)
+
+import simpy
+
+from factories import make_order
+from order_simulator import (
+    cook_times,
+    Kitchen,
+    simulate_orders,
+)
+from sweep import run_configuration
+
+
+class TestStations(TestCase):
+
+    def test_no_stations(self):
+        """Without stations every item goes to one pool of general cooks"""
+        kitchen = Kitchen(simpy.Environment(), num_cooks=7)
+        assert list(kitchen.stations) == ['general']
+        assert kitchen.num_cooks == 7
+        assert kitchen.station_for('Dish 1') is kitchen.stations['general']
+
+
+    def test_items_wait_for_their_station(self):
+        """A busy grill holds up grilled items even with general cooks free"""
+        orders = [make_order([('Dish 1', 1)]), make_order([('Dish 1', 1)]), make_order([('Dish 2', 1)])]
+        with mock.patch.dict('order_simulator.item_stations', {'Dish 1': 'grill'}):
+            result = run_configuration({'num_cooks': 5, 'stations': {'grill': 1}}, orders)
+        assert result['num_cooks'] == 6
+        # the second grilled item waits for the first
+        assert result['p99_fulfillment_time'] == 2 * cook_times['Dish 1']
+        assert result['max_queue_length'] == 1
+        grill, general = result['station_utilization'].split()
+        # the run lasts exactly as long as the grill is busy
+        assert grill == 'grill=1.0000'
+        assert general.startswith('general=')
+
+
+    def test_station_without_cooks(self):
+        """Items routed to a station without cooks are rejected"""
+        with mock.patch.dict('order_simulator.item_stations', {'Dish 1': 'fryer'}):
+            with self.assertRaises(ValueError):
+                Kitchen(simpy.Environment(), num_cooks=5, stations={'grill': 1})
+
+
+    def test_heap_engine_has_no_stations(self):
+        """The heap engine only models one pool of cooks"""
+        with self.assertRaises(ValueError):
+            simulate_orders([make_order([('Dish 1', 1)])], realtime=False, engine='heap',
+                            stations={'grill': 1})
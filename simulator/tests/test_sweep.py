@@ -0,0 +1,47 @@
+from unittest import (
+    mock,
+    TestCase,
+)
+
+from factories import make_order
+from sweep import *
+
+class TestSweep(TestCase):
+
+    def test_percentile_nearest_rank(self):
+        """Percentiles should pick the nearest ranked value"""
+        values = list(range(1, 101))
+        assert percentile(values, 50) == 50
+        assert percentile(values, 95) == 95
+        assert percentile(values, 100) == 100
+        assert percentile([7], 99) == 7
+        assert percentile([], 50) is None
+
+
+    def test_build_grid(self):
+        """Grid should contain every combination of parameter values"""
+        grid = build_grid(num_cooks=[1, 2], speed=[10])
+        assert grid == [
+            {'num_cooks': 1, 'speed': 10},
+            {'num_cooks': 2, 'speed': 10},
+        ]
+
+
+    def test_run_configuration_is_isolated(self):
+        """A configuration should run in memory and report its stats
+
+        One cook and two single-item orders received together means the
+        second order waits for the first.
+        """
+        test_orders = [make_order(), make_order()]
+        default_writer = order_simulator.db_writer
+        with mock.patch('order_simulator.recreate_orders_table') as recreate:
+            result = run_configuration({'num_cooks': 1}, test_orders)
+            recreate.assert_not_called()
+        assert order_simulator.db_writer is default_writer
+        cook_time = order_simulator.cook_times['Dish 1']
+        assert result['orders'] == 2
+        assert result['p50_fulfillment_time'] == cook_time
+        assert result['p99_fulfillment_time'] == 2 * cook_time
+        assert result['max_queue_length'] == 1
+        assert result['cook_utilization'] == 1